@@ -1,26 +1,19 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
-from database.repositories.users import UserRepository
-from database.repositories.assignments import AssignmentRepository
+from database.repositories.stats import StatsRepository
 
 class DashboardStatsView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        users = UserRepository.list_all()
-        total_users = len(users)
-        active_users = len([u for u in users if u.get('role', '').upper() != 'ADMIN']) or total_users
-        
-        assignments = AssignmentRepository.list_all()
-        active_assignments = len([a for a in assignments if a.get('status') not in ('COMPLETED', 'CANCELLED', None)])
-
-        total_revenue = sum(a.get('budget', 0) for a in assignments)
+        # Aggregated in Postgres and cached as a snapshot (see StatsRepository)
+        stats = StatsRepository.dashboard()
 
         return Response({
-            "total_users": total_users,
-            "active_users": active_users,
-            "active_assignments": active_assignments,
-            "total_revenue": total_revenue,
+            "total_users": stats['total_users'],
+            "active_users": stats['active_users'],
+            "active_assignments": stats['active_assignments'],
+            "total_revenue": stats['total_revenue'],
             "system_health": "99.9%"
         })
@@ -1,73 +1,146 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from apps.authentication.tokens import get_user_for_token
+from apps.assignments import replay
+from apps.assignments.realtime import bind_server_loop, groups_for_user, normalize_role
+from apps.communication.notify import notification_id
+
+# Keys each event type sends to the browser
+_EVENT_KEYS = {
+    'assignment_accepted': ('assignment_id', 'writer_id'),
+    'assignment_cancelled': ('assignment_id', 'writer_id'),
+    'assignment_created': ('assignment_id', 'visibility'),
+    'direct_assignment_created': ('assignment_id', 'writer_id'),
+    'direct_assignment_accepted': ('assignment_id', 'writer_id'),
+    'direct_assignment_rejected': ('assignment_id', 'writer_id'),
+    'quote_submitted': ('assignment_id', 'writer_id'),
+    'quote_response': ('assignment_id', 'action', 'writer_id'),
+}
 
 class AssignmentConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        # We allow anyone to connect to the assignments group
-        self.room_group_name = 'assignments'
-        
-        # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        # ws/assignments/?token=<jwt> (browsers cannot set headers on a WebSocket)
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        token = (query.get('token') or [None])[0]
+        user = await database_sync_to_async(get_user_for_token)(token) if token else None
+        if not user:
+            await self.close()
+            return
+
+        # Kept for filtering events server-side
+        self.user_id = user['id']
+        self.role = normalize_role(user.get('role'))
+        self.style = (user.get('handwriting_style') or '').strip().lower()
+
+        # Reconnecting clients pass the last sequence number they saw
+        try:
+            last_seq = int((query.get('last_seq') or [''])[0])
+        except ValueError:
+            last_seq = None
+        buffer = replay.get_buffer()
+        connected_seq = await sync_to_async(buffer.current)()
+
+        # Background senders hand in-memory layer sends to this loop
+        bind_server_loop(asyncio.get_running_loop())
+
+        # Join this user's, role's and style's groups
+        self.subscriptions = groups_for_user(user)
+        for group in self.subscriptions:
+            await self.channel_layer.group_add(group, self.channel_name)
 
         await self.accept()
 
-    async def disconnect(self, close_code):
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
+        # Replay what was missed: since last_seq, or for a fresh client, since
+        # just before it joined. Live copies of replayed events are skipped.
+        self.replayed = set()
+        missed = await sync_to_async(buffer.since)(
+            self.subscriptions, last_seq if last_seq is not None else connected_seq
         )
+        if missed is None and last_seq is not None:
+            # The gap was evicted: the client has to reload
+            await self.send(text_data=json.dumps({'type': 'resync', 'seq': connected_seq}))
+            return
+        for event in missed or []:
+            handler = getattr(self, event.get('type', ''), None)
+            if handler is not None and event['type'] in _EVENT_KEYS:
+                await handler(event)
+                self.replayed.add(event['seq'])
+        await self.send(text_data=json.dumps({'type': 'connected', 'seq': connected_seq}))
+
+    async def disconnect(self, close_code):
+        # Leave every joined group
+        for group in getattr(self, 'subscriptions', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
 
     # Receive message from room group
     async def assignment_accepted(self, event):
-        assignment_id = event['assignment_id']
-        writer_id = event.get('writer_id')
-
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'assignment_accepted',
-            'assignment_id': assignment_id,
-            'writer_id': writer_id
-        }))
+        await self._forward(event)
 
     async def assignment_cancelled(self, event):
-        assignment_id = event['assignment_id']
-        writer_id = event.get('writer_id')
-
-        await self.send(text_data=json.dumps({
-            'type': 'assignment_cancelled',
-            'assignment_id': assignment_id,
-            'writer_id': writer_id
-        }))
+        await self._forward(event)
 
     async def assignment_created(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'assignment_created',
-            'assignment_id': event.get('assignment_id'),
-            'visibility': event.get('visibility'),
-            'preferredHandwritingStyles': event.get('preferredHandwritingStyles', [])
-        }))
+        await self._forward(event)
 
     async def direct_assignment_created(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'direct_assignment_created',
-            'assignment_id': event.get('assignment_id'),
-            'writer_id': event.get('writer_id')
-        }))
+        await self._forward(event)
 
     async def direct_assignment_accepted(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'direct_assignment_accepted',
-            'assignment_id': event.get('assignment_id'),
-            'writer_id': event.get('writer_id')
-        }))
+        await self._forward(event)
 
     async def direct_assignment_rejected(self, event):
+        await self._forward(event)
+
+    async def quote_submitted(self, event):
+        await self._forward(event)
+
+    async def quote_response(self, event):
+        await self._forward(event)
+
+    async def notifications_created(self, event):
+        notification = dict(event.get('notification') or {})
+        batch = event.get('batch')
+        if batch:
+            # One message covers many recipients; this user's id derives from the batch
+            if self.user_id in (event.get('skip') or ()):
+                return
+            notification.update(id=notification_id(batch, self.user_id), userId=self.user_id)
+        elif notification.get('userId') != self.user_id:
+            return
         await self.send(text_data=json.dumps({
-            'type': 'direct_assignment_rejected',
-            'assignment_id': event.get('assignment_id'),
-            'writer_id': event.get('writer_id')
+            'type': 'notification',
+            'notification': notification,
         }))
+
+    # ─── Internal Helpers ─────────────────────────────────────────────
+
+    async def _forward(self, event):
+        """Send the event's client-facing keys, unless it is of no use to this user."""
+        if event.get('seq') in getattr(self, 'replayed', ()) or not self._wants(event):
+            return
+        payload = {'type': event['type'], 'seq': event.get('seq')}
+        payload.update((key, event.get(key)) for key in _EVENT_KEYS[event['type']])
+        await self.send(text_data=json.dumps(payload))
+
+    def _wants(self, event) -> bool:
+        """Server-side copy of the filtering the browser used to do itself."""
+        kind = event.get('type')
+        is_party = self.user_id in (event.get('writer_id'), event.get('student_id'))
+
+        if kind == 'assignment_created':
+            if is_party:
+                return True
+            if self.role != 'WRITER':
+                return False
+            styles = event.get('preferredHandwritingStyles') or []
+            if event.get('visibility') == 'SELECTED_STYLES' and styles:
+                return self.style in {(s or '').strip().lower() for s in styles}
+            return True
+        if kind == 'assignment_accepted':
+            # Other writers drop the assignment from their marketplace
+            return is_party or self.role == 'WRITER'
+        return is_party
@@ -0,0 +1,247 @@
+"""
+Outbox for assignment side effects.
+
+Mutation endpoints `publish` what should follow their write (notification
+rows and socket events) and return without waiting for it. A background
+thread gathers everything published within `OUTBOX_FLUSH_MS`, coalesces
+duplicate events, inserts the notifications in chunked multi-row inserts
+(pushing each chunk to its recipients' sockets) and sends the events
+through the channel layer, numbering each one for the replay buffer
+(apps/assignments/replay.py).
+
+A chunk whose insert fails is retried row by row at once, so one bad row
+does not hold back the others. Rows and sends that still fail are
+requeued with exponential backoff, up to `OUTBOX_MAX_ATTEMPTS` times; the
+worker keeps delivering new work while they wait.
+
+Queued work lives in process memory: it survives a failing database or
+channel layer, not a crash of the process itself.
+"""
+
+import atexit
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+from database.bulk import chunked
+from database.connection import supabase
+from database.repositories.notifications import NotificationRepository
+from apps.assignments import replay
+from apps.communication import notify
+from apps.assignments.realtime import route, send_to_group
+
+FLUSH_INTERVAL = float(os.environ.get('OUTBOX_FLUSH_MS', '50')) / 1000.0
+MAX_BATCH = int(os.environ.get('OUTBOX_BATCH_SIZE', '500'))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = float(os.environ.get('OUTBOX_RETRY_BASE_MS', '200')) / 1000.0
+
+
+class Outbox:
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH,
+                 max_attempts: int = MAX_ATTEMPTS, retry_delay: float = RETRY_BASE_DELAY,
+                 name: str = 'assignment-outbox'):
+        self.flush_interval = max(0.0, flush_interval)
+        self.max_batch = max(1, max_batch)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = max(0.0, retry_delay)
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Published entries plus requeued retries not yet delivered or dropped
+        self._pending = 0
+        self._idle = threading.Condition()
+        # (due, tiebreak, kind, payload, attempt); only the worker thread touches it
+        self._retries = []
+        self._retry_ids = itertools.count()
+
+    def publish(self, events: list = (), notifications: list = ()) -> None:
+        """Queue socket events and notification rows; returns immediately."""
+        events = [e for e in events if e]
+        notifications = [n for n in notifications if n and _has_recipient(n)]
+        if not events and not notifications:
+            return
+        self._ensure_worker()
+        with self._idle:
+            self._pending += 1
+        self._queue.put((events, notifications))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until everything published so far is delivered or dropped."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    # ─── Internal Helpers ─────────────────────────────────────────────
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        """Wait for published entries, or until the next retry is due."""
+        wait = None
+        if self._retries:
+            wait = max(0.0, self._retries[0][0] - time.monotonic())
+        try:
+            batch = [self._queue.get(timeout=wait)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _due_retries(self) -> list:
+        now = time.monotonic()
+        due = []
+        while self._retries and self._retries[0][0] <= now:
+            _, _, kind, payload, attempt = heapq.heappop(self._retries)
+            due.append((kind, payload, attempt))
+        return due
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            retries = self._due_retries()
+            scheduled = 0
+            try:
+                events = _coalesce([e for entry_events, _ in batch for e in entry_events])
+                notifications = _dedupe_notifications([n for _, entry in batch for n in entry])
+                scheduled = self._deliver(events, notifications, retries)
+            except Exception as e:
+                print(f"[Outbox] Delivery crashed: {e}")
+            finally:
+                with self._idle:
+                    self._pending += scheduled - len(batch) - len(retries)
+                    self._idle.notify_all()
+
+    def _deliver(self, events: list, notifications: list, retries: list = ()) -> int:
+        """Deliver new work and due retries once. Returns the number of retries scheduled."""
+        if notifications and not supabase:
+            print(f"[Outbox] Database not connected, dropping {len(notifications)} notifications")
+            notifications = []
+        work = [('chunk', chunk, 1) for chunk in chunked(notifications)]
+        for event in events:
+            groups = route(event)
+            try:
+                # Numbered once, before any attempt, and kept for reconnecting clients
+                event = replay.get_buffer().record(event, groups)
+            except Exception as e:
+                print(f"[Outbox] Recording {event.get('type')} for replay failed: {e}")
+            work.extend(('send', (group, event), 1) for group in groups)
+        work.extend(retries)
+
+        # Chunks, rows and per-group sends are retried on their own, so a retry
+        # never repeats a delivery that already went through
+        failed = []
+        for kind, payload, attempt in work:
+            if kind == 'send':
+                group, event = payload
+                try:
+                    send_to_group(group, event)
+                except Exception as e:
+                    print(f"[Outbox] Sending {event.get('type')} to {group} failed (attempt {attempt}): {e}")
+                    failed.append((kind, payload, attempt))
+                continue
+            try:
+                NotificationRepository.bulk_create(payload)
+            except Exception as e:
+                print(f"[Outbox] Insert of {len(payload)} notifications failed (attempt {attempt}): {e}")
+                if len(payload) > 1:
+                    # Keep one bad row from sinking the rest of the chunk
+                    failed.extend(self._insert_rows(payload, attempt))
+                else:
+                    failed.append((kind, payload, attempt))
+                continue
+            # Recipients with an open socket see it without polling
+            notify.push(payload)
+        return self._schedule(failed)
+
+    def _insert_rows(self, rows: list, attempt: int) -> list:
+        """Insert rows one at a time. Returns the failures as retry work."""
+        failed = []
+        for row in rows:
+            try:
+                NotificationRepository.bulk_create([row])
+            except Exception as e:
+                print(f"[Outbox] Notification {row.get('id')} insert failed (attempt {attempt}): {e}")
+                failed.append(('chunk', [row], attempt))
+                continue
+            notify.push([row])
+        return failed
+
+    def _schedule(self, failed: list) -> int:
+        """Requeue failed work with backoff, dropping what is out of attempts."""
+        scheduled = dropped_rows = dropped_sends = 0
+        now = time.monotonic()
+        for kind, payload, attempt in failed:
+            if attempt >= self.max_attempts:
+                if kind == 'send':
+                    dropped_sends += 1
+                else:
+                    dropped_rows += len(payload)
+                continue
+            due = now + self.retry_delay * 2 ** (attempt - 1)
+            heapq.heappush(self._retries, (due, next(self._retry_ids), kind, payload, attempt + 1))
+            scheduled += 1
+        if dropped_rows or dropped_sends:
+            print(f"[Outbox] Giving up on {dropped_rows} notifications and {dropped_sends} event sends")
+        return scheduled
+
+
+def _has_recipient(notification: dict) -> bool:
+    if notification.get('userId'):
+        return True
+    print(f"[Outbox] Dropping notification without a recipient: {notification.get('title')!r}")
+    return False
+
+
+def _coalesce(events: list) -> list:
+    """Drop repeated identical events (e.g. a double-submitted request), keeping order."""
+    seen = {}
+    for event in events:
+        key = tuple(sorted((k, repr(v)) for k, v in event.items()))
+        seen.setdefault(key, event)
+    return list(seen.values())
+
+
+def _dedupe_notifications(notifications: list) -> list:
+    by_id = {}
+    for notification in notifications:
+        by_id.setdefault(notification.get('id') or id(notification), notification)
+    return list(by_id.values())
+
+
+_outbox = Outbox()
+
+
+def publish(events: list = (), notifications: list = ()) -> None:
+    """Queue events / notifications on the process-wide outbox."""
+    _outbox.publish(events, notifications)
+
+
+def flush(timeout: float = None) -> bool:
+    return _outbox.flush(timeout)
+
+
+# Best effort: deliver what is queued when the worker process shuts down
+atexit.register(flush, 5.0)
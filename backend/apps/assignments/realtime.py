@@ -0,0 +1,119 @@
+"""
+Real-time assignment events over the channel layer.
+
+Sockets join a per-user group, a per-role group and, for writers, a
+per-handwriting-style group (see `groups_for_user`). `route` picks only
+the groups that can use an event, so the fan-out cost of an event
+follows its audience rather than the number of open sockets.
+
+Routes are chosen so a socket is in at most one of an event's groups and
+never receives the same event twice.
+
+Sends come from background threads (the outbox, bulk notifications). The
+in-memory channel layer is not thread-safe, so for it `send_to_group` runs
+the send on the server's event loop, which consumers register on connect.
+"""
+
+import asyncio
+import re
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+
+# Channels group names: ASCII letters, digits, '-', '_' and '.', under 100 chars
+_UNSAFE_CHARS = re.compile(r'[^a-zA-Z0-9_.-]')
+SEND_TIMEOUT_SECONDS = 5.0
+
+# Event loop the consumers of this process run on (see bind_server_loop)
+_server_loop = None
+
+
+def user_group(user_id: str) -> str:
+    return f"user.{_safe(user_id)}"
+
+
+def role_group(role: str) -> str:
+    return f"role.{_safe(normalize_role(role))}"
+
+
+def style_group(style: str) -> str:
+    return f"style.{_safe((style or '').strip().lower())}"
+
+
+def normalize_role(role: str) -> str:
+    """Upper-case role, with the legacy 'provider' folded into WRITER."""
+    role = (role or '').upper()
+    return 'WRITER' if role in ('WRITER', 'PROVIDER') else role
+
+
+def groups_for_user(user: dict) -> list[str]:
+    """Groups a connected user's socket subscribes to."""
+    groups = [user_group(user['id'])]
+    role = normalize_role(user.get('role'))
+    if role:
+        groups.append(role_group(role))
+    if role == 'WRITER' and user.get('handwriting_style'):
+        groups.append(style_group(user['handwriting_style']))
+    return groups
+
+
+def route(event: dict) -> list[str]:
+    """Groups an event is delivered to."""
+    kind = event.get('type')
+    writer_id = event.get('writer_id')
+    student_id = event.get('student_id')
+
+    if kind == 'assignment_created':
+        styles = event.get('preferredHandwritingStyles') or []
+        if event.get('visibility') == 'SELECTED_STYLES' and styles:
+            targets = [style_group(s) for s in styles]
+        else:
+            targets = [role_group('WRITER')]
+        targets.append(user_group(student_id) if student_id else None)
+    elif kind == 'assignment_accepted':
+        # Every writer drops it from their marketplace
+        targets = [role_group('WRITER'), user_group(student_id) if student_id else None]
+    else:
+        # direct_assignment_*, assignment_cancelled, quote_*: the two parties only
+        targets = [user_group(writer_id) if writer_id else None,
+                   user_group(student_id) if student_id else None]
+    return list(dict.fromkeys(t for t in targets if t))
+
+
+def bind_server_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """Record the event loop consumers run on; called from AssignmentConsumer.connect."""
+    global _server_loop
+    _server_loop = loop
+
+
+def send_to_group(group: str, message: dict) -> None:
+    """
+    Send a message to a group from a synchronous thread. Raises if the channel layer fails.
+    Views do not call this directly; they publish through apps/assignments/outbox.py.
+    """
+    channel_layer = get_channel_layer()
+    if not channel_layer:
+        return
+    if not isinstance(channel_layer, InMemoryChannelLayer):
+        # Process-shared layers (Redis) are safe to use from any thread's loop
+        async_to_sync(channel_layer.group_send)(group, message)
+        return
+    loop = _server_loop
+    if loop is None or loop.is_closed():
+        # No socket has connected to this process, so nobody can receive it
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        # Already on the server loop: waiting here would deadlock it
+        loop.create_task(channel_layer.group_send(group, message))
+        return
+    future = asyncio.run_coroutine_threadsafe(channel_layer.group_send(group, message), loop)
+    future.result(timeout=SEND_TIMEOUT_SECONDS)
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _safe(value) -> str:
+    return _UNSAFE_CHARS.sub('_', str(value))[:90]
@@ -0,0 +1,185 @@
+"""
+Replay buffer for assignment socket events.
+
+The outbox gives every event a sequence number and keeps it in a bounded
+ring buffer for each group it is sent to (`REPLAY_BUFFER_SIZE` events per
+group). A client reconnecting with `?last_seq=N` is sent the events after
+N from its groups' buffers instead of reloading every assignment; if a
+buffer has already evicted events after N, the client is told to resync.
+
+Sequence numbers come from one counter shared by all groups, so a client
+tracks a single `last_seq` and skipped numbers belong to other groups.
+With CHANNEL_REDIS_URL set, the counter and buffers live in Redis (on the
+first URL when the channel layer is sharded) and are shared by every
+worker; otherwise they live in this process.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from django.conf import settings
+
+BUFFER_SIZE = int(os.environ.get('REPLAY_BUFFER_SIZE', '200'))
+# Groups with buffers kept in memory; the least recently used are dropped
+MAX_GROUPS = int(os.environ.get('REPLAY_MAX_GROUPS', '10000'))
+# Idle buffers expire from Redis after this long
+BUFFER_TTL = int(os.environ.get('REPLAY_TTL_SECONDS', '86400'))
+
+
+class MemoryReplayBuffer:
+    """Per-process buffers; sequence numbers start from the clock so they grow across restarts."""
+
+    def __init__(self, size: int = BUFFER_SIZE, max_groups: int = MAX_GROUPS):
+        self.size = max(1, size)
+        self.max_groups = max(1, max_groups)
+        self._lock = threading.Lock()
+        # Anything at or below the starting number predates this process
+        self._floor = self._seq = time.time_ns() // 1000
+        self._buffers = OrderedDict()   # group -> deque of (seq, event)
+        self._evicted = {}              # group -> newest seq evicted from its buffer
+        self._dropped_through = 0       # newest seq in any buffer dropped as a whole
+
+    def current(self) -> int:
+        return self._seq
+
+    def record(self, event: dict, groups: list) -> dict:
+        """Number the event and store it under each group. Returns the numbered event."""
+        with self._lock:
+            self._seq += 1
+            event = {**event, 'seq': self._seq}
+            for group in groups:
+                buffer = self._buffers.get(group)
+                if buffer is None:
+                    buffer = self._buffers[group] = deque()
+                    self._trim_groups()
+                self._buffers.move_to_end(group)
+                if len(buffer) >= self.size:
+                    self._evicted[group] = buffer.popleft()[0]
+                buffer.append((self._seq, event))
+        return event
+
+    def since(self, groups: list, last_seq: int) -> list | None:
+        """Events after `last_seq` in `groups`, oldest first; None if some were evicted."""
+        with self._lock:
+            if last_seq > self._seq or last_seq < self._floor:
+                return None
+            events = {}
+            for group in groups:
+                buffer = self._buffers.get(group)
+                if buffer is None:
+                    if last_seq < self._dropped_through:
+                        return None
+                    continue
+                if self._evicted.get(group, 0) > last_seq:
+                    return None
+                events.update((seq, event) for seq, event in buffer if seq > last_seq)
+        return [events[seq] for seq in sorted(events)]
+
+    def _trim_groups(self) -> None:
+        while len(self._buffers) > self.max_groups:
+            group, buffer = self._buffers.popitem(last=False)
+            self._evicted.pop(group, None)
+            if buffer:
+                self._dropped_through = max(self._dropped_through, buffer[-1][0])
+
+
+# Number one event and append it to each group's buffer, in one atomic
+# step: no worker can observe seq N+1 while N is still being stored.
+# Like the memory buffer, numbers follow the clock (microseconds, never
+# repeating), so a `last_seq` older than any surviving meta hash is detected.
+# KEYS: the counter, then (buffer, meta) per group. ARGV: the event JSON,
+# buffer size, buffer TTL, meta TTL. Entries are "<seq>|<json>". The meta
+# hash keeps the newest evicted seq and the newest pushed seq, and outlives
+# the buffer so an expired buffer is detected.
+_RECORD_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local now = redis.call('TIME')
+local seq = math.max(tonumber(redis.call('GET', KEYS[1]) or '0') + 1,
+                     tonumber(now[1]) * 1000000 + tonumber(now[2]))
+local seq_text = string.format('%d', seq)
+redis.call('SET', KEYS[1], seq_text)
+local entry = seq_text .. '|' .. ARGV[1]
+for i = 2, #KEYS, 2 do
+  local n = redis.call('RPUSH', KEYS[i], entry)
+  if n > tonumber(ARGV[2]) then
+    local old = redis.call('LPOP', KEYS[i])
+    redis.call('HSET', KEYS[i + 1], 'evicted', string.match(old, '^(%d+)|'))
+  end
+  redis.call('HSET', KEYS[i + 1], 'head', seq_text)
+  redis.call('EXPIRE', KEYS[i], ARGV[3])
+  redis.call('EXPIRE', KEYS[i + 1], ARGV[4])
+end
+return seq_text
+"""
+
+
+class RedisReplayBuffer:
+    """
+    Buffers in Redis (or a Redis-compatible server), shared by every worker.
+    The counter and all buffers live on one server (the first channel layer
+    URL) so numbering and storing an event is a single script.
+    """
+
+    def __init__(self, url: str, size: int = BUFFER_SIZE, ttl: int = BUFFER_TTL):
+        import redis
+        self.size = max(1, size)
+        self.ttl = ttl
+        # Meta hashes outlive their buffer, then expire too
+        self.meta_ttl = ttl * 2
+        self._client = redis.Redis.from_url(url)
+        self._record = self._client.register_script(_RECORD_SCRIPT)
+
+    def current(self) -> int:
+        return int(self._client.get('replay:seq') or 0)
+
+    def record(self, event: dict, groups: list) -> dict:
+        keys = ['replay:seq']
+        for group in groups:
+            keys += [f'replay:{group}', f'replay:{group}:meta']
+        # The seq is kept in the entry prefix, not the JSON, and added back on read
+        seq = self._record(keys=keys, args=[json.dumps(event), self.size, self.ttl, self.meta_ttl])
+        return {**event, 'seq': int(seq)}
+
+    def since(self, groups: list, last_seq: int) -> list | None:
+        pipe = self._client.pipeline(transaction=False)
+        pipe.get('replay:seq')
+        pipe.time()
+        for group in groups:
+            pipe.lrange(f'replay:{group}', 0, -1)
+            pipe.hmget(f'replay:{group}:meta', 'evicted', 'head')
+        current, (seconds, micros), *results = pipe.execute()
+        if last_seq > int(current or 0):
+            # Counter was reset (e.g. Redis flushed): numbers no longer line up
+            return None
+        if last_seq < (seconds - self.meta_ttl) * 1_000_000 + micros:
+            # Older than any meta hash left to vouch for the gap
+            return None
+        events = {}
+        for entries, (evicted, head) in zip(results[::2], results[1::2]):
+            if int(evicted or 0) > last_seq:
+                return None
+            if not entries and int(head or 0) > last_seq:
+                # Buffer expired with events the client has not seen
+                return None
+            for entry in entries:
+                seq, payload = entry.decode().split('|', 1)
+                if int(seq) > last_seq:
+                    events[int(seq)] = {**json.loads(payload), 'seq': int(seq)}
+        return [events[seq] for seq in sorted(events)]
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The process-wide replay buffer, backed by Redis when the channel layer is."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                urls = getattr(settings, 'CHANNEL_REDIS_URLS', None)
+                _buffer = RedisReplayBuffer(urls[0]) if urls else MemoryReplayBuffer()
+    return _buffer
@@ -1,2 +1,300 @@
+import asyncio
+import importlib
+import json
+import threading
+from unittest import mock
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+from channels.layers import InMemoryChannelLayer
+from apps.assignments import outbox
+from apps.assignments.consumers import AssignmentConsumer
+from apps.assignments.outbox import Outbox
+from apps.assignments.replay import MemoryReplayBuffer
+from apps.assignments.views import AssignmentViewSet
 
-# Create your tests here.
+
+class AssignmentListPaginationTests(SimpleTestCase):
+
+    def _list(self, query: str):
+        view = AssignmentViewSet.as_view({'get': 'list'})
+        with mock.patch('apps.assignments.views.AssignmentRepository.list_visible',
+                        return_value=([], None)) as list_visible:
+            response = view(APIRequestFactory().get(f'/api/assignments/{query}'))
+        return response, list_visible
+
+    def test_limit_is_capped_at_200(self):
+        response, list_visible = self._list('?limit=1000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list_visible.call_args.kwargs['limit'], 200)
+        self.assertEqual(response.data, {'results': [], 'next_cursor': None})
+
+    def test_cursor_without_limit_uses_default_page_size(self):
+        _, list_visible = self._list('?cursor=abc')
+        self.assertEqual(list_visible.call_args.kwargs['limit'], 50)
+        self.assertEqual(list_visible.call_args.kwargs['cursor'], 'abc')
+
+    def test_invalid_limit_is_rejected(self):
+        for limit in ('0', '-5', 'ten'):
+            with self.subTest(limit=limit):
+                response, list_visible = self._list(f'?limit={limit}')
+                self.assertEqual(response.status_code, 400)
+                list_visible.assert_not_called()
+
+    def test_no_limit_returns_a_plain_list(self):
+        response, list_visible = self._list('')
+        self.assertIsNone(list_visible.call_args.kwargs['limit'])
+        self.assertEqual(response.data, [])
+
+
+class _Recorder:
+    """Stands in for the outbox's database and channel layer; `fail` decides what raises."""
+
+    def __init__(self, fail=None):
+        self.fail = fail or (lambda kind, payload, calls: False)
+        self.inserts = []
+        self.inserted = []
+        self.sends = []
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def bulk_create(self, rows):
+        with self.lock:
+            self.inserts.append([row['id'] for row in rows])
+            if self.fail('insert', rows, len(self.inserts)):
+                raise RuntimeError("insert failed")
+            self.inserted.extend(row['id'] for row in rows)
+
+    def send_to_group(self, group, event):
+        with self.lock:
+            self.sends.append((group, event['type']))
+            if self.fail('send', (group, event), len(self.sends)):
+                raise RuntimeError("send failed")
+            self.sent.append((group, event['type']))
+
+
+class _Buffer:
+    def record(self, event, groups):
+        return event
+
+
+class OutboxTests(SimpleTestCase):
+
+    def _outbox(self, recorder, **kwargs):
+        for target, value in (
+            ('supabase', True),
+            ('NotificationRepository.bulk_create', recorder.bulk_create),
+            ('send_to_group', recorder.send_to_group),
+            ('route', lambda event: [f"user.{event['writer_id']}"]),
+            ('notify.push', lambda rows: None),
+            ('replay.get_buffer', lambda: _Buffer()),
+        ):
+            patcher = mock.patch(f'apps.assignments.outbox.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        options = dict(flush_interval=0.02, retry_delay=0.01, max_attempts=3)
+        options.update(kwargs)
+        return Outbox(**options)
+
+    @staticmethod
+    def _notification(row_id):
+        return {'id': row_id, 'userId': f'user-{row_id}', 'title': 'Hello'}
+
+    def test_flush_drains_everything_published(self):
+        recorder = _Recorder()
+        box = self._outbox(recorder)
+        for i in range(20):
+            box.publish(events=[{'type': 'assignment_created', 'writer_id': i}],
+                        notifications=[self._notification(f'n{i}')])
+        self.assertTrue(box.flush(timeout=5))
+        self.assertEqual(sorted(recorder.inserted), sorted(f'n{i}' for i in range(20)))
+        self.assertEqual(len(recorder.sent), 20)
+        self.assertEqual(box._pending, 0)
+
+    def test_duplicates_in_one_window_are_coalesced(self):
+        recorder = _Recorder()
+        box = self._outbox(recorder, flush_interval=0.2)
+        event = {'type': 'assignment_accepted', 'assignment_id': 'a1', 'writer_id': 'w1'}
+        box.publish(events=[event], notifications=[self._notification('n1')])
+        box.publish(events=[dict(event)], notifications=[self._notification('n1')])
+        self.assertTrue(box.flush(timeout=5))
+        self.assertEqual(recorder.sent, [('user.w1', 'assignment_accepted')])
+        self.assertEqual(recorder.inserted, ['n1'])
+
+    def test_notifications_without_recipient_are_dropped(self):
+        recorder = _Recorder()
+        box = self._outbox(recorder)
+        box.publish(notifications=[{'id': 'n1', 'title': 'nobody'}])
+        self.assertTrue(box.flush(timeout=1))
+        self.assertEqual(recorder.inserts, [])
+
+    def test_failed_insert_is_retried_until_it_succeeds(self):
+        recorder = _Recorder(fail=lambda kind, payload, calls: kind == 'insert' and calls <= 2)
+        box = self._outbox(recorder)
+        box.publish(notifications=[self._notification('n1')])
+        self.assertTrue(box.flush(timeout=5))
+        self.assertEqual(recorder.inserts, [['n1'], ['n1'], ['n1']])
+        self.assertEqual(recorder.inserted, ['n1'])
+        self.assertEqual(box._pending, 0)
+
+    def test_one_bad_row_does_not_hold_back_its_chunk(self):
+        bad = lambda kind, rows, calls: kind == 'insert' and any(r['id'] == 'bad' for r in rows)
+        recorder = _Recorder(fail=bad)
+        box = self._outbox(recorder)
+        box.publish(notifications=[self._notification(i) for i in ('a', 'bad', 'b')])
+        self.assertTrue(box.flush(timeout=5))
+        self.assertEqual(recorder.inserted, ['a', 'b'])
+        # The whole chunk once, each row once, then the bad row's two retries
+        self.assertEqual(recorder.inserts, [['a', 'bad', 'b'], ['a'], ['bad'], ['b'], ['bad'], ['bad']])
+
+    def test_work_is_dropped_after_max_attempts(self):
+        recorder = _Recorder(fail=lambda kind, payload, calls: True)
+        box = self._outbox(recorder, max_attempts=4)
+        box.publish(events=[{'type': 'assignment_created', 'writer_id': 'w1'}],
+                    notifications=[self._notification('n1')])
+        self.assertTrue(box.flush(timeout=5))
+        self.assertEqual(recorder.inserts, [['n1']] * 4)
+        self.assertEqual(len(recorder.sends), 4)
+        self.assertEqual(recorder.inserted, [])
+        self.assertEqual(box._pending, 0)
+
+    def test_new_work_is_delivered_while_a_retry_waits(self):
+        recorder = _Recorder(fail=lambda kind, rows, calls: kind == 'insert' and rows[0]['id'] == 'slow')
+        box = self._outbox(recorder, retry_delay=0.5, max_attempts=2)
+        box.publish(notifications=[self._notification('slow')])
+        self.assertFalse(box.flush(timeout=0.1))
+        self.assertEqual(recorder.inserts, [['slow']])
+        # Published after the first attempt failed, while its retry is waiting
+        box.publish(notifications=[self._notification('fast')])
+        self.assertFalse(box.flush(timeout=0.2))
+        self.assertEqual(recorder.inserted, ['fast'])
+        self.assertTrue(box.flush(timeout=5))
+        self.assertEqual(recorder.inserts, [['slow'], ['fast'], ['slow']])
+
+    def test_module_flush_is_registered_for_shutdown(self):
+        with mock.patch('atexit.register') as register:
+            importlib.reload(outbox)
+        register.assert_called_once_with(outbox.flush, 5.0)
+
+
+class MemoryReplayBufferTests(SimpleTestCase):
+
+    def test_since_returns_events_after_last_seq(self):
+        buffer = MemoryReplayBuffer(size=10)
+        start = buffer.current()
+        seqs = [buffer.record({'type': 'e', 'n': n}, ['g'])['seq'] for n in range(4)]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual([e['n'] for e in buffer.since(['g'], seqs[1])], [2, 3])
+        self.assertEqual([e['n'] for e in buffer.since(['g'], start)], [0, 1, 2, 3])
+        self.assertEqual(buffer.since(['g'], seqs[-1]), [])
+
+    def test_ring_eviction_asks_for_resync_only_past_the_gap(self):
+        buffer = MemoryReplayBuffer(size=3)
+        seqs = [buffer.record({'type': 'e', 'n': n}, ['g'])['seq'] for n in range(5)]
+        # seqs[0] and seqs[1] were evicted: a client that saw seqs[1] misses nothing
+        self.assertEqual([e['n'] for e in buffer.since(['g'], seqs[1])], [2, 3, 4])
+        self.assertIsNone(buffer.since(['g'], seqs[0]))
+
+    def test_events_across_groups_are_merged_in_order_once(self):
+        buffer = MemoryReplayBuffer(size=10)
+        start = buffer.current()
+        buffer.record({'type': 'e', 'n': 0}, ['role.WRITER'])
+        buffer.record({'type': 'e', 'n': 1}, ['user.w1', 'role.WRITER'])
+        buffer.record({'type': 'e', 'n': 2}, ['user.w1'])
+        buffer.record({'type': 'e', 'n': 3}, ['user.w2'])
+        buffer.record({'type': 'e', 'n': 4}, ['role.WRITER'])
+        events = buffer.since(['user.w1', 'role.WRITER'], start)
+        self.assertEqual([e['n'] for e in events], [0, 1, 2, 4])
+
+    def test_numbers_outside_this_buffer_ask_for_resync(self):
+        buffer = MemoryReplayBuffer(size=10)
+        event = buffer.record({'type': 'e'}, ['g'])
+        # From before this process started, or from a counter it never issued
+        self.assertIsNone(buffer.since(['g'], buffer._floor - 1))
+        self.assertIsNone(buffer.since(['g'], event['seq'] + 1))
+
+    def test_dropped_group_asks_for_resync(self):
+        buffer = MemoryReplayBuffer(size=10, max_groups=2)
+        start = buffer.current()
+        buffer.record({'type': 'e'}, ['a'])
+        buffer.record({'type': 'e'}, ['b'])
+        latest = buffer.record({'type': 'e'}, ['c'])['seq']
+        # 'a' was dropped with an event the client has not seen
+        self.assertIsNone(buffer.since(['a'], start))
+        self.assertEqual(buffer.since(['a'], latest), [])
+
+
+class _Socket(AssignmentConsumer):
+    """The consumer with the websocket replaced by a list of sent messages."""
+
+    def __init__(self, query: str, layer):
+        super().__init__()
+        self.scope = {'type': 'websocket', 'query_string': query.encode()}
+        self.channel_layer = layer
+        self.channel_name = 'test.channel'
+        self.sent = []
+        self.closed = False
+
+    async def accept(self, subprotocol=None, headers=None):
+        pass
+
+    async def close(self, code=None, reason=None):
+        self.closed = True
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.sent.append(json.loads(text_data))
+
+
+class ConsumerReplayTests(SimpleTestCase):
+    writer = {'id': 'w1', 'role': 'WRITER', 'handwriting_style': 'Neat'}
+
+    def setUp(self):
+        self.buffer = MemoryReplayBuffer(size=3)
+        for target, value in (
+            ('replay.get_buffer', lambda: self.buffer),
+            ('get_user_for_token', lambda token: self.writer if token == 'good' else None),
+        ):
+            patcher = mock.patch(f'apps.assignments.consumers.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _connect(self, query: str) -> _Socket:
+        socket = _Socket(query, InMemoryChannelLayer())
+        asyncio.run(socket.connect())
+        return socket
+
+    def _record(self, n: int, group: str = 'user.w1') -> int:
+        event = {'type': 'quote_response', 'assignment_id': f'a{n}', 'action': 'ACCEPT', 'writer_id': 'w1'}
+        return self.buffer.record(event, [group])['seq']
+
+    def test_missed_events_are_replayed_before_connected(self):
+        last_seq = self._record(0)
+        self._record(1)
+        self._record(2, group='role.WRITER')
+        socket = self._connect(f'token=good&last_seq={last_seq}')
+        self.assertEqual([m['type'] for m in socket.sent], ['quote_response', 'quote_response', 'connected'])
+        self.assertEqual([m.get('assignment_id') for m in socket.sent[:2]], ['a1', 'a2'])
+
+    def test_evicted_gap_sends_resync(self):
+        last_seq = self._record(0)
+        for n in range(1, 5):
+            self._record(n)
+        socket = self._connect(f'token=good&last_seq={last_seq}')
+        self.assertEqual(socket.sent, [{'type': 'resync', 'seq': self.buffer.current()}])
+
+    def test_replayed_event_is_not_forwarded_again_live(self):
+        last_seq = self._record(0)
+        self._record(1)
+        socket = self._connect(f'token=good&last_seq={last_seq}')
+        replayed = self.buffer.since(['user.w1'], last_seq)[0]
+        asyncio.run(socket.quote_response(replayed))
+        self.assertEqual([m['type'] for m in socket.sent], ['quote_response', 'connected'])
+
+    def test_fresh_client_gets_no_replay(self):
+        self._record(0)
+        socket = self._connect('token=good')
+        self.assertEqual(socket.sent, [{'type': 'connected', 'seq': self.buffer.current()}])
+
+    def test_unauthenticated_socket_is_closed(self):
+        socket = self._connect('token=bad')
+        self.assertTrue(socket.closed)
+        self.assertEqual(socket.sent, [])
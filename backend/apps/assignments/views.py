@@ -2,8 +2,8 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from database.repositories.assignments import AssignmentRepository
-from database.repositories.notifications import NotificationRepository
 from database.repositories.users import UserRepository
+from apps.assignments import outbox
 import uuid
 import datetime
 
@@ -16,39 +16,47 @@ class AssignmentViewSet(viewsets.ViewSet):
 
     def list(self, request):
         try:
-            # Get all assignments
-            all_assignments = AssignmentRepository.list_all()
-            
-            results = []
             user_id = request.query_params.get('userId')
             
             # Fetch user to check role and handwriting_style
             current_user = None
             if user_id:
-                current_user = UserRepository.get_by_id(user_id)
-
-            for data in all_assignments:
-                # Ensure the ID is present
-                if 'id' not in data:
-                    continue
-                    
-                # Security: Filter direct assignments
-                if data.get('assignmentType') == 'DIRECT':
-                    if not user_id or (data.get('assignedWriterId') != user_id and data.get('studentId') != user_id):
-                        continue
-                        
-                # Security: Filter handwriting styles for WRITERS
-                if current_user and current_user.get('role') == 'WRITER' and data.get('assignmentType') != 'DIRECT':
-                    visibility = data.get('visibility', 'ALL_WRITERS')
-                    if visibility == 'SELECTED_STYLES':
-                        preferred_styles = data.get('preferredHandwritingStyles', [])
-                        writer_style = current_user.get('handwriting_style')
-                        if not writer_style or writer_style not in preferred_styles:
-                            continue
-
-                results.append(data)
-            
+                current_user = UserRepository.get_by_id(user_id, fields=['role', 'handwriting_style'])
+
+            # Optional keyset pagination: ?limit=N&cursor=<next_cursor>
+            limit = request.query_params.get('limit')
+            cursor = request.query_params.get('cursor')
+            try:
+                limit = min(int(limit), 200) if limit else None
+                if limit is not None and limit < 1:
+                    raise ValueError
+            except ValueError:
+                return Response({'error': 'limit must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+            if cursor and not limit:
+                limit = 50
+
+            # Optional ?fields=id,title,status to return only what the caller renders
+            requested = request.query_params.get('fields')
+            fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else None
+
+            # Security filters (DIRECT / SELECTED_STYLES) are applied by the database
+            try:
+                results, next_cursor = AssignmentRepository.list_visible(
+                    user_id=user_id,
+                    role=current_user.get('role') if current_user else None,
+                    writer_style=current_user.get('handwriting_style') if current_user else None,
+                    assignment_type=request.query_params.get('type'),
+                    status=request.query_params.get('status'),
+                    limit=limit,
+                    cursor=cursor,
+                    fields=fields,
+                )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
             # Already sorted by created_at desc from repository
+            if limit:
+                return Response({'results': results, 'next_cursor': next_cursor})
             return Response(results)
         except Exception as e:
             print(f"Error fetching assignments: {e}")
@@ -67,6 +75,9 @@ class AssignmentViewSet(viewsets.ViewSet):
             # Ensure id is in the document data
             data['id'] = assignment_id
             
+            # Sent by the outbox once the assignment is saved
+            notifications, events = [], []
+
             # Handle Direct Hire Assignment Request
             if data.get('assignedWriterId'):
                 data['assignmentType'] = 'DIRECT'
@@ -74,7 +85,7 @@ class AssignmentViewSet(viewsets.ViewSet):
                 # Generate Notification for the specific writer
                 writer_id = data['assignedWriterId']
                 notification_id = str(uuid.uuid4())
-                NotificationRepository.create({
+                notifications.append({
                     'id': notification_id,
                     'userId': writer_id,
                     'type': 'DIRECT_ASSIGNMENT_REQUEST',
@@ -85,39 +96,28 @@ class AssignmentViewSet(viewsets.ViewSet):
                     'timestamp': data['createdAt']
                 })
                 # Broadcast the event
-                from asgiref.sync import async_to_sync
-                from channels.layers import get_channel_layer
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    async_to_sync(channel_layer.group_send)(
-                        'assignments',
-                        {
-                            'type': 'direct_assignment_created',
-                            'assignment_id': assignment_id,
-                            'writer_id': writer_id
-                        }
-                    )
+                events.append({
+                    'type': 'direct_assignment_created',
+                    'assignment_id': assignment_id,
+                    'writer_id': writer_id,
+                    'student_id': data.get('studentId'),
+                })
             else:
                 # General assignment creation broadcast
                 if not data.get('assignmentType'):
                     data['assignmentType'] = 'MARKETPLACE'
-                    
-                from asgiref.sync import async_to_sync
-                from channels.layers import get_channel_layer
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    async_to_sync(channel_layer.group_send)(
-                        'assignments',
-                        {
-                            'type': 'assignment_created',
-                            'assignment_id': assignment_id,
-                            'visibility': data.get('visibility', 'ALL_WRITERS'),
-                            'preferredHandwritingStyles': data.get('preferredHandwritingStyles', [])
-                        }
-                    )
+
+                events.append({
+                    'type': 'assignment_created',
+                    'assignment_id': assignment_id,
+                    'visibility': data.get('visibility', 'ALL_WRITERS'),
+                    'preferredHandwritingStyles': data.get('preferredHandwritingStyles', []),
+                    'student_id': data.get('studentId'),
+                })
             
             # Save to Supabase
             created = AssignmentRepository.create(data)
+            outbox.publish(events, notifications)
             
             return Response(created, status=status.HTTP_201_CREATED)
         except Exception as e:
@@ -170,9 +170,10 @@ class AssignmentViewSet(viewsets.ViewSet):
                 })
                 
                 # Create Notification
+                notifications = []
                 if writer_id:
                     notif_id = f"notif-{uuid.uuid4().hex[:12]}"
-                    NotificationRepository.create({
+                    notifications.append({
                         'id': notif_id,
                         'userId': writer_id,
                         'type': 'ASSIGNMENT_CANCELLED',
@@ -186,21 +187,12 @@ class AssignmentViewSet(viewsets.ViewSet):
                     })
                 
                 # Broadcast via channels
-                try:
-                    from channels.layers import get_channel_layer
-                    from asgiref.sync import async_to_sync
-                    channel_layer = get_channel_layer()
-                    if channel_layer:
-                        async_to_sync(channel_layer.group_send)(
-                            'assignments',
-                            {
-                                'type': 'assignment_cancelled',
-                                'assignment_id': pk,
-                                'writer_id': writer_id
-                            }
-                        )
-                except Exception:
-                    pass
+                outbox.publish([{
+                    'type': 'assignment_cancelled',
+                    'assignment_id': pk,
+                    'writer_id': writer_id,
+                    'student_id': student_id,
+                }], notifications)
                 return Response({'status': 'CANCELLED'}, status=status.HTTP_200_OK)
                 
             else:
@@ -241,9 +233,10 @@ class AssignmentViewSet(viewsets.ViewSet):
 
             # Notify the student about the received quote
             student_id = assignment.get('studentId')
+            notifications = []
             if student_id:
                 notification_id = str(uuid.uuid4())
-                NotificationRepository.create({
+                notifications.append({
                     'id': notification_id,
                     'userId': student_id,
                     'type': 'QUOTE_RECEIVED',
@@ -255,21 +248,12 @@ class AssignmentViewSet(viewsets.ViewSet):
                 })
 
             # Broadcast via channels
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    async_to_sync(channel_layer.group_send)(
-                        'assignments',
-                        {
-                            'type': 'quote_submitted',
-                            'assignment_id': pk,
-                            'writer_id': writer_id
-                        }
-                    )
-            except Exception:
-                pass
+            outbox.publish([{
+                'type': 'quote_submitted',
+                'assignment_id': pk,
+                'writer_id': writer_id,
+                'student_id': student_id,
+            }], notifications)
 
             updated = AssignmentRepository.get_by_id(pk)
             return Response(updated)
@@ -288,6 +272,7 @@ class AssignmentViewSet(viewsets.ViewSet):
                 return Response({'error': 'Assignment not found'}, status=status.HTTP_404_NOT_FOUND)
 
             quoting_writer_id = assignment.get('quotingWriterId')
+            notifications = []
 
             if action_type == 'ACCEPT':
                 # NOW assign the writer and update budget
@@ -302,7 +287,7 @@ class AssignmentViewSet(viewsets.ViewSet):
                 # Notify writer: quote accepted
                 if quoting_writer_id:
                     notification_id = str(uuid.uuid4())
-                    NotificationRepository.create({
+                    notifications.append({
                         'id': notification_id,
                         'userId': quoting_writer_id,
                         'type': 'QUOTE_ACCEPTED',
@@ -325,7 +310,7 @@ class AssignmentViewSet(viewsets.ViewSet):
                 # Notify writer: quote rejected
                 if quoting_writer_id:
                     notification_id = str(uuid.uuid4())
-                    NotificationRepository.create({
+                    notifications.append({
                         'id': notification_id,
                         'userId': quoting_writer_id,
                         'type': 'QUOTE_REJECTED',
@@ -339,22 +324,13 @@ class AssignmentViewSet(viewsets.ViewSet):
                 return Response({'error': 'Invalid action. Must be ACCEPT or REJECT.'}, status=status.HTTP_400_BAD_REQUEST)
 
             # Broadcast via channels
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    async_to_sync(channel_layer.group_send)(
-                        'assignments',
-                        {
-                            'type': 'quote_response',
-                            'assignment_id': pk,
-                            'action': action_type,
-                            'writer_id': quoting_writer_id
-                        }
-                    )
-            except Exception:
-                pass
+            outbox.publish([{
+                'type': 'quote_response',
+                'assignment_id': pk,
+                'action': action_type,
+                'writer_id': quoting_writer_id,
+                'student_id': assignment.get('studentId'),
+            }], notifications)
 
             updated = AssignmentRepository.get_by_id(pk)
             return Response(updated)
@@ -388,7 +364,7 @@ class AssignmentViewSet(viewsets.ViewSet):
             student_id = assignment.get('studentId')
             if student_id:
                 notification_id = str(uuid.uuid4())
-                NotificationRepository.create({
+                outbox.publish(notifications=[{
                     'id': notification_id,
                     'userId': student_id,
                     'type': 'QUOTE_WITHDRAWN',
@@ -397,7 +373,7 @@ class AssignmentViewSet(viewsets.ViewSet):
                     'assignmentId': pk,
                     'isRead': False,
                     'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat()
-                })
+                }])
 
             updated = AssignmentRepository.get_by_id(pk)
             return Response(updated)
@@ -414,30 +390,19 @@ class AssignmentViewSet(viewsets.ViewSet):
             if not writer_id:
                 return Response({'error': 'writerId is required'}, status=status.HTTP_400_BAD_REQUEST)
                 
-            success, error_msg = AssignmentRepository.atomic_accept(pk, writer_id)
+            updated, error_msg = AssignmentRepository.atomic_accept(pk, writer_id)
             
-            if not success:
+            if not updated:
                 return Response({'message': error_msg}, status=status.HTTP_409_CONFLICT)
                 
             # Broadcast via channels
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    async_to_sync(channel_layer.group_send)(
-                        'assignments',
-                        {
-                            'type': 'assignment_accepted',
-                            'assignment_id': pk,
-                            'writer_id': writer_id
-                        }
-                    )
-            except Exception:
-                pass
+            outbox.publish([{
+                'type': 'assignment_accepted',
+                'assignment_id': pk,
+                'writer_id': writer_id,
+                'student_id': updated.get('studentId'),
+            }])
             
-            # Get updated doc to return
-            updated = AssignmentRepository.get_by_id(pk)
             return Response(updated, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -465,46 +430,26 @@ class AssignmentViewSet(viewsets.ViewSet):
                     'status': 'ACCEPTED',
                     'writerId': writer_id
                 })
-                # Broadcast
-                try:
-                    from channels.layers import get_channel_layer
-                    from asgiref.sync import async_to_sync
-                    channel_layer = get_channel_layer()
-                    if channel_layer:
-                        async_to_sync(channel_layer.group_send)(
-                            'assignments',
-                            {
-                                'type': 'direct_assignment_accepted',
-                                'assignment_id': pk,
-                                'writer_id': writer_id
-                            }
-                        )
-                except Exception:
-                    pass
+                event = {
+                    'type': 'direct_assignment_accepted',
+                    'assignment_id': pk,
+                    'writer_id': writer_id,
+                    'student_id': student_id,
+                }
             else:
                 AssignmentRepository.update(pk, {
                     'status': 'REJECTED'
                 })
-                # Broadcast
-                try:
-                    from channels.layers import get_channel_layer
-                    from asgiref.sync import async_to_sync
-                    channel_layer = get_channel_layer()
-                    if channel_layer:
-                        async_to_sync(channel_layer.group_send)(
-                            'assignments',
-                            {
-                                'type': 'direct_assignment_rejected',
-                                'assignment_id': pk,
-                                'writer_id': writer_id
-                            }
-                        )
-                except Exception:
-                    pass
+                event = {
+                    'type': 'direct_assignment_rejected',
+                    'assignment_id': pk,
+                    'writer_id': writer_id,
+                    'student_id': student_id,
+                }
             
-            # Add notification for student
+            # Broadcast, and add notification for student
             notification_id = str(uuid.uuid4())
-            NotificationRepository.create({
+            outbox.publish([event], [{
                 'id': notification_id,
                 'userId': student_id,
                 'type': 'DIRECT_RESPONSE',
@@ -513,7 +458,7 @@ class AssignmentViewSet(viewsets.ViewSet):
                 'assignmentId': pk,
                 'isRead': False,
                 'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat()
-            })
+            }])
             
             updated = AssignmentRepository.get_by_id(pk)
             return Response(updated, status=status.HTTP_200_OK)
@@ -0,0 +1,72 @@
+"""
+Shared JWT identity helpers.
+
+Views call `get_user_from_token(request)` instead of decoding the token and
+hitting `UserRepository.get_by_id` themselves. The resolved user is memoized
+on the request, and lookups go through the process-level user cache in
+`UserRepository.get_cached`.
+
+That cache can lag a role change made by another worker, so admin checks
+use `get_admin_from_token`, which always reads the current row.
+"""
+
+import jwt
+from django.conf import settings
+from database.repositories.users import UserRepository
+
+_MEMO_ATTR = '_paperly_auth_user'
+
+
+def get_token_payload(request) -> dict | None:
+    """Decode the `Bearer <token>` / `Token <token>` header. Returns None if absent or invalid."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return None
+    try:
+        token = auth_header.split(' ')[1]
+    except IndexError:
+        return None
+    return decode_token(token)
+
+
+def decode_token(token: str) -> dict | None:
+    """Decode a raw JWT. Returns None if it is invalid or expired."""
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+    except Exception as e:
+        print(f"Token Error: {e}")
+        return None
+
+
+def get_user_for_token(token: str) -> dict | None:
+    """Resolve the user a raw JWT belongs to (for WebSockets, which have no request)."""
+    payload = decode_token(token) if token else None
+    if payload and payload.get('user_id'):
+        return UserRepository.get_cached(payload['user_id'])
+    return None
+
+
+def get_user_from_token(request) -> dict | None:
+    """Resolve the authenticated user for this request (memoized per request)."""
+    # DRF's Request wraps Django's HttpRequest; memoize on the underlying one
+    # so middleware and views share the same result.
+    holder = getattr(request, '_request', request)
+    if hasattr(holder, _MEMO_ATTR):
+        return getattr(holder, _MEMO_ATTR)
+
+    user = None
+    payload = get_token_payload(request)
+    if payload and payload.get('user_id'):
+        user = UserRepository.get_cached(payload['user_id'])
+
+    setattr(holder, _MEMO_ATTR, user)
+    return user
+
+
+def get_admin_from_token(request) -> dict | None:
+    """The requesting user if they are currently an ADMIN, read fresh from the database."""
+    payload = get_token_payload(request)
+    if not payload or not payload.get('user_id'):
+        return None
+    user = UserRepository.get_by_id(payload['user_id'])
+    return user if user and user.get('role') == 'ADMIN' else None
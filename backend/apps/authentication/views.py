@@ -4,6 +4,9 @@ from rest_framework import status
 from django.conf import settings
 from database.repositories.users import UserRepository
 from database.repositories.password_resets import PasswordResetRepository
+from database.repositories.writers import WriterDirectory, WriterRecord
+from apps.authentication.tokens import get_user_from_token
+from utils.geo import haversine_km, parse_coordinates
 from passlib.hash import pbkdf2_sha256
 import uuid
 import datetime
@@ -160,20 +163,7 @@ class UserDetailsView(APIView):
     permission_classes = []
 
     def get_user_from_token(self, request):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return None
-        
-        try:
-            # "Bearer <token>" or "Token <token>"
-            token = auth_header.split(' ')[1]
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            
-            return UserRepository.get_by_id(user_id)
-        except Exception as e:
-            print("Token Error:", e)
-            return None
+        return get_user_from_token(request)
 
     def get(self, request):
         user = self.get_user_from_token(request)
@@ -332,17 +322,14 @@ class PasswordResetVerifyView(APIView):
         
         return Response({'message': 'Password reset successfully!'})
 
-# Helper for distance
-import math
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371 # km
-    dLat = math.radians(lat2 - lat1)
-    dLon = math.radians(lon2 - lon1)
-    a = math.sin(dLat/2) * math.sin(dLat/2) + \
-        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
-        math.sin(dLon/2) * math.sin(dLon/2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+# Columns the user/writer cards render (never the password hash)
+USER_LIST_FIELDS = [
+    'id', 'email', 'name', 'username', 'role', 'avatar', 'address', 'is_verified',
+    'handwriting_style', 'handwriting_confidence', 'availability_status',
+    'handwriting_samples', 'qr_code_url', 'price_per_page', 'auth_provider',
+    'is_custom_profile_picture', 'coordinates',
+]
+MAX_NEARBY_LIMIT = 200
 
 class UserListView(APIView):
     authentication_classes = []
@@ -350,52 +337,122 @@ class UserListView(APIView):
 
     def get(self, request):
         role = request.query_params.get('role')
-        lat = request.query_params.get('lat')
-        lon = request.query_params.get('lon')
-        
-        users = UserRepository.list_all(role=role)
-            
+        origin = parse_coordinates({'lat': request.query_params.get('lat'),
+                                    'lon': request.query_params.get('lon')})
+
+        # Optional ?fields=id,name,avatar to shrink the response further
+        requested = request.query_params.get('fields')
+        wanted = {f.strip() for f in requested.split(',') if f.strip()} if requested else None
+        fields = USER_LIST_FIELDS
+        if wanted:
+            # name falls back to username; coordinates feed distance_km
+            needed = wanted | {'id', 'username', 'coordinates'}
+            fields = [f for f in USER_LIST_FIELDS if f in needed]
+
+        # Nearest-writer search: ?lat=&lon=&limit=N and/or &radius_km=R
+        try:
+            limit = request.query_params.get('limit')
+            limit = min(int(limit), MAX_NEARBY_LIMIT) if limit else None
+            radius_km = request.query_params.get('radius_km')
+            radius_km = float(radius_km) if radius_km else None
+            if (limit is not None and limit < 1) or (radius_km is not None and radius_km <= 0):
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'limit and radius_km must be positive numbers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Optional ?style=Cursive / ?availability=ONLINE filters (case-insensitive)
+        style = request.query_params.get('style') or None
+        availability = request.query_params.get('availability') or None
+
+        distances = {}
+        from_directory = (role or '').lower() in ('writer', 'provider')
+        if from_directory:
+            # Writers come from the in-memory directory: no query per request
+            if origin and (limit or radius_km):
+                matches = WriterDirectory.nearby(origin[0], origin[1], limit=limit, radius_km=radius_km,
+                                                 style=style, availability=availability)
+                users = [record for record, _ in matches]
+                distances = {record.id: km for record, km in matches}
+            else:
+                users = WriterDirectory.query(style=style, availability=availability)
+                if origin:
+                    distances = _distances_from(origin, users)
+        elif origin and (limit or radius_km):
+            # Spatial index picks the candidates; only those rows are fetched
+            matches = UserRepository.nearby(origin[0], origin[1], role=role,
+                                            limit=limit, radius_km=radius_km)
+            found = UserRepository.get_many([user_id for user_id, _ in matches], fields=fields)
+            users = [found[user_id] for user_id, _ in matches if user_id in found]
+            distances = dict(matches)
+        else:
+            users = UserRepository.list_all(role=role, fields=fields)
+            if origin:
+                distances = _distances_from(origin, users)
+
+        if not from_directory:
+            if style:
+                users = [u for u in users if (u.get('handwriting_style') or '').lower() == style.lower()]
+            if availability:
+                users = [u for u in users
+                         if (u.get('availability_status') or '').lower() == availability.lower()]
+
         results = []
         for u in users:
-            user_data = {
-                'id': u.get('id'),
-                'email': u.get('email'),
-                'name': u.get('name') or u.get('username'),
-                'first_name': None,
-                'last_name': None,
-                'username': u.get('username'),
-                'role': u.get('role'),
-                'avatar': u.get('avatar'),
-                'address': u.get('address'),
-                'is_verified': u.get('is_verified', False),
-                'handwriting_style': u.get('handwriting_style'),
-                'handwriting_confidence': u.get('handwriting_confidence'),
-                'availability_status': u.get('availability_status', 'ONLINE'),
-                'handwriting_samples': u.get('handwriting_samples', []),
-                'qr_code_url': u.get('qr_code_url'),
-                'price_per_page': u.get('price_per_page'),
-                'auth_provider': u.get('auth_provider'),
-                'is_custom_profile_picture': u.get('is_custom_profile_picture', False),
-            }
-            
-            # Calculate distance if coords provided
-            if lat and lon and u.get('coordinates'):
-                try:
-                    u_lat = u['coordinates']['lat']
-                    u_lon = u['coordinates']['lon']
-                    dist = calculate_distance(float(lat), float(lon), float(u_lat), float(u_lon))
-                    user_data['distance_km'] = round(dist, 1)
-                except:
-                    pass
-            
+            if isinstance(u, WriterRecord):
+                # Rendered once per directory record; records are replaced when they change
+                if u.card is None:
+                    u.card = _user_card(u)
+                user_data = u.card
+            else:
+                user_data = _user_card(u)
+
+            if u.get('id') in distances:
+                user_data = {**user_data, 'distance_km': round(distances[u.get('id')], 1)}
+
+            if wanted:
+                user_data = {k: v for k, v in user_data.items() if k in wanted or k == 'distance_km'}
+
             results.append(user_data)
             
-        if lat and lon:
-            # Sort by distance
+        if origin:
+            # Sort by distance (nearby() results are already in order)
             results.sort(key=lambda x: x.get('distance_km', float('inf')))
 
         return Response(results)
 
+def _user_card(u) -> dict:
+    """The card shape UserListView returns, from a user dict or WriterRecord."""
+    return {
+        'id': u.get('id'),
+        'email': u.get('email'),
+        'name': u.get('name') or u.get('username'),
+        'first_name': None,
+        'last_name': None,
+        'username': u.get('username'),
+        'role': u.get('role'),
+        'avatar': u.get('avatar'),
+        'address': u.get('address'),
+        'is_verified': u.get('is_verified', False),
+        'handwriting_style': u.get('handwriting_style'),
+        'handwriting_confidence': u.get('handwriting_confidence'),
+        'availability_status': u.get('availability_status', 'ONLINE'),
+        'handwriting_samples': u.get('handwriting_samples', []),
+        'qr_code_url': u.get('qr_code_url'),
+        'price_per_page': u.get('price_per_page'),
+        'auth_provider': u.get('auth_provider'),
+        'is_custom_profile_picture': u.get('is_custom_profile_picture', False),
+    }
+
+def _distances_from(origin, users) -> dict:
+    """{user id: km from origin} for every user with coordinates, in one vectorized pass."""
+    located = [(u.get('id'), parse_coordinates(u.get('coordinates'))) for u in users]
+    located = [(user_id, c) for user_id, c in located if c]
+    if not located:
+        return {}
+    km = haversine_km(origin[0], origin[1], [c[0] for _, c in located], [c[1] for _, c in located])
+    return {user_id: d for (user_id, _), d in zip(located, km.tolist())}
+
 class UserManagementView(APIView):
     def delete(self, request, user_id):
         # Prevent self deletion by checking the token
@@ -648,7 +705,7 @@ class SetPasswordView(APIView):
                     payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
                     user_id = payload.get('user_id')
                     if user_id:
-                        user = UserRepository.get_by_id(user_id)
+                        user = UserRepository.get_cached(user_id)
                 except Exception as e:
                     print("JWT decode error in SetPasswordView:", e)
                     # Try unverified decode to extract user_id / email if SECRET_KEY changed
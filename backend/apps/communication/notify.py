@@ -0,0 +1,167 @@
+"""
+Bulk notification pipeline.
+
+`notify_many` sends one notification to many users: an explicit set of
+ids, or an audience query (a role, writers of a handwriting style, or
+everyone). Rows are written in chunked multi-row inserts, and after each
+chunk the recipients' open sockets get it live through the channel layer.
+
+Every notification in one fan-out shares a batch id, and each recipient's
+notification id is derived from it (`notification_id`). Role audiences,
+and everyone, are read from the users table, so each role group's members
+are exactly the recipients: those groups get a single send, once every
+chunk is written, carrying only the shared content and the batch id, and
+each consumer rebuilds its own user's id. Explicit ids and style audiences
+(served from the writer directory, which may lag) are sent per user.
+
+`notify_many_async` runs the same pipeline on a small background pool, so
+endpoints like announcement creation return immediately.
+"""
+
+import datetime
+import os
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from database.bulk import chunked
+from database.repositories.notifications import NotificationRepository
+from database.repositories.users import UserRepository
+from database.repositories.writers import WriterDirectory
+from apps.assignments.realtime import normalize_role, role_group, send_to_group, user_group
+
+MAX_WORKERS = int(os.environ.get('NOTIFY_WORKERS', '2'))
+# Failed recipients a group send may list in `skip`; beyond this, send per user
+MAX_SKIP = int(os.environ.get('NOTIFY_MAX_SKIP', '200'))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='notify')
+
+
+def notify_many(template: dict, recipient_ids: list = None, role: str = None,
+                style: str = None, batch_size: int = None) -> int:
+    """
+    Create `template` (title, message, type, ...) as a notification for every
+    recipient and push it to their sockets.
+    Recipients: `recipient_ids` if given, else users with `role` (writers of
+    `style` if that is given too), else everyone.
+    Returns the number of notifications created.
+    """
+    recipients = _resolve(recipient_ids, role, style)
+    if not recipients:
+        return 0
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    batch = str(uuid.uuid4())
+
+    created = 0
+    failed = []
+    grouped = []
+    for chunk in chunked(recipients, batch_size):
+        rows = [{
+            **template,
+            'id': notification_id(batch, user_id),
+            'userId': user_id,
+            'isRead': False,
+            'timestamp': template.get('timestamp') or timestamp,
+        } for user_id, _ in chunk]
+        try:
+            NotificationRepository.bulk_create(rows)
+        except Exception as e:
+            print(f"[Notify] Insert of {len(rows)} notifications failed: {e}")
+            failed.extend(user_id for user_id, _ in chunk)
+            continue
+        created += len(rows)
+        # Users addressed one by one get theirs now; role groups wait for the last chunk
+        direct = []
+        for row, (user_id, group) in zip(rows, chunk):
+            if group == user_group(user_id):
+                direct.append(row)
+            else:
+                grouped.append((row, group))
+        push(direct, batch=batch)
+
+    if len(failed) > MAX_SKIP:
+        # Too many to list in one message
+        push([row for row, _ in grouped], batch=batch)
+    elif grouped:
+        shared = dict((group, row) for row, group in grouped)
+        push(list(shared.values()), groups=list(shared), batch=batch, skip=failed)
+    return created
+
+
+def notification_id(batch: str, user_id: str) -> str:
+    """Id of `user_id`'s notification in a fan-out batch."""
+    return str(uuid.uuid5(uuid.UUID(batch), str(user_id)))
+
+
+def check_audience(role: str = None, style: str = None) -> None:
+    """Raise ValueError for an audience `notify_many` cannot target."""
+    if style and role and normalize_role(role) != 'WRITER':
+        raise ValueError("style can only be combined with the WRITER role")
+
+
+def notify_many_async(template: dict, recipient_ids: list = None, role: str = None,
+                      style: str = None) -> Future:
+    """Run `notify_many` in the background. The future resolves to the number created."""
+    return _executor.submit(_run, template, recipient_ids, role, style)
+
+
+def push(notifications: list, groups: list = None, batch: str = None, skip: list = None) -> None:
+    """
+    Send created notifications to their recipients' sockets. `groups` gives
+    each notification's group (default: the recipient's own user group).
+    With a `batch` id, ids are derived per recipient, so only the shared
+    content is sent, once per group; members listed in `skip` ignore it.
+    Without one, each notification is sent whole.
+    """
+    if not notifications:
+        return
+    if groups is None:
+        groups = [user_group(n['userId']) for n in notifications]
+    sends = {}
+    for notification, group in zip(notifications, groups):
+        if batch is None:
+            sends[(group, notification['id'])] = (group, notification)
+        else:
+            shared = _shared_fields(notification)
+            sends.setdefault((group, repr(sorted(shared.items()))), (group, shared))
+
+    for group, content in sends.values():
+        message = {'type': 'notifications_created', 'notification': content}
+        if batch is not None:
+            message['batch'] = batch
+            if skip:
+                message['skip'] = list(skip)
+        try:
+            send_to_group(group, message)
+        except Exception as e:
+            print(f"[Notify] Push to {group} failed: {e}")
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _run(template, recipient_ids, role, style) -> int:
+    try:
+        return notify_many(template, recipient_ids, role, style)
+    except Exception as e:
+        print(f"[Notify] Background fan-out failed: {e}")
+        return 0
+
+
+def _resolve(recipient_ids, role, style) -> list[tuple]:
+    """[(user_id, socket group)] for the audience, one entry per user."""
+    if recipient_ids:
+        ids = dict.fromkeys(i for i in recipient_ids if i)
+        return [(user_id, user_group(user_id)) for user_id in ids]
+
+    check_audience(role, style)
+    role = normalize_role(role) if role else None
+    if style:
+        # Served from the in-memory writer directory, which may lag the
+        # table, so these get per-user sends
+        return [(w.id, user_group(w.id)) for w in WriterDirectory.query(style=style)]
+    # Role group members are exactly the users read here
+    users = UserRepository.list_all(role=role, fields=['id', 'role'], mock_fallback=False)
+    return [(u['id'], role_group(u['role']) if u.get('role') else user_group(u['id']))
+            for u in users if u.get('id')]
+
+
+def _shared_fields(notification: dict) -> dict:
+    return {k: v for k, v in notification.items() if k not in ('id', 'userId')}
@@ -4,6 +4,8 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from database.repositories.messages import MessageRepository
 from database.repositories.announcements import AnnouncementRepository
+from apps.authentication.tokens import get_admin_from_token
+from apps.communication.notify import check_audience, notify_many_async
 
 class MessageViewSet(viewsets.ViewSet):
     """
@@ -53,13 +55,37 @@ class AnnouncementViewSet(viewsets.ViewSet):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def create(self, request):
+        # Announcements fan out to every user, so only admins may post them
+        if not get_admin_from_token(request):
+            return Response({'error': 'Forbidden - Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
         try:
             data = request.data.copy() if hasattr(request.data, 'copy') else dict(request.data)
             ann_id = str(uuid.uuid4())
             data['id'] = ann_id
             data['createdAt'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+            # Optional audience: recipientIds, or role (and style for writers); default everyone
+            recipient_ids = data.pop('recipientIds', None)
+            role = data.pop('role', None)
+            style = data.pop('style', None)
+            if recipient_ids is not None and not isinstance(recipient_ids, list):
+                return Response({'error': 'recipientIds must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                check_audience(role, style)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
             created = AnnouncementRepository.create(data)
+
+            # Notify the audience in the background; the announcement is already saved
+            notify_many_async({
+                'type': 'ANNOUNCEMENT',
+                'title': data.get('title', 'Announcement'),
+                'message': data.get('content', ''),
+                'timestamp': data['createdAt'],
+            }, recipient_ids=recipient_ids, role=role, style=style)
+
             return Response(created, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,87 @@
+"""
+Micro-batching for handwriting inference.
+
+Concurrent callers submit single items; a background thread gathers them
+for up to `max_wait` seconds (or until `max_batch` items are waiting),
+runs one batch call, and hands each caller its own result.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Shared knobs: largest batch, and how long the first item may wait for company
+DEFAULT_MAX_BATCH = int(os.environ.get('HANDWRITING_BATCH_SIZE', '16'))
+DEFAULT_MAX_WAIT = float(os.environ.get('HANDWRITING_BATCH_WAIT_MS', '5')) / 1000.0
+# How long a blocking call waits for its result before giving up
+DEFAULT_TIMEOUT = float(os.environ.get('HANDWRITING_BATCH_TIMEOUT', '30'))
+
+
+class MicroBatcher:
+
+    def __init__(self, batch_fn, max_batch: int = DEFAULT_MAX_BATCH,
+                 max_wait: float = DEFAULT_MAX_WAIT, name: str = 'batcher'):
+        """
+        batch_fn: callable taking a list of items and returning a list of
+        results in the same order.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        """Queue an item; the returned future resolves to its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout: float = DEFAULT_TIMEOUT):
+        """Submit an item and block until its result is ready (TimeoutError after `timeout`)."""
+        return self.submit(item).result(timeout=timeout)
+
+    # ─── Internal Helpers ─────────────────────────────────────────────
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.batch_fn(items))
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch of {len(batch)} items "
+                                       f"returned {len(results)} results")
+            except Exception as e:
+                # Never leave a caller waiting on a future nobody will resolve
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
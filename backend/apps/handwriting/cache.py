@@ -0,0 +1,104 @@
+"""
+Content-hash cache for handwriting style predictions.
+
+Results are keyed by a SHA-256 of the decoded pixel data, so re-uploading
+the same image (even re-encoded with different metadata) skips the model.
+Two tiers: an in-memory LRU, and a SQLite file that survives restarts and
+is shared by every worker on the host.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+from utils.cache import TTLCache
+
+CACHE_DIR = Path(os.environ.get(
+    'HANDWRITING_CACHE_DIR',
+    Path(__file__).resolve().parent.parent.parent / 'handwriting_cache',
+))
+CACHE_DB_PATH = CACHE_DIR / 'predictions.sqlite3'
+
+_memory = TTLCache(maxsize=int(os.environ.get('HANDWRITING_CACHE_SIZE', '2048')), ttl=None)
+_schema_ready = False
+
+
+def image_hash(img) -> str:
+    """SHA-256 over a decoded RGB image's size and pixels (metadata-independent)."""
+    digest = hashlib.sha256()
+    digest.update(f"{img.size[0]}x{img.size[1]}".encode('ascii'))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def get(key: str, model_version: str):
+    """Return (style, confidence) if cached for this model version, else None."""
+    if not key:
+        return None
+    entry = _memory.get(key)
+    if entry is None:
+        entry = _disk_get(key)
+        if entry is not None:
+            _memory.set(key, entry)
+    if entry is None or entry[2] != model_version:
+        return None
+    return entry[0], entry[1]
+
+
+def put(key: str, style: str, confidence: float, model_version: str) -> None:
+    if not key or style is None:
+        return
+    entry = (style, confidence, model_version)
+    _memory.set(key, entry)
+    _disk_put(key, entry)
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _connect():
+    global _schema_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=5)
+    if not _schema_ready:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " key TEXT PRIMARY KEY, style TEXT NOT NULL, confidence REAL,"
+            " model_version TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.commit()
+        _schema_ready = True
+    return conn
+
+
+def _disk_get(key: str):
+    try:
+        if not CACHE_DB_PATH.exists():
+            return None
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT style, confidence, model_version FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return tuple(row) if row else None
+    except Exception as e:
+        print(f"[HandwritingCache] Disk read failed: {e}")
+        return None
+
+
+def _disk_put(key: str, entry: tuple) -> None:
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO predictions (key, style, confidence, model_version, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, entry[0], entry[1], entry[2], time.time()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[HandwritingCache] Disk write failed: {e}")
@@ -0,0 +1,165 @@
+"""
+Local CNN inference for handwriting style.
+
+Loads the model trained by `train_cnn.py` once per process. A TFLite
+export (`handwriting_model.tflite`, written by `train_cnn.py`) is
+preferred when present because it is much faster on CPU; otherwise the
+Keras `.h5` model is used. Concurrent predictions are micro-batched into
+a single forward pass.
+
+By default (`HANDWRITING_USE_CNN=auto`) the model is only used when
+`train_cnn.py` has written a manifest for it (`handwriting_model.manifest.json`)
+whose checksum matches the model file, so the untrained placeholder from
+`create_model.py` never replaces the heuristics or Gemini.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from .batching import MicroBatcher
+
+CLASSES = ['Neat', 'Cursive', 'Bold', 'Mixed']
+IMG_HEIGHT, IMG_WIDTH = 128, 128
+
+MODEL_PATH = Path(os.environ.get(
+    'HANDWRITING_MODEL_PATH',
+    Path(__file__).resolve().parent.parent.parent / 'handwriting_model.h5',
+))
+TFLITE_PATH = MODEL_PATH.with_suffix('.tflite')
+MANIFEST_PATH = MODEL_PATH.with_suffix('.manifest.json')
+# 'auto': only a model trained by train_cnn.py; 'true': any model file; 'false': never
+CNN_MODE = os.environ.get('HANDWRITING_USE_CNN', 'auto').lower()
+CNN_ENABLED = CNN_MODE not in ('false', '0', 'no')
+CNN_REQUIRE_MANIFEST = CNN_MODE not in ('true', '1', 'yes')
+
+_engine = None
+_engine_failed = False
+_engine_lock = threading.Lock()
+
+
+class _KerasEngine:
+    def __init__(self, path: Path):
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(path, compile=False)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.model(batch, training=False).numpy()
+
+
+class _TFLiteEngine:
+    def __init__(self, path: Path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=str(path))
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = None
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        # Only ever called from the batcher thread, so the interpreter is not shared
+        if batch.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch.shape[0]
+        self.interpreter.set_tensor(self.input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+
+def get_engine():
+    """Load the inference engine once. Returns None if no model can be loaded."""
+    global _engine, _engine_failed
+    if _engine is not None or _engine_failed or not CNN_ENABLED:
+        return _engine
+    with _engine_lock:
+        if _engine is None and not _engine_failed:
+            try:
+                source = TFLITE_PATH if TFLITE_PATH.exists() else MODEL_PATH
+                digest = _set_version(source)
+                if CNN_REQUIRE_MANIFEST and not _is_trained(source, digest):
+                    _engine_failed = True
+                    print(f"[Handwriting] CNN disabled: {source.name} has no training manifest "
+                          f"(run train_cnn.py, or set HANDWRITING_USE_CNN=True)")
+                    return None
+                if source == TFLITE_PATH:
+                    _engine = _TFLiteEngine(TFLITE_PATH)
+                else:
+                    _engine = _KerasEngine(MODEL_PATH)
+                print(f"[Handwriting] CNN model loaded from {source.name}")
+            except Exception as e:
+                _engine_failed = True
+                print(f"[Handwriting] CNN model unavailable: {e}")
+    return _engine
+
+
+def model_version() -> str | None:
+    """Identifier of the loaded model file, used to tag cached predictions."""
+    if get_engine() is None:
+        return None
+    return _version
+
+
+def preprocess(image) -> np.ndarray:
+    """(128, 128) grayscale uint8 array from a PreparedImage; scaling happens per batch."""
+    # flow_from_directory resizes with nearest-neighbour; match it
+    img = image.gray_resized((IMG_WIDTH, IMG_HEIGHT), Image.NEAREST)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def predict_batch(arrays: list) -> list:
+    """Scale a list of preprocessed images in one pass and run one forward pass."""
+    engine = get_engine()
+    batch = (np.stack(arrays).astype(np.float32) / 255.0)[..., np.newaxis]
+    probs = engine.predict(batch)
+    results = []
+    for row in probs:
+        idx = int(np.argmax(row))
+        results.append((CLASSES[idx], float(row[idx])))
+    return results
+
+
+_batcher = MicroBatcher(predict_batch, name='handwriting-cnn')
+
+
+def predict_with_cnn(image):
+    """
+    Classify with the local CNN.
+    Returns: (style, confidence) or (None, None) if the model is unavailable.
+    """
+    if get_engine() is None:
+        return None, None
+    try:
+        style, confidence = _batcher(preprocess(image))
+        print(f"[Handwriting] CNN classified as: {style} (confidence: {confidence:.2f})")
+        return style, confidence
+    except Exception as e:
+        print(f"[Handwriting] CNN analysis failed: {e}")
+        return None, None
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+_version = None
+
+
+def _set_version(path: Path) -> str:
+    global _version
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    _version = f"cnn-{digest[:12]}"
+    return digest
+
+
+def _is_trained(path: Path, digest: str) -> bool:
+    """True if train_cnn.py's manifest lists this exact model file."""
+    try:
+        manifest = json.loads(MANIFEST_PATH.read_text())
+    except (OSError, ValueError):
+        return False
+    return manifest.get('files', {}).get(path.name) == digest
@@ -0,0 +1,243 @@
+"""
+Background handwriting analysis jobs.
+
+`PredictHandwritingView` can hand an upload to this module instead of
+classifying it on the request thread. Jobs run on a small, bounded worker
+pool; their status is kept in a SQLite table next to the prediction cache
+so any worker process on the host can answer a status poll.
+
+Each job row records the process running it. The pool lives in memory, so
+when that process is gone (a restart or a crash) its queued and running
+jobs are marked failed: on this process's first submission, and when a
+poll finds such a job.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.storage import FileSystemStorage
+from database.repositories.users import UserRepository
+from .cache import CACHE_DIR
+from .utils import predict_handwriting_style
+
+MAX_WORKERS = int(os.environ.get('HANDWRITING_JOB_WORKERS', '2'))
+MAX_PENDING = int(os.environ.get('HANDWRITING_JOB_QUEUE', '64'))
+JOB_TTL_SECONDS = 24 * 60 * 60
+JOBS_DB_PATH = CACHE_DIR / 'jobs.sqlite3'
+ORPHANED_ERROR = 'Interrupted by a server restart, please upload again'
+# Identifies this process in job rows even if a later process reuses its pid
+_OWNER_TOKEN = uuid.uuid4().hex
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='handwriting-job')
+# Queued + running jobs; submissions beyond this are rejected instead of piling up
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+_schema_ready = False
+_orphans_checked = False
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity."""
+
+
+def save_prediction(user_id: str, style: str, confidence: float, file_url: str) -> None:
+    """Store a classification result and its sample on the writer's profile."""
+    UserRepository.update(user_id, {
+        'handwriting_style': style,
+        'handwriting_confidence': confidence,
+        'handwriting_sample_url': file_url,
+    })
+    UserRepository.append_to_array(user_id, 'handwriting_samples', file_url)
+
+
+def submit(user_id: str, filename: str) -> str:
+    """Queue classification of an already-saved upload. Returns the job id."""
+    _check_orphans_once()
+    if not _pending.acquire(blocking=False):
+        raise QueueFullError("Handwriting analysis queue is full")
+    job_id = str(uuid.uuid4())
+    try:
+        _insert_job(job_id, user_id)
+        _executor.submit(_run, job_id, user_id, filename)
+    except Exception:
+        _pending.release()
+        raise
+    return job_id
+
+
+def get(job_id: str) -> dict | None:
+    """Fetch a job's current state."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT id, user_id, status, result, error, created_at, updated_at, owner_pid, owner_token"
+            " FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    status, error = row[2], row[4]
+    if status in ('queued', 'running') and not _owner_alive(row[7], row[8]):
+        # The process running it is gone; it will never finish
+        status, error = 'failed', ORPHANED_ERROR
+        _set_status(job_id, status, error=error)
+    return {
+        'job_id': row[0],
+        'user_id': row[1],
+        'status': status,
+        'result': json.loads(row[3]) if row[3] else None,
+        'error': error,
+        'created_at': row[5],
+        'updated_at': row[6],
+    }
+
+
+def fail_orphaned_jobs() -> int:
+    """Mark queued/running jobs whose process is gone as failed. Returns how many."""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT DISTINCT owner_pid, owner_token FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()
+        failed = 0
+        for pid, token in rows:
+            if _owner_alive(pid, token):
+                continue
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ?"
+                " WHERE status IN ('queued', 'running') AND owner_token IS ?",
+                (ORPHANED_ERROR, time.time(), token),
+            )
+            failed += cursor.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if failed:
+        print(f"[HandwritingJobs] Marked {failed} interrupted jobs as failed")
+    return failed
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _check_orphans_once() -> None:
+    # Lazily, so importing this module never touches the jobs database
+    global _orphans_checked
+    if _orphans_checked:
+        return
+    _orphans_checked = True
+    try:
+        fail_orphaned_jobs()
+    except Exception as e:
+        print(f"[HandwritingJobs] Could not check for interrupted jobs: {e}")
+
+
+def _run(job_id: str, user_id: str, filename: str) -> None:
+    fs = FileSystemStorage()
+    saved = False
+    try:
+        _set_status(job_id, 'running')
+        with fs.open(filename, 'rb') as image_file:
+            style, confidence = predict_handwriting_style(image_file)
+
+        if style is None:
+            fs.delete(filename)
+            _set_status(job_id, 'failed', error='Prediction failed')
+            return
+
+        file_url = fs.url(filename)
+        save_prediction(user_id, style, confidence, file_url)
+        saved = True
+        _set_status(job_id, 'done', result={
+            'style': style,
+            'confidence': confidence,
+            'sample_url': file_url,
+        })
+    except Exception as e:
+        print(f"[HandwritingJobs] Job {job_id} failed: {e}")
+        if not saved:
+            # Nothing references the upload yet
+            _delete_quietly(fs, filename)
+        _set_status(job_id, 'failed', error=str(e))
+    finally:
+        _pending.release()
+
+
+def _delete_quietly(fs, filename: str) -> None:
+    try:
+        fs.delete(filename)
+    except Exception as e:
+        print(f"[HandwritingJobs] Could not delete {filename}: {e}")
+
+
+def _owner_alive(pid, token) -> bool:
+    if token == _OWNER_TOKEN:
+        return True
+    if pid is None or pid == os.getpid():
+        # Written before jobs recorded their process, or by an earlier
+        # process that had this pid
+        return False
+    if os.name == 'nt':
+        # os.kill would terminate the process there; assume it is alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+def _connect():
+    global _schema_ready
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=5)
+    if not _schema_ready:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT NOT NULL,"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " owner_pid INTEGER, owner_token TEXT)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (('owner_pid', 'INTEGER'), ('owner_token', 'TEXT')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        conn.commit()
+        _schema_ready = True
+    return conn
+
+
+def _insert_job(job_id: str, user_id: str) -> None:
+    now = time.time()
+    conn = _connect()
+    try:
+        # Opportunistically drop finished jobs nobody polled for a day
+        conn.execute("DELETE FROM jobs WHERE created_at < ?", (now - JOB_TTL_SECONDS,))
+        conn.execute(
+            "INSERT INTO jobs (id, user_id, status, created_at, updated_at, owner_pid, owner_token)"
+            " VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, user_id, now, now, os.getpid(), _OWNER_TOKEN),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _set_status(job_id: str, status: str, result: dict = None, error: str = None) -> None:
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
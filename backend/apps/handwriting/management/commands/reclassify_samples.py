@@ -0,0 +1,194 @@
+"""
+Re-score every writer's stored handwriting samples.
+
+    python manage.py reclassify_samples [--workers N] [--batch-size N] [--dry-run] [--restart]
+
+Writers are classified in a process pool, `--batch-size` writers per task,
+with all of a task's samples going through the local classifier in one
+batch. Results are written back with UserRepository.bulk_update after
+each task, and finished writer ids are recorded in a checkpoint file, so
+an interrupted run (Ctrl+C, deploy, crash) resumes where it stopped. A
+task whose results are not all written stops the run with an error; its
+writers are not checkpointed. The
+checkpoint is tied to the classifier version: after retraining, the next
+run starts over.
+"""
+
+import json
+import os
+import time
+from collections import defaultdict
+import multiprocessing
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from database.repositories.users import UserRepository
+from apps.handwriting import cache as prediction_cache
+from apps.handwriting import cnn, preprocess
+from apps.handwriting.utils import HEURISTICS_VERSION, predict_batch_local
+
+CHECKPOINT_PATH = prediction_cache.CACHE_DIR / 'reclassify_checkpoint.json'
+
+
+class Command(BaseCommand):
+    help = "Re-classify all writers' handwriting samples with the current local classifier"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument('--batch-size', type=int, default=16, help="Writers per task")
+        parser.add_argument('--dry-run', action='store_true', help="Classify but do not write results")
+        parser.add_argument('--restart', action='store_true', help="Ignore any existing checkpoint")
+
+    def handle(self, *args, **options):
+        version = cnn.model_version() or HEURISTICS_VERSION
+        done = set() if options['restart'] else _load_checkpoint(version)
+
+        writers = UserRepository.list_all(role='WRITER')
+        pending = []
+        for writer in writers:
+            if writer['id'] in done:
+                continue
+            paths = _sample_paths(writer)
+            if paths:
+                pending.append((writer['id'], paths))
+        batch_size = max(1, options['batch_size'])
+        tasks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+        self.stdout.write(
+            f"Classifier {version}: {len(pending)} writers to score "
+            f"({len(done)} already done, {len(writers)} total)"
+        )
+        if not tasks:
+            return
+
+        started = time.perf_counter()
+        scored = samples = 0
+        # spawn, not fork: TensorFlow is not fork-safe once loaded in this process
+        pool = multiprocessing.get_context('spawn').Pool(options['workers'])
+        try:
+            for writer_ids, results, sample_count in pool.imap_unordered(_classify_writers, tasks):
+                updates = {
+                    writer_id: {'handwriting_style': style, 'handwriting_confidence': confidence}
+                    for writer_id, style, confidence in results
+                }
+                if updates and not options['dry_run']:
+                    _write_results(updates)
+                # A task only counts as done once its results are written
+                done.update(writer_ids)
+                if not options['dry_run']:
+                    _save_checkpoint(version, done)
+
+                scored += len(writer_ids)
+                samples += sample_count
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  {scored}/{len(pending)} writers, {samples} samples "
+                    f"({samples / elapsed:.1f} samples/s)"
+                )
+            pool.close()
+        except CommandError:
+            pool.terminate()
+            raise
+        except KeyboardInterrupt:
+            pool.terminate()
+            self.stdout.write(self.style.WARNING(
+                f"Interrupted after {scored} writers; run again to resume from {CHECKPOINT_PATH}"
+            ))
+            return
+        finally:
+            pool.join()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-classified {scored} writers ({samples} samples) in {elapsed:.1f}s"
+        ))
+        if not options['dry_run']:
+            _clear_checkpoint()
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _sample_paths(writer: dict) -> list:
+    """Local file paths for a writer's stored samples (remote URLs are skipped)."""
+    urls = list(writer.get('handwriting_samples') or [])
+    if writer.get('handwriting_sample_url') and writer['handwriting_sample_url'] not in urls:
+        urls.append(writer['handwriting_sample_url'])
+    paths = []
+    for url in urls:
+        if url and url.startswith(settings.MEDIA_URL):
+            path = os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+            if os.path.isfile(path):
+                paths.append(path)
+    return paths
+
+
+def _write_results(updates: dict) -> None:
+    """bulk_update the task's results; raises CommandError unless every writer was written."""
+    try:
+        written = UserRepository.bulk_update(updates)
+    except Exception as e:
+        raise CommandError(f"Writing results failed: {e}; run again to resume from {CHECKPOINT_PATH}")
+    if written != len(updates):
+        raise CommandError(
+            f"Only {written} of {len(updates)} writers were updated; "
+            f"run again to resume from {CHECKPOINT_PATH}"
+        )
+
+
+def _classify_writers(task: list) -> tuple:
+    """
+    Runs in a worker process. Classifies every sample of the given writers
+    in one batch and combines each writer's samples into one style: the
+    style with the highest total confidence, at its mean confidence.
+    Returns: (writer ids in the task, [(writer_id, style, confidence)],
+              number of samples classified)
+    """
+    owners, images = [], []
+    for writer_id, paths in task:
+        for path in paths:
+            with open(path, 'rb') as f:
+                image = preprocess.prepare(f)
+            if image is not None:
+                owners.append(writer_id)
+                images.append(image)
+
+    predictions, version = predict_batch_local(images)
+
+    votes = defaultdict(lambda: defaultdict(list))
+    for writer_id, image, (style, confidence) in zip(owners, images, predictions):
+        votes[writer_id][style].append(confidence)
+        # Uploads of the same image later hit the cache
+        prediction_cache.put(prediction_cache.image_hash(image.rgb), style, confidence, version)
+
+    results = []
+    for writer_id, styles in votes.items():
+        style = max(styles, key=lambda s: sum(styles[s]))
+        confidences = styles[style]
+        results.append((writer_id, style, sum(confidences) / len(confidences)))
+    return [writer_id for writer_id, _ in task], results, len(images)
+
+
+def _load_checkpoint(version: str) -> set:
+    try:
+        with open(CHECKPOINT_PATH, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if checkpoint.get('version') != version:
+        print(f"[Reclassify] Checkpoint is for {checkpoint.get('version')}, starting over")
+        return set()
+    return set(checkpoint.get('done', []))
+
+
+def _save_checkpoint(version: str, done: set) -> None:
+    CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = CHECKPOINT_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'done': sorted(done), 'updated_at': time.time()}, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def _clear_checkpoint() -> None:
+    try:
+        os.remove(CHECKPOINT_PATH)
+    except OSError:
+        pass
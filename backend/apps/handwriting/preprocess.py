@@ -0,0 +1,54 @@
+"""
+Decode-once preprocessing for handwriting uploads.
+
+An upload is decoded a single time into a `PreparedImage` holding an RGB
+thumbnail (for Gemini and the content hash) and a grayscale image derived
+from it (for the CNN and the heuristics). Every classifier reads from the
+same buffers instead of re-opening the file.
+
+JPEGs are decoded with `Image.draft`, so libjpeg downscales by a power of
+two while decoding and a 12 MP phone photo never materialises at full size.
+"""
+
+import os
+from PIL import Image
+
+# Longest side kept after decoding; Gemini never needed more than this
+MAX_DIM = int(os.environ.get('HANDWRITING_MAX_DIM', '1024'))
+
+
+class PreparedImage:
+    __slots__ = ('rgb', 'gray')
+
+    def __init__(self, rgb: Image.Image):
+        self.rgb = rgb
+        self.gray = rgb.convert('L')
+
+    def gray_resized(self, size: tuple, resample=Image.BICUBIC) -> Image.Image:
+        """Grayscale image at `size`; returns the shared image if already that size."""
+        if self.gray.size == size:
+            return self.gray
+        return self.gray.resize(size, resample)
+
+
+def prepare(image_file) -> PreparedImage | None:
+    """Decode an upload once. Returns None if it is not a readable image."""
+    try:
+        image_file.seek(0)
+        with Image.open(image_file) as img:
+            # JPEG only: pick the smallest DCT scale that still covers MAX_DIM
+            img.draft('RGB', (MAX_DIM, MAX_DIM))
+            rgb = img.convert('RGB')
+
+        if max(rgb.size) > MAX_DIM:
+            ratio = MAX_DIM / max(rgb.size)
+            new_size = (int(rgb.size[0] * ratio), int(rgb.size[1] * ratio))
+            rgb = rgb.resize(new_size, Image.LANCZOS)
+
+        return PreparedImage(rgb)
+    except Exception as e:
+        print(f"[Handwriting] Could not decode image: {e}")
+        return None
+    finally:
+        # Leave the stream at the start for FileSystemStorage.save
+        image_file.seek(0)
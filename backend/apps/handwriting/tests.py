@@ -0,0 +1,149 @@
+import numpy as np
+from concurrent.futures import wait
+from PIL import Image, ImageDraw
+from django.test import SimpleTestCase
+from .batching import MicroBatcher
+from .utils import HEURISTIC_SIZE, _heuristic_features_batch, _mean_run_lengths, _score_heuristics
+
+
+def _loop_features(img_array):
+    """The per-pixel loop implementation the vectorized features replaced."""
+    from PIL import ImageFilter
+    threshold = np.mean(img_array)
+    binary = (img_array < threshold).astype(np.float32)
+    ink_density = np.mean(binary)
+
+    h_runs = []
+    for row in binary:
+        run = 0
+        for px in row:
+            if px > 0.5:
+                run += 1
+            else:
+                if run > 0:
+                    h_runs.append(run)
+                run = 0
+    avg_h_run = np.mean(h_runs) if h_runs else 0
+
+    edges = Image.fromarray(img_array.astype(np.uint8)).filter(ImageFilter.FIND_EDGES)
+    edge_density = np.mean(np.array(edges) > 30)
+
+    v_runs = []
+    for col_idx in range(binary.shape[1]):
+        run = 0
+        for row_idx in range(binary.shape[0]):
+            if binary[row_idx, col_idx] > 0.5:
+                run += 1
+            else:
+                if run > 0:
+                    v_runs.append(run)
+                run = 0
+    avg_v_run = np.mean(v_runs) if v_runs else 0
+    return ink_density, avg_h_run, edge_density, avg_v_run
+
+
+def _golden_images():
+    """Fixed HEURISTIC_SIZE grayscale images: degenerate cases, drawn strokes and seeded noise."""
+    width, height = HEURISTIC_SIZE
+    images = {
+        'blank': np.full((height, width), 255, dtype=np.uint8),
+        'black': np.zeros((height, width), dtype=np.uint8),
+    }
+
+    single = np.full((height, width), 255, dtype=np.uint8)
+    single[100, 100] = 0
+    images['single_pixel'] = single
+
+    # Ink touching every edge: runs reaching the end of a row/column are not counted
+    border = np.full((height, width), 255, dtype=np.uint8)
+    border[:, :3] = border[:, -3:] = border[:3, :] = border[-3:, :] = 0
+    images['border'] = border
+
+    stripes = np.full((height, width), 255, dtype=np.uint8)
+    stripes[:, 10::20] = 0
+    stripes[40::50, :] = 0
+    images['stripes'] = stripes
+
+    for name, stroke in (('thin_text', 2), ('bold_text', 9)):
+        canvas = Image.new('L', HEURISTIC_SIZE, 255)
+        draw = ImageDraw.Draw(canvas)
+        for line in range(6):
+            y = 25 + line * 38
+            draw.line([(12, y), (80, y + 18), (150, y - 6), (240, y + 12)], fill=0, width=stroke)
+            draw.ellipse([(30 + line * 25, y - 10), (55 + line * 25, y + 14)], outline=30, width=stroke)
+        images[name] = np.array(canvas)
+
+    rng = np.random.default_rng(20240917)
+    for density in (0.05, 0.3, 0.7):
+        noise = rng.random((height, width))
+        images[f'noise_{density}'] = np.where(noise < density, 20, 235).astype(np.uint8)
+    images['gradient'] = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    return images
+
+
+class HeuristicFeatureGoldenTests(SimpleTestCase):
+    """The vectorized heuristic features must match the original loops exactly."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.images = _golden_images()
+        cls.expected = {name: _loop_features(img) for name, img in cls.images.items()}
+
+    def test_features_match_loop_implementation(self):
+        names = list(self.images)
+        actual = _heuristic_features_batch([self.images[name] for name in names])
+        for name, features in zip(names, actual):
+            with self.subTest(image=name):
+                for got, want in zip(features, self.expected[name]):
+                    self.assertAlmostEqual(float(got), float(want), places=9)
+
+    def test_features_do_not_depend_on_batch_composition(self):
+        for name, img in self.images.items():
+            with self.subTest(image=name):
+                [alone] = _heuristic_features_batch([img])
+                for got, want in zip(alone, self.expected[name]):
+                    self.assertAlmostEqual(float(got), float(want), places=9)
+
+    def test_scores_match_loop_implementation(self):
+        names = list(self.images)
+        actual = _heuristic_features_batch([self.images[name] for name in names])
+        for name, features in zip(names, actual):
+            with self.subTest(image=name):
+                self.assertEqual(_score_heuristics(*features, verbose=False),
+                                 _score_heuristics(*self.expected[name], verbose=False))
+
+    def test_mean_run_lengths_ignores_runs_reaching_the_edge(self):
+        masks = np.array([
+            [[1, 1, 0, 1, 1, 1, 0, 1]],
+            [[0, 0, 0, 0, 0, 0, 0, 0]],
+            [[1, 1, 1, 1, 1, 1, 1, 1]],
+        ], dtype=bool)
+        self.assertEqual(_mean_run_lengths(masks), [2.5, 0, 0])
+
+
+class MicroBatcherTests(SimpleTestCase):
+
+    def test_results_are_returned_in_submission_order(self):
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch=4, max_wait=0.05)
+        futures = [batcher.submit(i) for i in range(10)]
+        self.assertEqual([f.result(timeout=5) for f in futures], [i * 2 for i in range(10)])
+
+    def test_short_batch_result_fails_the_unanswered_callers(self):
+        batcher = MicroBatcher(lambda items: items[:1], max_batch=4, max_wait=0.05)
+        futures = [batcher.submit(i) for i in range(4)]
+        wait(futures, timeout=5)
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(futures[0].result(), 0)
+        for future in futures[1:]:
+            with self.assertRaises(RuntimeError):
+                future.result()
+
+    def test_batch_fn_error_reaches_every_caller(self):
+        def fail(items):
+            raise ValueError("boom")
+        batcher = MicroBatcher(fail, max_batch=4, max_wait=0.05)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import PredictHandwritingView, WriterSamplesView, DeleteSampleView
+from .views import PredictHandwritingView, WriterSamplesView, DeleteSampleView, HandwritingMetricsView, HandwritingJobView
 
 urlpatterns = [
     path('predict/', PredictHandwritingView.as_view(), name='predict_handwriting'),
+    path('jobs/<str:job_id>/', HandwritingJobView.as_view(), name='handwriting_job'),
+    path('metrics/', HandwritingMetricsView.as_view(), name='handwriting_metrics'),
     path('writers/<str:writer_id>/samples/', WriterSamplesView.as_view(), name='writer_samples'),
     path('writers/<str:writer_id>/samples/delete/', DeleteSampleView.as_view(), name='delete_sample'),
 ]
@@ -1,11 +1,21 @@
 import os
 import json
+import threading
+import time
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageFilter
 from pathlib import Path
+from utils.metrics import LatencyHistogram
+from . import cache as prediction_cache
+from . import cnn
+from . import preprocess
+from .batching import MicroBatcher
 
 # Configuration
 CLASSES = ['Neat', 'Cursive', 'Bold', 'Mixed']
+# Bump when predict_with_heuristics changes so cached results are recomputed
+HEURISTICS_VERSION = 'heuristics-v2'
+HEURISTIC_SIZE = (256, 256)
 GEMINI_API_KEY = None
 
 # Load .env for GEMINI_API_KEY
@@ -19,34 +29,53 @@ if _env_path.exists():
                 os.environ.setdefault(key.strip(), value.strip())
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
-
-
-def predict_with_gemini(image_file):
+GEMINI_MODEL_NAME = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+GEMINI_TIMEOUT_SECONDS = float(os.environ.get('GEMINI_TIMEOUT', '20'))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', '4'))
+# Below this CNN confidence, Gemini (if configured) gets the final say
+CNN_TIEBREAK_BELOW = float(os.environ.get('HANDWRITING_CNN_TIEBREAK_BELOW', '0.6'))
+
+# One configured client/model per process; the underlying connection is reused
+_gemini_model = None
+_gemini_init_lock = threading.Lock()
+# Caps in-flight Gemini calls so bursts don't exhaust quota or worker threads
+_gemini_slots = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+gemini_latency = LatencyHistogram('handwriting_gemini_seconds')
+
+
+def _get_gemini_model():
+    """Lazily configure the Gemini client and build the model handle once."""
+    global _gemini_model
+    if _gemini_model is None:
+        with _gemini_init_lock:
+            if _gemini_model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _gemini_model
+
+
+def predict_with_gemini(image):
     """
     Use Google Gemini Vision AI to classify handwriting style.
+    `image` is a PreparedImage; its RGB thumbnail is sent as-is.
     Returns: (style, confidence) or (None, None) on failure.
     """
     if not GEMINI_API_KEY:
         print("[Handwriting] No GEMINI_API_KEY set. Skipping Gemini analysis.")
         return None, None
 
-    try:
-        import google.generativeai as genai
-
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-
-        # Read image bytes
-        image_file.seek(0)
-        img = Image.open(image_file)
-        img_rgb = img.convert('RGB')
+    # Wait for a free slot no longer than a call would take; fall back otherwise
+    if not _gemini_slots.acquire(timeout=GEMINI_TIMEOUT_SECONDS):
+        print("[Handwriting] Gemini concurrency limit reached. Skipping Gemini analysis.")
+        gemini_latency.observe(0.0, outcome='throttled')
+        return None, None
 
-        # Resize if too large (max 1024px on longest side) to save tokens
-        max_dim = 1024
-        if max(img_rgb.size) > max_dim:
-            ratio = max_dim / max(img_rgb.size)
-            new_size = (int(img_rgb.size[0] * ratio), int(img_rgb.size[1] * ratio))
-            img_rgb = img_rgb.resize(new_size, Image.LANCZOS)
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        model = _get_gemini_model()
 
         prompt = """You are a handwriting style classifier.
 Analyze the handwriting in this image ONLY.
@@ -92,7 +121,10 @@ No extra text. No explanation outside JSON:
   "reason": "one sentence about what you saw"
 }"""
 
-        response = model.generate_content([prompt, img_rgb])
+        response = model.generate_content(
+            [prompt, image.rgb],
+            request_options={'timeout': GEMINI_TIMEOUT_SECONDS},
+        )
 
         # Parse the response
         response_text = response.text.strip()
@@ -127,125 +159,206 @@ No extra text. No explanation outside JSON:
         confidence = max(0.0, min(1.0, confidence))
 
         print(f"[Handwriting] Gemini classified as: {style} (confidence: {confidence:.2f})")
+        outcome = 'ok'
         return style, confidence
 
     except Exception as e:
         print(f"[Handwriting] Gemini analysis failed: {e}")
         return None, None
+    finally:
+        gemini_latency.observe(time.perf_counter() - started, outcome=outcome)
+        _gemini_slots.release()
 
 
-def predict_with_heuristics(image_file):
+def _mean_run_lengths(masks):
     """
-    Basic image-feature heuristic fallback for handwriting classification.
-    Uses stroke thickness, density, and edge analysis.
-    Returns: (style, confidence)
+    Mean length of consecutive True runs along the rows of each image in an
+    (N, H, W) bool array. Only runs closed by a background pixel are counted;
+    a run that reaches the end of its row is ignored. Images without such
+    runs get 0.
     """
-    try:
-        image_file.seek(0)
-        img = Image.open(image_file)
-        img_gray = img.convert('L')
-        img_resized = img_gray.resize((256, 256))
-
-        img_array = np.array(img_resized)
-
-        # Binarize (Otsu-like threshold)
-        threshold = np.mean(img_array)
-        binary = (img_array < threshold).astype(np.float32)
-
-        # Feature 1: Ink density (ratio of dark pixels)
-        ink_density = np.mean(binary)
-
-        # Feature 2: Stroke thickness estimation
-        # Use horizontal and vertical run-length of dark pixels
-        h_runs = []
-        for row in binary:
-            run = 0
-            for px in row:
-                if px > 0.5:
-                    run += 1
-                else:
-                    if run > 0:
-                        h_runs.append(run)
-                    run = 0
-        avg_h_run = np.mean(h_runs) if h_runs else 0
+    count, height, width = masks.shape
+    padded = np.zeros((count, height, width + 2), dtype=np.int8)
+    padded[:, :, 1:-1] = masks
+    edges = np.diff(padded, axis=2)
+    # nonzero() walks in C order, so the i-th start pairs with the i-th end
+    start_img, _, start_cols = np.nonzero(edges == 1)
+    _, _, end_cols = np.nonzero(edges == -1)
+    closed = end_cols < width
+    lengths = (end_cols - start_cols)[closed]
+    owners = start_img[closed]
+    totals = np.bincount(owners, weights=lengths, minlength=count)
+    runs = np.bincount(owners, minlength=count)
+    return [totals[i] / runs[i] if runs[i] else 0 for i in range(count)]
+
+
+def _heuristic_features_batch(arrays):
+    """
+    Extract heuristic features for a batch of 256x256 grayscale uint8 images
+    in one vectorized pass.
+    Returns a list of (ink_density, avg_h_run, edge_density, avg_v_run).
+    """
+    stack = np.stack(arrays)
+
+    # Binarize each image at its own mean (Otsu-like threshold)
+    thresholds = stack.mean(axis=(1, 2), keepdims=True)
+    ink = stack < thresholds
+
+    # Feature 1: Ink density (ratio of dark pixels)
+    ink_density = ink.astype(np.float32).mean(axis=(1, 2))
 
+    # Feature 2: Stroke thickness estimation
+    # Use horizontal and vertical run-length of dark pixels
+    avg_h_runs = _mean_run_lengths(ink)
+
+    # Feature 4: Vertical connectivity (cursive tends to have more horizontal continuity)
+    avg_v_runs = _mean_run_lengths(ink.transpose(0, 2, 1))
+
+    features = []
+    for i, img_array in enumerate(arrays):
         # Feature 3: Edge density (proxy for curves/connections)
         # Simple Sobel-like edge detection
-        from PIL import ImageFilter
-        img_resized_pil = Image.fromarray(img_array.astype(np.uint8))
-        edges = img_resized_pil.filter(ImageFilter.FIND_EDGES)
-        edge_array = np.array(edges)
-        edge_density = np.mean(edge_array > 30) 
-
-        # Feature 4: Vertical connectivity (cursive tends to have more horizontal continuity)
-        v_runs = []
-        for col_idx in range(binary.shape[1]):
-            run = 0
-            for row_idx in range(binary.shape[0]):
-                if binary[row_idx, col_idx] > 0.5:
-                    run += 1
-                else:
-                    if run > 0:
-                        v_runs.append(run)
-                    run = 0
-        avg_v_run = np.mean(v_runs) if v_runs else 0
-
-        # Classification logic based on features
-        scores = {'Neat': 0.0, 'Cursive': 0.0, 'Bold': 0.0, 'Mixed': 0.0}
-
-        # Bold: high ink density + thick strokes
-        if ink_density > 0.25:
-            scores['Bold'] += 0.4
-        if avg_h_run > 8:
-            scores['Bold'] += 0.3
-            scores['Cursive'] += 0.1  # Long runs could also be cursive
-
-        # Cursive: high edge density (lots of curves) + long horizontal runs + moderate ink
-        if edge_density > 0.15:
-            scores['Cursive'] += 0.3
-        if avg_h_run > 5 and avg_h_run <= 8:
-            scores['Cursive'] += 0.25
-        if 0.10 < ink_density <= 0.25:
-            scores['Cursive'] += 0.15
-
-        # Neat: low-moderate ink density + short runs (separated letters) + moderate edges
-        if ink_density <= 0.15:
-            scores['Neat'] += 0.3
-        if avg_h_run <= 5:
-            scores['Neat'] += 0.25
-        if edge_density <= 0.15:
-            scores['Neat'] += 0.15
-
-        # Mixed: when no category dominates
-        max_score = max(scores.values())
-        if max_score < 0.3:
-            scores['Mixed'] += 0.5
-
-        # Pick the winner
-        best_style = max(scores, key=scores.get)
-        confidence = min(0.75, max(0.35, scores[best_style]))  # Cap heuristic confidence
-
+        edges = Image.fromarray(img_array.astype(np.uint8)).filter(ImageFilter.FIND_EDGES)
+        edge_density = np.mean(np.array(edges) > 30)
+        features.append((ink_density[i], avg_h_runs[i], edge_density, avg_v_runs[i]))
+    return features
+
+
+def _score_heuristics(ink_density, avg_h_run, edge_density, avg_v_run, verbose=True):
+    """Map heuristic features to (style, confidence)."""
+    # Classification logic based on features
+    scores = {'Neat': 0.0, 'Cursive': 0.0, 'Bold': 0.0, 'Mixed': 0.0}
+
+    # Bold: high ink density + thick strokes
+    if ink_density > 0.25:
+        scores['Bold'] += 0.4
+    if avg_h_run > 8:
+        scores['Bold'] += 0.3
+        scores['Cursive'] += 0.1  # Long runs could also be cursive
+
+    # Cursive: high edge density (lots of curves) + long horizontal runs + moderate ink
+    if edge_density > 0.15:
+        scores['Cursive'] += 0.3
+    if avg_h_run > 5 and avg_h_run <= 8:
+        scores['Cursive'] += 0.25
+    if 0.10 < ink_density <= 0.25:
+        scores['Cursive'] += 0.15
+
+    # Neat: low-moderate ink density + short runs (separated letters) + moderate edges
+    if ink_density <= 0.15:
+        scores['Neat'] += 0.3
+    if avg_h_run <= 5:
+        scores['Neat'] += 0.25
+    if edge_density <= 0.15:
+        scores['Neat'] += 0.15
+
+    # Mixed: when no category dominates
+    max_score = max(scores.values())
+    if max_score < 0.3:
+        scores['Mixed'] += 0.5
+
+    # Pick the winner
+    best_style = max(scores, key=scores.get)
+    confidence = min(0.75, max(0.35, scores[best_style]))  # Cap heuristic confidence
+
+    if verbose:
         print(f"[Handwriting] Heuristic classified as: {best_style} (confidence: {confidence:.2f})")
         print(f"  Features: ink_density={ink_density:.3f}, avg_h_run={avg_h_run:.1f}, "
               f"edge_density={edge_density:.3f}, avg_v_run={avg_v_run:.1f}")
-        return best_style, confidence
+    return best_style, confidence
+
+
+def classify_heuristics_batch(arrays, verbose=True):
+    """
+    Heuristic (style, confidence) for each HEURISTIC_SIZE grayscale uint8
+    array in `arrays`, computed in one vectorized pass.
+    """
+    return [_score_heuristics(*features, verbose=verbose)
+            for features in _heuristic_features_batch(arrays)]
+
+
+# Concurrent heuristic requests share one vectorized feature pass
+_heuristic_batcher = MicroBatcher(classify_heuristics_batch, name='handwriting-heuristics')
+
+
+def predict_with_heuristics(image):
+    """
+    Basic image-feature heuristic fallback for handwriting classification.
+    Uses stroke thickness, density, and edge analysis.
+    Returns: (style, confidence)
+    """
+    try:
+        img_resized = image.gray_resized(HEURISTIC_SIZE)
+
+        return _heuristic_batcher(np.array(img_resized))
 
     except Exception as e:
         print(f"[Handwriting] Heuristic analysis failed: {e}")
         return 'Mixed', 0.3
 
 
+def predict_batch_local(images):
+    """
+    Classify a list of PreparedImages with the local CNN in one forward pass,
+    or with the heuristics when no model is loaded. Never calls Gemini, so
+    it is safe for bulk jobs.
+    Returns: (list of (style, confidence), classifier version)
+    """
+    cnn_version = cnn.model_version()
+    if cnn_version:
+        if not images:
+            return [], cnn_version
+        return cnn.predict_batch([cnn.preprocess(image) for image in images]), cnn_version
+    if not images:
+        return [], HEURISTICS_VERSION
+    arrays = [np.array(image.gray_resized(HEURISTIC_SIZE)) for image in images]
+    return classify_heuristics_batch(arrays, verbose=False), HEURISTICS_VERSION
+
+
 def predict_handwriting_style(image_file):
     """
     Predicts the handwriting style of the uploaded image.
-    Uses Gemini Vision AI as primary, with heuristic fallback.
+    Uses the local CNN as primary, asking Gemini to break ties when the CNN
+    is unsure. Without a usable CNN model, falls back to Gemini and then
+    the heuristics.
+    Results are cached by image content, so repeat uploads skip the model.
+    The upload is decoded once and shared by every classifier.
     Returns: (style, confidence) or (None, None)
     """
+    image = preprocess.prepare(image_file)
+    if image is None:
+        return 'Mixed', 0.3
+
+    cnn_version = cnn.model_version()
+    # Only reuse results produced by the classifier we would run now, so a
+    # heuristic answer cached during a Gemini outage is not served forever.
+    primary_version = cnn_version or (GEMINI_MODEL_NAME if GEMINI_API_KEY else HEURISTICS_VERSION)
+    key = prediction_cache.image_hash(image.rgb)
+    cached = prediction_cache.get(key, primary_version)
+    if cached is not None:
+        print(f"[Handwriting] Cache hit: {cached[0]} (confidence: {cached[1]:.2f})")
+        return cached
+
+    # Local CNN first — no network round trip
+    if cnn_version:
+        style, confidence = cnn.predict_with_cnn(image)
+        if style is not None:
+            if confidence < CNN_TIEBREAK_BELOW and GEMINI_API_KEY:
+                print("[Handwriting] CNN unsure, asking Gemini to break the tie...")
+                g_style, g_confidence = predict_with_gemini(image)
+                if g_style is not None:
+                    style, confidence = g_style, g_confidence
+            prediction_cache.put(key, style, confidence, cnn_version)
+            return style, confidence
+
     # Try Gemini first
-    style, confidence = predict_with_gemini(image_file)
+    style, confidence = predict_with_gemini(image)
     if style is not None:
+        prediction_cache.put(key, style, confidence, GEMINI_MODEL_NAME)
         return style, confidence
 
     # Fallback to heuristic analysis
     print("[Handwriting] Falling back to heuristic analysis...")
-    return predict_with_heuristics(image_file)
+    style, confidence = predict_with_heuristics(image)
+    prediction_cache.put(key, style, confidence, HEURISTICS_VERSION)
+    return style, confidence
@@ -4,28 +4,19 @@ from rest_framework import status
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 import os
-import jwt
 from database.repositories.users import UserRepository
-from .utils import predict_handwriting_style
+from apps.authentication.tokens import get_admin_from_token, get_user_from_token
+from .utils import predict_handwriting_style, gemini_latency
+from . import jobs
+
+MAX_SAMPLES_PER_WRITER = 10
 
 class PredictHandwritingView(APIView):
     authentication_classes = [] 
     permission_classes = []
 
     def get_user_from_token(self, request):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return None
-        
-        try:
-            # "Bearer <token>"
-            token = auth_header.split(' ')[1]
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            return UserRepository.get_by_id(user_id)
-        except Exception as e:
-            print(f"Token Error: {e}")
-            return None
+        return get_user_from_token(request)
 
     def post(self, request):
         # 1. Authenticate (Optional but recommended since it updates user profile)
@@ -39,6 +30,23 @@ class PredictHandwritingView(APIView):
         if not image_file:
             return Response({'error': 'No image provided'}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Job mode (?async=1): save the upload, classify it in the background
+        # and let the client poll /api/handwriting/jobs/<job_id>/
+        async_flag = request.query_params.get('async') or request.data.get('async')
+        if str(async_flag).lower() in ('1', 'true', 'yes'):
+            fs = FileSystemStorage()
+            filename = fs.save(f"handwriting_samples/{image_file.name}", image_file)
+            try:
+                job_id = jobs.submit(user['id'], filename)
+            except jobs.QueueFullError as e:
+                fs.delete(filename)
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return Response({
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/api/handwriting/jobs/{job_id}/",
+            }, status=status.HTTP_202_ACCEPTED)
+
         # 2. Predict
         style, confidence = predict_handwriting_style(image_file)
         
@@ -51,12 +59,7 @@ class PredictHandwritingView(APIView):
         file_url = fs.url(filename)
 
         # 3. Update User (Writer) Profile — append sample URL to array
-        UserRepository.update(user['id'], {
-            'handwriting_style': style,
-            'handwriting_confidence': confidence,
-            'handwriting_sample_url': file_url,
-        })
-        UserRepository.append_to_array(user['id'], 'handwriting_samples', file_url)
+        jobs.save_prediction(user['id'], style, confidence, file_url)
 
         # 4. Return Result
         return Response({
@@ -66,19 +69,26 @@ class PredictHandwritingView(APIView):
         }, status=status.HTTP_200_OK)
 
 
-def get_user_from_token(request):
-    """Shared helper to extract user from JWT token."""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return None
-    try:
-        token = auth_header.split(' ')[1]
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-        user_id = payload.get('user_id')
-        return UserRepository.get_by_id(user_id)
-    except Exception as e:
-        print(f"Token Error: {e}")
-        return None
+class HandwritingJobView(APIView):
+    """GET: Status of a background handwriting analysis job (owner only)."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request, job_id):
+        user = get_user_from_token(request)
+        if not user:
+            return Response({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+
+        job = jobs.get(job_id)
+        if not job or job['user_id'] != user['id']:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        payload = {'job_id': job['job_id'], 'status': job['status']}
+        if job['result']:
+            payload.update(job['result'])
+        if job['error']:
+            payload['error'] = job['error']
+        return Response(payload)
 
 
 class WriterSamplesView(APIView):
@@ -128,29 +138,31 @@ class WriterSamplesView(APIView):
             return Response({'error': 'File type not allowed. Use JPG, PNG, WebP, or PDF.'}, 
                           status=status.HTTP_400_BAD_REQUEST)
 
-        # Check max samples limit (10)
-        try:
-            current_user = UserRepository.get_by_id(writer_id)
-            if current_user:
-                current_samples = current_user.get('handwriting_samples', [])
-                if len(current_samples) >= 10:
-                    return Response({'error': 'Maximum 10 samples allowed. Delete some before uploading more.'}, 
-                                  status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            print(f"Error checking sample count: {e}")
-
         # Save file to disk
         fs = FileSystemStorage()
         filename = fs.save(f"handwriting_samples/{writer_id}/{image_file.name}", image_file)
         file_url = fs.url(filename)
 
-        # Append URL to handwriting_samples array
+        # Append URL to handwriting_samples array (single atomic round trip);
+        # the max samples limit is enforced in the same statement
         try:
-            UserRepository.append_to_array(writer_id, 'handwriting_samples', file_url)
+            samples = UserRepository.append_to_array(writer_id, 'handwriting_samples', file_url,
+                                                     max_length=MAX_SAMPLES_PER_WRITER)
         except Exception as e:
             print(f"Error updating database: {e}")
+            fs.delete(filename)
             return Response({'error': 'Failed to save sample'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if samples is None:
+            fs.delete(filename)
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if file_url not in samples:
+            # Already at the limit
+            fs.delete(filename)
+            return Response({'error': 'Maximum 10 samples allowed. Delete some before uploading more.'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+
         return Response({
             'url': file_url,
             'message': 'Sample uploaded successfully'
@@ -195,3 +207,15 @@ class DeleteSampleView(APIView):
         except Exception as e:
             print(f"Error deleting sample: {e}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class HandwritingMetricsView(APIView):
+    """GET: Latency histogram for the Gemini classification call (admin only)."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        if not get_admin_from_token(request):
+            return Response({'error': 'Forbidden - Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
+        return Response({'gemini': gemini_latency.snapshot()})
@@ -0,0 +1,263 @@
+"""
+Non-interactive dataset builder for the handwriting CNN.
+
+Walks a folder of images (e.g. the extracted IAM `iam_words`), labels each
+one with the existing heuristic or CNN classifier in a process pool, and
+writes the preprocessed 128x128 grayscale images into sharded `.npy`
+files plus a `manifest.json`. Training memory-maps the shards, so nothing
+is decoded again per epoch.
+
+Usage:
+    python build_dataset.py                          # label iam_words with the heuristics
+    python build_dataset.py --labeler cnn            # label with handwriting_model.h5/.tflite
+    python build_dataset.py --labeler folders --source dataset
+                                                     # keep labels from organize_dataset.py
+
+Images are preprocessed exactly like uploads at serving time
+(apps/handwriting/preprocess.py + cnn.preprocess), and stored as uint8;
+scale by 1/255 when training.
+"""
+
+import argparse
+import json
+import os
+import time
+import zlib
+from multiprocessing import Pool
+import numpy as np
+
+# Configuration
+SOURCE_DIR = 'iam_words'
+DEST_DIR = 'dataset_npy'
+CLASSES = ['Neat', 'Cursive', 'Bold', 'Mixed']
+SPLITS = ['train', 'test']
+SHARD_SIZE = 4096
+CHUNK_SIZE = 64
+TEST_SPLIT = 0.2
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+MANIFEST_NAME = 'manifest.json'
+
+
+def collect(source, labeler, test_split=TEST_SPLIT):
+    """
+    List (path, label, split) for every image under `source`.
+    With the `folders` labeler, `source` must be laid out as
+    <split>/<class>/<image> (what organize_dataset.py produces).
+    Otherwise the label is None and the split is derived from the path,
+    so rebuilding puts every image in the same split.
+    """
+    items = []
+    if labeler == 'folders':
+        for split in SPLITS:
+            for label, cls in enumerate(CLASSES):
+                folder = os.path.join(source, split, cls)
+                for path in sorted(_walk_images(folder)):
+                    items.append((path, label, split))
+        return items
+
+    for path in sorted(_walk_images(source)):
+        rel = os.path.relpath(path, source).replace(os.sep, '/')
+        bucket = zlib.crc32(rel.encode('utf-8')) % 1000
+        split = 'test' if bucket < test_split * 1000 else 'train'
+        items.append((path, None, split))
+    return items
+
+
+def build(source=SOURCE_DIR, dest=DEST_DIR, labeler='heuristics', workers=None,
+          shard_size=SHARD_SIZE, test_split=TEST_SPLIT, min_confidence=0.0):
+    if not os.path.exists(source):
+        print(f"Error: Source directory '{source}' not found.")
+        return None
+
+    items = collect(source, labeler, test_split)
+    print(f"Found {len(items)} images in '{source}'.")
+    if not items:
+        return None
+
+    os.makedirs(dest, exist_ok=True)
+    _clear_shards(dest)
+    writers = {split: _ShardWriter(dest, split, shard_size) for split in SPLITS}
+
+    chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    started = time.perf_counter()
+    done = skipped = 0
+    with Pool(workers, initializer=_init_worker, initargs=(labeler,)) as pool:
+        # imap (not imap_unordered) keeps shard contents reproducible
+        jobs = [(chunk, labeler, min_confidence) for chunk in chunks]
+        for i, (results, chunk_skipped) in enumerate(pool.imap(_process_chunk, jobs), 1):
+            for split, tensor, label in results:
+                writers[split].add(tensor, label)
+            done += len(results)
+            skipped += chunk_skipped
+            if i % 50 == 0:
+                print(f"  {done + skipped}/{len(items)} images ({time.perf_counter() - started:.1f}s)")
+
+    manifest = {
+        'version': 1,
+        'classes': CLASSES,
+        'img_height': 128,
+        'img_width': 128,
+        'dtype': 'uint8',
+        'labeler': labeler,
+        'labeler_version': _labeler_version(labeler),
+        'min_confidence': min_confidence,
+        'source': os.path.abspath(source),
+        'created_at': time.time(),
+        'skipped': skipped,
+        'splits': {split: writers[split].close() for split in SPLITS},
+    }
+    # Written last and atomically: a half-built store has no manifest
+    tmp_path = os.path.join(dest, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, os.path.join(dest, MANIFEST_NAME))
+
+    for split in SPLITS:
+        counts = manifest['splits'][split]['class_counts']
+        print(f"{split}: {manifest['splits'][split]['count']} images {counts}")
+    print(f"Skipped {skipped} images. Done in {time.perf_counter() - started:.1f}s -> {dest}/{MANIFEST_NAME}")
+    return manifest
+
+
+def load_manifest(dest=DEST_DIR):
+    with open(os.path.join(dest, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def open_split(dest, split, manifest=None):
+    """
+    Memory-map every shard of a split.
+    Returns a list of (images, labels) pairs; images are (N, 128, 128) uint8.
+    """
+    manifest = manifest or load_manifest(dest)
+    shards = []
+    for shard in manifest['splits'][split]['shards']:
+        images = np.load(os.path.join(dest, shard['images']), mmap_mode='r')
+        labels = np.load(os.path.join(dest, shard['labels']), mmap_mode='r')
+        shards.append((images, labels))
+    return shards
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _walk_images(folder):
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, file)
+
+
+def _clear_shards(dest):
+    for name in os.listdir(dest):
+        if name == MANIFEST_NAME or (name.endswith('.npy') and name.split('-', 1)[0] in SPLITS):
+            os.remove(os.path.join(dest, name))
+
+
+def _labeler_version(labeler):
+    if labeler == 'cnn':
+        from apps.handwriting import cnn
+        return cnn.model_version()
+    if labeler == 'heuristics':
+        from apps.handwriting.utils import HEURISTICS_VERSION
+        return HEURISTICS_VERSION
+    return None
+
+
+def _init_worker(labeler):
+    if labeler == 'cnn':
+        from apps.handwriting import cnn
+        if cnn.get_engine() is None:
+            raise RuntimeError("CNN labeler requested but no handwriting model could be loaded")
+
+
+def _process_chunk(args):
+    """Decode, preprocess and label one chunk. Runs in a worker process."""
+    from apps.handwriting import cnn, preprocess
+    from apps.handwriting.utils import CLASSES as STYLE_CLASSES, HEURISTIC_SIZE, classify_heuristics_batch
+
+    chunk, labeler, min_confidence = args
+    kept, tensors, heuristic_inputs = [], [], []
+    skipped = 0
+    for path, label, split in chunk:
+        with open(path, 'rb') as f:
+            image = preprocess.prepare(f)
+        if image is None:
+            skipped += 1
+            continue
+        kept.append((label, split))
+        tensors.append(cnn.preprocess(image))
+        if labeler == 'heuristics':
+            heuristic_inputs.append(np.array(image.gray_resized(HEURISTIC_SIZE)))
+
+    if labeler == 'folders':
+        predictions = [(None, 1.0)] * len(kept)
+    elif labeler == 'cnn':
+        predictions = cnn.predict_batch(tensors) if tensors else []
+    else:
+        predictions = classify_heuristics_batch(heuristic_inputs, verbose=False) if heuristic_inputs else []
+
+    results = []
+    for (label, split), tensor, (style, confidence) in zip(kept, tensors, predictions):
+        if label is None:
+            if confidence < min_confidence:
+                skipped += 1
+                continue
+            label = STYLE_CLASSES.index(style)
+        results.append((split, tensor, label))
+    return results, skipped
+
+
+class _ShardWriter:
+    """Buffers one split and writes it out `shard_size` images at a time."""
+
+    def __init__(self, dest, split, shard_size):
+        self.dest = dest
+        self.split = split
+        self.shard_size = shard_size
+        self.images = []
+        self.labels = []
+        self.shards = []
+        self.class_counts = [0] * len(CLASSES)
+
+    def add(self, tensor, label):
+        self.images.append(tensor)
+        self.labels.append(label)
+        self.class_counts[label] += 1
+        if len(self.images) >= self.shard_size:
+            self._write()
+
+    def close(self):
+        if self.images:
+            self._write()
+        return {
+            'count': sum(s['count'] for s in self.shards),
+            'class_counts': dict(zip(CLASSES, self.class_counts)),
+            'shards': self.shards,
+        }
+
+    def _write(self):
+        stem = f"{self.split}-{len(self.shards):05d}"
+        images_name, labels_name = f"{stem}.npy", f"{stem}-labels.npy"
+        np.save(os.path.join(self.dest, images_name), np.stack(self.images).astype(np.uint8))
+        np.save(os.path.join(self.dest, labels_name), np.asarray(self.labels, dtype=np.int64))
+        self.shards.append({'images': images_name, 'labels': labels_name, 'count': len(self.images)})
+        self.images, self.labels = [], []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a sharded handwriting dataset for train_cnn.py")
+    parser.add_argument('--source', default=SOURCE_DIR, help="Folder of images to label")
+    parser.add_argument('--dest', default=DEST_DIR, help="Output folder for shards and manifest.json")
+    parser.add_argument('--labeler', choices=['heuristics', 'cnn', 'folders'], default='heuristics')
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--test-split', type=float, default=TEST_SPLIT)
+    parser.add_argument('--min-confidence', type=float, default=0.0,
+                        help="Drop images the labeler is less sure about than this")
+    args = parser.parse_args()
+    build(args.source, args.dest, args.labeler, args.workers,
+          args.shard_size, args.test_split, args.min_confidence)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,14 @@
-import os
-import django
-import random
-
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'paperly_project.settings')
-django.setup()
-
-from django.contrib.auth import get_user_model
-User = get_user_model()
+import datetime
+import uuid
+from passlib.hash import pbkdf2_sha256
+from database.repositories.users import UserRepository
 
 writers_data = [
     {
         "email": "alan@writer.com",
         "first_name": "Alan",
         "last_name": "Turing",
-        "role": "provider",
+        "role": "WRITER",
         "bio": "Expert in Computer Science and Cryptography.",
         "address": "Bletchley Park, UK"
     },
@@ -21,7 +16,7 @@ writers_data = [
         "email": "ada@writer.com",
         "first_name": "Ada",
         "last_name": "Lovelace",
-        "role": "provider",
+        "role": "WRITER",
         "bio": "Specialized in Analytical Engine programming and Mathematics.",
         "address": "London, UK"
     },
@@ -29,32 +24,36 @@ writers_data = [
         "email": "grace@writer.com",
         "first_name": "Grace",
         "last_name": "Hopper",
-        "role": "provider",
+        "role": "WRITER",
         "bio": "Pioneer in COBOL and compiler design.",
         "address": "Arlington, Virginia"
     }
 ]
 
-created_count = 0
+existing_emails = {(u.get('email') or '').lower() for u in UserRepository.list_all()}
+
+new_users = []
 for data in writers_data:
-    if not User.objects.filter(email=data["email"]).exists():
-        user = User.objects.create_user(
-            username=data["email"],
-            email=data["email"],
-            password="password123",
-            first_name=data["first_name"],
-            last_name=data["last_name"],
-            role=data["role"],
-            address=data["address"]
-            # is_verified=True # Assuming model has this, checking types.ts it does, but checking backend model... 
-            # I can't be sure if backend model has is_verified without checking, but sticking to basics.
-        )
-        print(f"Created writer: {user.email}")
-        created_count += 1
-    else:
+    if data["email"].lower() in existing_emails:
         print(f"Writer already exists: {data['email']}")
+        continue
+    new_users.append({
+        'id': str(uuid.uuid4()),
+        'email': data["email"],
+        'username': data["email"],
+        'password': pbkdf2_sha256.hash("password123"),
+        'name': f"{data['first_name']} {data['last_name']}",
+        'role': data["role"],
+        'address': data["address"],
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    })
+
+# Single multi-row insert instead of one round trip per writer
+created = UserRepository.bulk_create(new_users)
+for user in created:
+    print(f"Created writer: {user['email']}")
 
 print(f"--------------------------------")
-print(f"Successfully added {created_count} writers.")
-print(f"Total Users: {User.objects.count()}")
+print(f"Successfully added {len(created)} writers.")
+print(f"Total Users: {len(UserRepository.list_all())}")
 print(f"--------------------------------")
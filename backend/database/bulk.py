@@ -0,0 +1,97 @@
+"""
+Bulk Query Helpers
+------------------
+Chunked multi-row operations shared by the repositories' `bulk_create`,
+`bulk_update` and `get_many` methods. Each chunk is one round trip:
+a multi-row INSERT, an `in_()` filtered SELECT, or one call to the
+`bulk_update` Postgres function (see database/bulk_update.sql).
+
+`BulkTable` wraps the three for one table and its row mapping; each
+repository keeps one and delegates to it. With no database connected it
+behaves like the repositories' other methods (reads and updates find
+nothing, creates raise); a repository with a mock backend checks
+`supabase` itself first.
+"""
+
+import os
+from database.connection import supabase
+
+# Rows per round trip. Reads put ids in the URL, so keep this moderate.
+BULK_BATCH_SIZE = int(os.environ.get('DB_BULK_BATCH_SIZE', '200'))
+
+
+def chunked(items: list, batch_size: int = None):
+    size = max(1, batch_size or BULK_BATCH_SIZE)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def insert_many(table: str, rows: list[dict], batch_size: int = None) -> list[dict]:
+    """INSERT rows in chunks. Returns the inserted DB rows."""
+    inserted = []
+    for chunk in chunked(rows, batch_size):
+        # Columns a row leaves out get their DB default instead of NULL
+        result = supabase.table(table).insert(chunk, default_to_null=False).execute()
+        inserted.extend(result.data or [])
+    return inserted
+
+
+def update_many(table: str, rows: list[dict], batch_size: int = None) -> int:
+    """
+    Apply partial updates in chunks. Each row must carry `id`; columns it
+    does not mention keep their value. Returns the number of rows updated.
+    """
+    updated = 0
+    for chunk in chunked(rows, batch_size):
+        result = supabase.rpc('bulk_update', {'p_table': table, 'p_rows': chunk}).execute()
+        updated += result.data or 0
+    return updated
+
+
+def select_many(table: str, ids: list, batch_size: int = None, column: str = 'id',
+                columns: str = '*') -> list[dict]:
+    """SELECT `columns` of rows whose `column` is in `ids`, one `in_()` query per chunk."""
+    unique_ids = list(dict.fromkeys(i for i in ids if i is not None))
+    rows = []
+    for chunk in chunked(unique_ids, batch_size):
+        result = supabase.table(table).select(columns).in_(column, chunk).execute()
+        rows.extend(result.data or [])
+    return rows
+
+
+class BulkTable:
+    """Bulk operations on one table, mapped with a repository's `_to_row` and formatter."""
+
+    def __init__(self, table: str, to_row, format_row, select_clause=None):
+        self.table = table
+        self.to_row = to_row
+        self.format_row = format_row
+        # Repositories supporting `fields=` pass their select-clause builder;
+        # their formatter then takes the fields too
+        self.select_clause = select_clause
+
+    def get_many(self, ids: list, batch_size: int = None, fields: list = None) -> dict:
+        """Rows by primary key, formatted. Returns {id: row}; unknown ids are left out."""
+        if not supabase or not ids:
+            return {}
+        if self.select_clause is None:
+            rows = select_many(self.table, ids, batch_size)
+            return {row['id']: self.format_row(row) for row in rows}
+        rows = select_many(self.table, ids, batch_size, columns=self.select_clause(fields))
+        return {row['id']: self.format_row(row, fields) for row in rows}
+
+    def create(self, items: list[dict], batch_size: int = None) -> list[dict]:
+        """Insert app-level dicts. Returns the created rows, formatted."""
+        if not items:
+            return []
+        if not supabase:
+            raise Exception("Database not connected")
+        rows = insert_many(self.table, [self.to_row(item) for item in items], batch_size)
+        return [self.format_row(row) for row in rows]
+
+    def update(self, updates: dict, batch_size: int = None) -> int:
+        """Apply {id: fields} partial updates. Returns the number of rows updated."""
+        if not supabase or not updates:
+            return 0
+        rows = [{**self.to_row(fields), 'id': row_id} for row_id, fields in updates.items()]
+        return update_many(self.table, rows, batch_size)
@@ -0,0 +1,47 @@
+-- ==============================================================================
+-- BULK PARTIAL UPDATES
+-- ==============================================================================
+-- Description:
+-- Applies many partial row updates to one table in a single statement.
+-- `p_rows` is a JSON array of objects, each with an `id` and any subset of
+-- the table's columns; columns missing from an object keep their current
+-- value (jsonb_populate_record fills them from the existing row).
+--
+-- A PostgREST upsert cannot be used for this: its INSERT half trips the
+-- NOT NULL constraints when only a few columns are sent.
+--
+-- Called from the repositories' `bulk_update` (database/bulk.py) via
+-- `supabase.rpc('bulk_update', ...)`. Returns the number of rows updated.
+-- ==============================================================================
+
+CREATE OR REPLACE FUNCTION public.bulk_update(p_table text, p_rows jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  cols text;
+  updated integer;
+BEGIN
+  IF p_table NOT IN ('users', 'assignments', 'notifications', 'messages',
+                     'transactions', 'announcements') THEN
+    RAISE EXCEPTION 'Unsupported table: %', p_table;
+  END IF;
+
+  SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position)
+    INTO cols
+    FROM information_schema.columns
+   WHERE table_schema = 'public'
+     AND table_name = p_table
+     AND column_name <> 'id';
+
+  EXECUTE format(
+    'UPDATE public.%1$I AS t
+        SET (%2$s) = (SELECT %2$s FROM jsonb_populate_record(t, r.item))
+       FROM jsonb_array_elements($1) AS r(item)
+      WHERE t.id = (jsonb_populate_record(NULL::public.%1$I, r.item)).id', p_table, cols)
+    USING p_rows;
+
+  GET DIAGNOSTICS updated = ROW_COUNT;
+  RETURN updated;
+END;
+$$;
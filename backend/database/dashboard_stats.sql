@@ -0,0 +1,36 @@
+-- ==============================================================================
+-- ADMIN DASHBOARD AGGREGATES
+-- ==============================================================================
+-- Description:
+-- Computes the admin dashboard counters inside Postgres so the Django backend
+-- no longer pulls the full `users` and `assignments` tables to count them.
+--
+-- Called from StatsRepository via `supabase.rpc('dashboard_stats')`. If this
+-- function has not been installed yet, the repository falls back to
+-- count-only queries, so running this script is an optimization, not a
+-- requirement.
+-- ==============================================================================
+
+CREATE OR REPLACE FUNCTION public.dashboard_stats()
+RETURNS TABLE (
+  total_users bigint,
+  active_users bigint,
+  active_assignments bigint,
+  total_revenue numeric
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    (SELECT count(*) FROM public.users),
+    (SELECT count(*) FROM public.users
+       WHERE upper(coalesce(role, '')) <> 'ADMIN'),
+    (SELECT count(*) FROM public.assignments
+       WHERE status IS NOT NULL AND status NOT IN ('COMPLETED', 'CANCELLED')),
+    (SELECT coalesce(sum(budget), 0) FROM public.assignments);
+$$;
+
+-- Partial index so the active-assignment count stays an index-only scan
+CREATE INDEX IF NOT EXISTS assignments_active_status_idx
+  ON public.assignments (status)
+  WHERE status IS NOT NULL AND status NOT IN ('COMPLETED', 'CANCELLED');
@@ -0,0 +1,240 @@
+"""
+Mock User Store
+---------------
+In-memory stand-in for the `users` table used when Supabase is not
+configured (local development, CI and staging fallback).
+
+The JSON file is parsed once and kept in memory with hash indexes on
+email and username. Writes are recorded in a write-behind journal and
+flushed to disk in batches with an atomic rename. If the file is edited
+by something else, the next access reloads it and replays any journal
+entries that have not been flushed yet.
+
+Several worker processes may share the file: a flush takes an exclusive
+lock on `<path>.lock`, re-reads the file and replays this process's journal
+onto it before writing, so other workers' flushed edits are kept.
+"""
+
+import atexit
+import contextlib
+import copy
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+FLUSH_DELAY_SECONDS = float(os.environ.get('MOCK_DB_FLUSH_DELAY', '0.5'))
+
+_DELETED = object()
+
+
+class MockUserStore:
+
+    def __init__(self, path, flush_delay: float = FLUSH_DELAY_SECONDS):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._doc = {}
+        self._users = {}
+        self._by_email = {}
+        self._by_username = {}
+        self._journal = []
+        self._mtime = None
+        self._loaded = False
+        self._timer = None
+        atexit.register(self.flush)
+
+    # ─── Reads ────────────────────────────────────────────────────────
+
+    def get(self, user_id: str) -> dict | None:
+        with self._lock:
+            self._sync()
+            return self._copy(user_id)
+
+    def find_by_email(self, email: str) -> dict | None:
+        with self._lock:
+            self._sync()
+            return self._copy(self._by_email.get((email or '').lower()))
+
+    def find_by_username(self, username: str) -> dict | None:
+        with self._lock:
+            self._sync()
+            return self._copy(self._by_username.get((username or '').lower()))
+
+    def values(self) -> list[dict]:
+        with self._lock:
+            self._sync()
+            return [copy.deepcopy(u) for u in self._users.values()]
+
+    # ─── Writes ───────────────────────────────────────────────────────
+
+    def put(self, user_id: str, user: dict) -> dict:
+        with self._lock:
+            self._sync()
+            self._apply(user_id, copy.deepcopy(user))
+            return copy.deepcopy(user)
+
+    def update(self, user_id: str, updates: dict) -> dict | None:
+        with self._lock:
+            self._sync()
+            if user_id not in self._users:
+                return None
+            user = copy.deepcopy(self._users[user_id])
+            user.update(copy.deepcopy(updates))
+            self._apply(user_id, user)
+            return copy.deepcopy(user)
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._sync()
+            if user_id in self._users:
+                self._apply(user_id, _DELETED)
+
+    def append_to_array(self, user_id: str, field: str, value, max_length: int = None) -> list | None:
+        """Same contract as the `users_array_append` Postgres function; returns the new array."""
+        with self._lock:
+            self._sync()
+            if user_id not in self._users:
+                return None
+            user = copy.deepcopy(self._users[user_id])
+            arr = user.get(field) or []
+            if value in arr or (max_length is not None and len(arr) >= max_length):
+                return list(arr)
+            arr.append(value)
+            user[field] = arr
+            self._apply(user_id, user)
+            return list(arr)
+
+    def remove_from_array(self, user_id: str, field: str, value) -> list | None:
+        with self._lock:
+            self._sync()
+            if user_id not in self._users:
+                return None
+            user = copy.deepcopy(self._users[user_id])
+            arr = user.get(field) or []
+            if value in arr:
+                arr.remove(value)
+            user[field] = arr
+            self._apply(user_id, user)
+            return list(arr)
+
+    def flush(self) -> None:
+        """Write pending journal entries to disk (atomic rename)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._journal:
+                return
+            try:
+                with self._file_lock():
+                    # Start from what is on disk now, not what this process last read
+                    self._sync(force=True)
+                    doc = dict(self._doc)
+                    doc['users'] = self._users
+                    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(doc, f, indent=4)
+                    os.replace(tmp_path, self.path)
+                    self._mtime = os.stat(self.path).st_mtime_ns
+                    self._journal.clear()
+            except Exception as e:
+                print("[MockUserStore] Error saving mock_firestore_db.json:", e)
+
+    # ─── Internal Helpers ─────────────────────────────────────────────
+
+    def _copy(self, user_id) -> dict | None:
+        user = self._users.get(user_id)
+        return copy.deepcopy(user) if user is not None else None
+
+    def _apply(self, user_id: str, user) -> None:
+        """Apply a change in memory, journal it and schedule a flush."""
+        self._journal.append((user_id, user))
+        self._set(user_id, user)
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _set(self, user_id: str, user) -> None:
+        old = self._users.get(user_id)
+        if user is _DELETED:
+            self._users.pop(user_id, None)
+        else:
+            self._users[user_id] = user
+        old_keys = _index_keys(old)
+        if old_keys != _index_keys(None if user is _DELETED else user):
+            if old is not None:
+                # Another user may share the old email/username; rebuild to keep first-wins order
+                self._reindex()
+            else:
+                self._index(user_id, user)
+
+    def _index(self, user_id: str, user: dict) -> None:
+        email, username = _index_keys(user)
+        if email:
+            self._by_email.setdefault(email, user_id)
+        if username:
+            self._by_username.setdefault(username, user_id)
+
+    def _reindex(self) -> None:
+        self._by_email = {}
+        self._by_username = {}
+        for user_id, user in self._users.items():
+            self._index(user_id, user)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared with the other processes using the file."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self, force: bool = False) -> None:
+        """Load on first use, and reload if the file changed on disk (or `force`)."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._loaded and mtime == self._mtime and not force:
+            return
+
+        doc = {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+            except Exception as e:
+                print("[MockUserStore] Error reading mock_firestore_db.json:", e)
+                if self._loaded or force:
+                    # Keep serving the in-memory copy rather than dropping it
+                    return
+
+        self._doc = doc
+        self._users = dict(doc.get("users", {}))
+        self._mtime = mtime
+        self._loaded = True
+        # Replay writes that have not reached the file yet
+        for user_id, user in self._journal:
+            if user is _DELETED:
+                self._users.pop(user_id, None)
+            else:
+                self._users[user_id] = user
+        self._reindex()
+
+
+def _index_keys(user) -> tuple:
+    if not user:
+        return (None, None)
+    return ((user.get('email') or '').lower() or None,
+            (user.get('username') or '').lower() or None)
@@ -4,6 +4,7 @@ Announcement Repository
 All database operations for the `announcements` table.
 """
 
+from database.bulk import BulkTable
 from database.connection import supabase
 
 
@@ -20,6 +21,21 @@ class AnnouncementRepository:
             return _format_announcement(result.data[0])
         raise Exception("Failed to create announcement")
 
+    @staticmethod
+    def get_many(announcement_ids: list, batch_size: int = None) -> dict:
+        """Fetch many announcements by primary key. Returns {id: announcement}; unknown ids are left out."""
+        return _bulk.get_many(announcement_ids, batch_size)
+
+    @staticmethod
+    def bulk_create(items: list[dict], batch_size: int = None) -> list[dict]:
+        """Insert many announcements, `batch_size` rows per round trip."""
+        return _bulk.create(items, batch_size)
+
+    @staticmethod
+    def bulk_update(updates: dict, batch_size: int = None) -> int:
+        """Apply {announcement id: fields} partial updates. Returns the number of rows updated."""
+        return _bulk.update(updates, batch_size)
+
     @staticmethod
     def list_all() -> list[dict]:
         """List all announcements ordered by created_at desc."""
@@ -73,3 +89,6 @@ def _format_announcement(row: dict) -> dict:
     }
     result.update(extra)
     return result
+
+
+_bulk = BulkTable('announcements', _to_row, _format_announcement)
@@ -4,19 +4,26 @@ Assignment Repository
 All database operations for the `assignments` table.
 """
 
+import base64
+import json
+from database.bulk import BulkTable
 from database.connection import supabase
+from database.repositories.stats import StatsRepository
 
 
 class AssignmentRepository:
 
     @staticmethod
-    def get_by_id(assignment_id: str) -> dict | None:
-        """Fetch a single assignment by primary key."""
+    def get_by_id(assignment_id: str, fields: list = None) -> dict | None:
+        """
+        Fetch a single assignment by primary key.
+        `fields` limits the columns fetched and the keys returned (default: all).
+        """
         if not supabase:
             return None
-        result = supabase.table('assignments').select('*').eq('id', assignment_id).execute()
+        result = supabase.table('assignments').select(_select_clause(fields)).eq('id', assignment_id).execute()
         if result.data:
-            return _format_assignment(result.data[0])
+            return _format_assignment(result.data[0], fields)
         return None
 
     @staticmethod
@@ -27,6 +34,7 @@ class AssignmentRepository:
         row = _to_row(data)
         result = supabase.table('assignments').insert(row).execute()
         if result.data:
+            StatsRepository.invalidate()
             return _format_assignment(result.data[0])
         raise Exception("Failed to create assignment")
 
@@ -38,6 +46,7 @@ class AssignmentRepository:
         row_updates = _to_row(updates)
         result = supabase.table('assignments').update(row_updates).eq('id', assignment_id).execute()
         if result.data:
+            StatsRepository.invalidate()
             return _format_assignment(result.data[0])
         return None
 
@@ -47,35 +56,91 @@ class AssignmentRepository:
         if not supabase:
             return
         supabase.table('assignments').delete().eq('id', assignment_id).execute()
+        StatsRepository.invalidate()
+
+    @staticmethod
+    def get_many(assignment_ids: list, batch_size: int = None, fields: list = None) -> dict:
+        """Fetch many assignments by primary key. Returns {id: assignment}; unknown ids are left out."""
+        return _bulk.get_many(assignment_ids, batch_size, fields)
 
     @staticmethod
-    def list_all() -> list[dict]:
+    def bulk_create(items: list[dict], batch_size: int = None) -> list[dict]:
+        """Insert many assignments, `batch_size` rows per round trip."""
+        created = _bulk.create(items, batch_size)
+        if created:
+            StatsRepository.invalidate()
+        return created
+
+    @staticmethod
+    def bulk_update(updates: dict, batch_size: int = None) -> int:
+        """Apply {assignment id: fields} partial updates. Returns the number of rows updated."""
+        updated = _bulk.update(updates, batch_size)
+        if updated:
+            StatsRepository.invalidate()
+        return updated
+
+    @staticmethod
+    def list_all(fields: list = None) -> list[dict]:
         """List all assignments, ordered by created_at descending."""
         if not supabase:
             return []
-        result = supabase.table('assignments').select('*').order('created_at', desc=True).execute()
-        return [_format_assignment(row) for row in (result.data or [])]
+        result = supabase.table('assignments').select(_select_clause(fields)).order('created_at', desc=True).execute()
+        return [_format_assignment(row, fields) for row in (result.data or [])]
+
+    @staticmethod
+    def list_visible(user_id: str = None, role: str = None, writer_style: str = None,
+                     assignment_type: str = None, status: str = None,
+                     limit: int = None, cursor: str = None, fields: list = None):
+        """
+        List assignments the given user is allowed to see, with every visibility
+        predicate evaluated by Postgres instead of in Python.
+
+        Ordered by (created_at, id) descending. When `limit` is set, results are
+        keyset-paginated and `cursor` continues from a previous page.
+        `fields` limits the columns fetched and the keys returned (default: all).
+        Returns (rows: list[dict], next_cursor: str | None).
+        """
+        if not supabase:
+            return [], None
+
+        query = supabase.table('assignments').select(_select_clause(fields))
+        if assignment_type:
+            query = query.eq('assignment_type', assignment_type)
+        if status:
+            query = query.eq('status', status)
+
+        conditions = [_visibility_filter(user_id, role, writer_style)]
+        if cursor:
+            conditions.append(_cursor_filter(cursor))
+        query = query.or_(f"and({','.join(conditions)})")
+
+        query = query.order('created_at', desc=True).order('id', desc=True)
+        if limit:
+            # Fetch one extra row to learn whether another page exists
+            query = query.limit(limit + 1)
+
+        result = query.execute()
+        rows = result.data or []
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1])
+
+        return [_format_assignment(row, fields) for row in rows], next_cursor
 
     @staticmethod
     def atomic_accept(assignment_id: str, writer_id: str):
         """
         Atomically accept an assignment: only succeeds if status is still PENDING.
-        Returns (success: bool, error_msg: str | None).
+        A single conditional UPDATE ... RETURNING; only when it matches no row
+        is the id looked up, to tell a lost race from an unknown assignment.
+        Returns (assignment: dict | None, error_msg: str | None).
         """
         if not supabase:
-            return False, "Database not connected"
+            return None, "Database not connected"
 
         import datetime
-        # Read current status
-        result = supabase.table('assignments').select('status').eq('id', assignment_id).execute()
-        if not result.data:
-            return False, 'Assignment not found'
-
-        current_status = result.data[0].get('status')
-        if current_status != 'PENDING':
-            return False, 'Assignment already accepted.'
-
-        # Update only if still PENDING (optimistic concurrency)
         accepted_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
         update_result = supabase.table('assignments').update({
             'status': 'ASSIGNED',
@@ -84,8 +149,13 @@ class AssignmentRepository:
         }).eq('id', assignment_id).eq('status', 'PENDING').execute()
 
         if update_result.data:
-            return True, None
-        return False, 'Assignment already accepted.'
+            StatsRepository.invalidate()
+            return _format_assignment(update_result.data[0]), None
+
+        exists = supabase.table('assignments').select('id').eq('id', assignment_id).limit(1).execute()
+        if not exists.data:
+            return None, 'Assignment not found'
+        return None, 'Assignment already accepted.'
 
 
 # ─── Internal Helpers ─────────────────────────────────────────────────
@@ -134,6 +204,65 @@ _FIELD_MAP = {
 _KNOWN_COLUMNS = set(_FIELD_MAP.values())
 
 
+def _select_clause(fields: list = None) -> str:
+    """PostgREST select list for the requested app-level fields ('*' for all)."""
+    if not fields:
+        return '*'
+    # id and created_at are always needed for ordering and cursors
+    columns = {'id', 'created_at'}
+    for field in fields:
+        col = _FIELD_MAP.get(field)
+        # Unknown fields live in extra_data
+        columns.add(col if col else 'extra_data')
+    return ','.join(sorted(columns))
+
+
+def _quote(value) -> str:
+    """Quote a value for use inside a PostgREST logic tree (or/and)."""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def _visibility_filter(user_id: str = None, role: str = None, writer_style: str = None) -> str:
+    """
+    Build the PostgREST expression for the rows a user may see:
+    - DIRECT assignments only for the assigned writer or the owning student.
+    - SELECTED_STYLES assignments only for writers whose style is preferred.
+    """
+    not_direct = "or(assignment_type.is.null,assignment_type.neq.DIRECT)"
+
+    if role == 'WRITER':
+        style_terms = ["visibility.is.null", "visibility.neq.SELECTED_STYLES"]
+        if writer_style:
+            style_terms.append(f"preferred_handwriting_styles.cs.{{{_quote(writer_style)}}}")
+        marketplace = f"and({not_direct},or({','.join(style_terms)}))"
+    else:
+        marketplace = not_direct
+
+    if not user_id:
+        return f"or({marketplace})"
+
+    uid = _quote(user_id)
+    direct = f"and(assignment_type.eq.DIRECT,or(assigned_writer_id.eq.{uid},student_id.eq.{uid}))"
+    return f"or({marketplace},{direct})"
+
+
+def _encode_cursor(row: dict) -> str:
+    """Encode the (created_at, id) keyset of a raw DB row as an opaque token."""
+    raw = json.dumps([row.get('created_at'), row.get('id')])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _cursor_filter(cursor: str) -> str:
+    """PostgREST expression selecting rows strictly after the cursor position."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    ts = _quote(created_at)
+    return f"or(created_at.lt.{ts},and(created_at.eq.{ts},id.lt.{_quote(row_id)}))"
+
+
 def _to_row(data: dict) -> dict:
     """Convert app-level data dict to DB row, putting unknown fields into extra_data."""
     row = {}
@@ -152,8 +281,11 @@ def _to_row(data: dict) -> dict:
     return row
 
 
-def _format_assignment(row: dict) -> dict:
-    """Convert a DB row back to the camelCase dict shape the frontend expects."""
+def _format_assignment(row: dict, fields: list = None) -> dict:
+    """
+    Convert a DB row back to the camelCase dict shape the frontend expects
+    (only `fields`, if given).
+    """
     if not row:
         return None
     extra = row.get('extra_data') or {}
@@ -184,4 +316,9 @@ def _format_assignment(row: dict) -> dict:
     }
     # Merge extra_data back into the result (preserves dynamic frontend fields)
     result.update(extra)
+    if fields:
+        return {f: result[f] for f in fields if f in result}
     return result
+
+
+_bulk = BulkTable('assignments', _to_row, _format_assignment, _select_clause)
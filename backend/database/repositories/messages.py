@@ -4,6 +4,7 @@ Message Repository
 All database operations for the `messages` table.
 """
 
+from database.bulk import BulkTable
 from database.connection import supabase
 
 
@@ -20,6 +21,21 @@ class MessageRepository:
             return _format_message(result.data[0])
         raise Exception("Failed to create message")
 
+    @staticmethod
+    def get_many(message_ids: list, batch_size: int = None) -> dict:
+        """Fetch many messages by primary key. Returns {id: message}; unknown ids are left out."""
+        return _bulk.get_many(message_ids, batch_size)
+
+    @staticmethod
+    def bulk_create(items: list[dict], batch_size: int = None) -> list[dict]:
+        """Insert many messages, `batch_size` rows per round trip."""
+        return _bulk.create(items, batch_size)
+
+    @staticmethod
+    def bulk_update(updates: dict, batch_size: int = None) -> int:
+        """Apply {message id: fields} partial updates. Returns the number of rows updated."""
+        return _bulk.update(updates, batch_size)
+
     @staticmethod
     def list_filtered(sender_id: str = None, receiver_id: str = None) -> list[dict]:
         """List messages with optional sender/receiver filters, ordered by timestamp desc."""
@@ -80,3 +96,6 @@ def _format_message(row: dict) -> dict:
     }
     result.update(extra)
     return result
+
+
+_bulk = BulkTable('messages', _to_row, _format_message)
@@ -4,6 +4,7 @@ Notification Repository
 All database operations for the `notifications` table.
 """
 
+from database.bulk import BulkTable
 from database.connection import supabase
 
 
@@ -20,6 +21,21 @@ class NotificationRepository:
             return _format_notification(result.data[0])
         raise Exception("Failed to create notification")
 
+    @staticmethod
+    def get_many(notification_ids: list, batch_size: int = None) -> dict:
+        """Fetch many notifications by primary key. Returns {id: notification}; unknown ids are left out."""
+        return _bulk.get_many(notification_ids, batch_size)
+
+    @staticmethod
+    def bulk_create(items: list[dict], batch_size: int = None) -> list[dict]:
+        """Insert many notifications, `batch_size` rows per round trip."""
+        return _bulk.create(items, batch_size)
+
+    @staticmethod
+    def bulk_update(updates: dict, batch_size: int = None) -> int:
+        """Apply {notification id: fields} partial updates. Returns the number of rows updated."""
+        return _bulk.update(updates, batch_size)
+
     @staticmethod
     def list_by_user(user_id: str) -> list[dict]:
         """List notifications for a specific user, ordered by timestamp desc."""
@@ -76,3 +92,6 @@ def _format_notification(row: dict) -> dict:
         'isRead': row.get('is_read', False),
         'timestamp': row.get('timestamp'),
     }
+
+
+_bulk = BulkTable('notifications', _to_row, _format_notification)
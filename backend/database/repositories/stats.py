@@ -0,0 +1,136 @@
+"""
+Stats Repository
+----------------
+Database-side aggregates for the admin dashboard.
+
+The computed numbers are kept as an in-process snapshot that is refreshed
+after DASHBOARD_STATS_TTL seconds, or sooner when a user or assignment
+write marks it stale.
+"""
+
+import os
+import threading
+import time
+from database.connection import supabase
+
+SNAPSHOT_TTL_SECONDS = float(os.environ.get('DASHBOARD_STATS_TTL', '60'))
+
+_snapshot = None
+_snapshot_at = 0.0
+# Bumped by every invalidate(); a compute that raced one is not stored
+_generation = 0
+_lock = threading.Lock()
+
+
+class StatsRepository:
+
+    @staticmethod
+    def dashboard() -> dict:
+        """Return dashboard counters, served from the snapshot while it is fresh."""
+        global _snapshot, _snapshot_at
+        with _lock:
+            if _snapshot is not None and time.monotonic() - _snapshot_at < SNAPSHOT_TTL_SECONDS:
+                return dict(_snapshot)
+            generation = _generation
+
+        stats = _compute_stats()
+
+        with _lock:
+            if generation == _generation:
+                _snapshot = stats
+                _snapshot_at = time.monotonic()
+        return dict(stats)
+
+    @staticmethod
+    def invalidate() -> None:
+        """Mark the snapshot stale so the next read recomputes it."""
+        global _snapshot, _generation
+        with _lock:
+            _snapshot = None
+            _generation += 1
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _compute_stats() -> dict:
+    if supabase:
+        try:
+            result = supabase.rpc('dashboard_stats').execute()
+            data = result.data
+            row = data[0] if isinstance(data, list) and data else data
+            if row:
+                return _format_stats(row)
+        except Exception as e:
+            print(f"[StatsRepository] dashboard_stats RPC failed, using count queries: {e}")
+        try:
+            return _compute_with_counts()
+        except Exception as e:
+            print(f"[StatsRepository] Supabase count queries failed: {e}")
+    return _compute_from_mock()
+
+
+def _count(table: str, build=None) -> int:
+    """Run a head-only `count=exact` query; no rows are transferred."""
+    query = supabase.table(table).select('id', count='exact', head=True)
+    if build:
+        query = build(query)
+    return query.execute().count or 0
+
+
+def _compute_with_counts() -> dict:
+    total_users = _count('users')
+    non_admin = _count('users', lambda q: q.or_('role.is.null,role.not.ilike.admin'))
+    active_assignments = _count(
+        'assignments',
+        lambda q: q.not_.is_('status', 'null').not_.in_('status', ['COMPLETED', 'CANCELLED']),
+    )
+    return _format_stats({
+        'total_users': total_users,
+        'active_users': non_admin,
+        'active_assignments': active_assignments,
+        'total_revenue': _sum_budgets(),
+    })
+
+
+def _sum_budgets():
+    """
+    Revenue as a PostgREST aggregate (one row back). None if aggregates are
+    disabled: downloading every budget would be O(table) and silently
+    truncated at the server's max-rows.
+    """
+    try:
+        result = supabase.table('assignments').select('budget.sum()').execute()
+    except Exception as e:
+        print(f"[StatsRepository] budget.sum() aggregate failed, revenue unavailable: {e}")
+        return None
+    row = (result.data or [{}])[0]
+    return row.get('sum') or 0
+
+
+def _compute_from_mock() -> dict:
+    """Local/fallback mode: users live in the mock store, assignments are unavailable."""
+    from database.repositories.users import UserRepository
+    users = UserRepository.list_all()
+    return _format_stats({
+        'total_users': len(users),
+        'active_users': len([u for u in users if (u.get('role') or '').upper() != 'ADMIN']),
+        'active_assignments': 0,
+        'total_revenue': 0,
+    })
+
+
+def _format_stats(row: dict) -> dict:
+    total_users = int(row.get('total_users') or 0)
+    # None means revenue could not be aggregated; it is passed through as-is
+    revenue = row.get('total_revenue')
+    if isinstance(revenue, str):
+        revenue = float(revenue)
+    if isinstance(revenue, float) and revenue.is_integer():
+        revenue = int(revenue)
+    return {
+        'total_users': total_users,
+        # Preserve the previous behaviour: fall back to the total when nobody is non-admin
+        'active_users': int(row.get('active_users') or 0) or total_users,
+        'active_assignments': int(row.get('active_assignments') or 0),
+        'total_revenue': revenue,
+    }
@@ -4,6 +4,7 @@ Transaction Repository
 All database operations for the `transactions` table.
 """
 
+from database.bulk import BulkTable
 from database.connection import supabase
 
 
@@ -20,6 +21,21 @@ class TransactionRepository:
             return _format_transaction(result.data[0])
         raise Exception("Failed to create transaction")
 
+    @staticmethod
+    def get_many(transaction_ids: list, batch_size: int = None) -> dict:
+        """Fetch many transactions by primary key. Returns {id: transaction}; unknown ids are left out."""
+        return _bulk.get_many(transaction_ids, batch_size)
+
+    @staticmethod
+    def bulk_create(items: list[dict], batch_size: int = None) -> list[dict]:
+        """Insert many transactions, `batch_size` rows per round trip."""
+        return _bulk.create(items, batch_size)
+
+    @staticmethod
+    def bulk_update(updates: dict, batch_size: int = None) -> int:
+        """Apply {transaction id: fields} partial updates. Returns the number of rows updated."""
+        return _bulk.update(updates, batch_size)
+
 
 # ─── Internal Helpers ─────────────────────────────────────────────────
 
@@ -56,3 +72,6 @@ def _format_transaction(row: dict) -> dict:
         'status': row.get('status'),
         'createdAt': row.get('created_at'),
     }
+
+
+_bulk = BulkTable('transactions', _to_row, _format_transaction)
@@ -4,45 +4,94 @@ User Repository
 All database operations for the `users` table.
 """
 
-import json
+import copy
+import functools
+import os
+import threading
 from pathlib import Path
+from database.bulk import BulkTable
 from database.connection import supabase
+from database.mock_store import MockUserStore
+from database.repositories.stats import StatsRepository
+from database.repositories.writers import WriterDirectory
+from utils.cache import TTLCache
+from utils.geo import GeoIndex, parse_coordinates
 
 MOCK_DB_PATH = Path(__file__).resolve().parent.parent.parent / "mock_firestore_db.json"
 
-def _load_mock_users() -> dict:
-    if MOCK_DB_PATH.exists():
+# Process-level identity cache used by JWT-authenticated views
+_user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', '1024')),
+    ttl=float(os.environ.get('USER_CACHE_TTL', '30')),
+)
+# Bumped by every invalidation; a lookup that raced one is not cached
+_user_cache_generation = 0
+_user_cache_lock = threading.Lock()
+
+
+def _invalidates_user_cache(func):
+    """
+    Drop the cached user after a write, whether or not it succeeded, and
+    tell the writer directory which fields it touched: the first argument
+    after the id is an updates dict or a single field name.
+    """
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
         try:
-            with open(MOCK_DB_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return data.get("users", {})
-        except Exception as e:
-            print("[UserRepository] Error reading mock_firestore_db.json:", e)
-    return {}
+            return func(user_id, *args, **kwargs)
+        finally:
+            _forget_cached([user_id])
+            written = args[0] if args else None
+            WriterDirectory.invalidate([user_id], [written] if isinstance(written, str) else written)
+    return wrapper
 
-def _save_mock_users(users: dict):
-    try:
-        data = {"users": users}
-        with open(MOCK_DB_PATH, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
-    except Exception as e:
-        print("[UserRepository] Error saving to mock_firestore_db.json:", e)
+# Spatial index over user coordinates, one per role filter. Writes through
+# this repository rebuild it; other processes pick changes up within the TTL.
+_geo_indexes = TTLCache(maxsize=8, ttl=float(os.environ.get('GEO_INDEX_TTL', '60')))
+_GEO_FIELDS = ('coordinates', 'role')
+
+_mock_store = MockUserStore(MOCK_DB_PATH)
 
 
 class UserRepository:
 
     @staticmethod
-    def get_by_id(user_id: str) -> dict | None:
-        """Fetch a single user by primary key."""
+    def get_by_id(user_id: str, fields: list = None) -> dict | None:
+        """
+        Fetch a single user by primary key.
+        `fields` limits the columns fetched and the keys returned (default: all).
+        """
         if supabase:
             try:
-                result = supabase.table('users').select('*').eq('id', user_id).execute()
+                result = supabase.table('users').select(_select_clause(fields)).eq('id', user_id).execute()
                 if result.data:
-                    return _format_user(result.data[0])
+                    return _format_user(result.data[0], fields)
             except Exception as e:
                 print(f"[UserRepository] Supabase query failed: {e}")
-        users = _load_mock_users()
-        return users.get(user_id)
+        return _project(_mock_store.get(user_id), fields)
+
+    @staticmethod
+    def get_cached(user_id: str) -> dict | None:
+        """
+        Like get_by_id, but served from the process cache when possible.
+        Writes through this repository invalidate the cached entry, but only
+        in this process: other workers may serve it for up to USER_CACHE_TTL
+        seconds, so never use it for role or permission checks.
+        """
+        if not user_id:
+            return None
+        user = _user_cache.get(user_id)
+        if user is None:
+            with _user_cache_lock:
+                generation = _user_cache_generation
+            user = UserRepository.get_by_id(user_id)
+            if user is None:
+                return None
+            with _user_cache_lock:
+                if generation == _user_cache_generation:
+                    _user_cache.set(user_id, user)
+        # Callers may mutate the result; never hand out the cached object
+        return copy.deepcopy(user)
 
     @staticmethod
     def get_by_email(email: str) -> dict | None:
@@ -57,11 +106,7 @@ class UserRepository:
                     return _format_user(result.data[0])
             except Exception as e:
                 print(f"[UserRepository] Supabase query failed: {e}")
-        users = _load_mock_users()
-        for u in users.values():
-            if u.get('email', '').lower() == email_lower:
-                return u
-        return None
+        return _mock_store.find_by_email(email_lower)
 
     @staticmethod
     def get_by_email_or_username(identifier: str) -> dict | None:
@@ -78,12 +123,8 @@ class UserRepository:
                     return _format_user(result.data[0])
             except Exception as e:
                 print(f"[UserRepository] Supabase query failed: {e}")
-        users = _load_mock_users()
-        for u in users.values():
-            if (u.get('email', '').lower() == identifier_lower or 
-                u.get('username', '').lower() == identifier_lower):
-                return u
-        return None
+        return (_mock_store.find_by_email(identifier_lower) or
+                _mock_store.find_by_username(identifier_lower))
 
     @staticmethod
     def check_email_or_username_exists(email: str, username: str) -> dict | None:
@@ -99,16 +140,15 @@ class UserRepository:
                     return _format_user(result.data[0])
             except Exception as e:
                 print(f"[UserRepository] Supabase query failed: {e}")
-        users = _load_mock_users()
-        for u in users.values():
-            if (u.get('email', '').lower() == email_clean or 
-                u.get('username', '').lower() == user_clean):
-                return u
-        return None
+        return (_mock_store.find_by_email(email_clean) or
+                _mock_store.find_by_username(user_clean))
 
     @staticmethod
     def create(user_data: dict) -> dict:
         """Insert a new user row. Returns the created user dict."""
+        StatsRepository.invalidate()
+        WriterDirectory.invalidate()
+        _geo_indexes.clear()
         if supabase:
             try:
                 row = _to_row(user_data)
@@ -117,15 +157,16 @@ class UserRepository:
                     return _format_user(result.data[0])
             except Exception as e:
                 print(f"[UserRepository] Supabase create failed: {e}")
-        users = _load_mock_users()
-        uid = user_data.get('id')
-        users[uid] = user_data
-        _save_mock_users(users)
-        return user_data
+        return _mock_store.put(user_data.get('id'), user_data)
 
     @staticmethod
+    @_invalidates_user_cache
     def update(user_id: str, updates: dict) -> dict | None:
         """Update specific fields on a user row."""
+        if 'role' in updates:
+            StatsRepository.invalidate()
+        if any(f in updates for f in _GEO_FIELDS):
+            _geo_indexes.clear()
         if supabase:
             try:
                 row_updates = _to_row(updates)
@@ -134,32 +175,89 @@ class UserRepository:
                     return _format_user(result.data[0])
             except Exception as e:
                 print(f"[UserRepository] Supabase update failed: {e}")
-        users = _load_mock_users()
-        if user_id in users:
-            users[user_id].update(updates)
-            _save_mock_users(users)
-            return users[user_id]
-        return None
+        return _mock_store.update(user_id, updates)
 
     @staticmethod
+    @_invalidates_user_cache
     def delete(user_id: str) -> None:
         """Hard delete a user row."""
+        StatsRepository.invalidate()
+        WriterDirectory.forget(user_id)
+        _geo_indexes.clear()
         if supabase:
             try:
                 supabase.table('users').delete().eq('id', user_id).execute()
             except Exception as e:
                 print(f"[UserRepository] Supabase delete failed: {e}")
-        users = _load_mock_users()
-        if user_id in users:
-            del users[user_id]
-            _save_mock_users(users)
+        _mock_store.delete(user_id)
+
+    @staticmethod
+    def get_many(user_ids: list, batch_size: int = None, fields: list = None) -> dict:
+        """Fetch many users by primary key. Returns {id: user}; unknown ids are left out."""
+        if not user_ids:
+            return {}
+        if supabase:
+            try:
+                return _bulk.get_many(user_ids, batch_size, fields)
+            except Exception as e:
+                print(f"[UserRepository] Supabase get_many failed: {e}")
+        users = {}
+        for user_id in user_ids:
+            user = _mock_store.get(user_id)
+            if user is not None:
+                users[user_id] = _project(user, fields)
+        return users
+
+    @staticmethod
+    def bulk_create(users: list[dict], batch_size: int = None) -> list[dict]:
+        """
+        Insert many user rows, `batch_size` per round trip. Returns the created users.
+        Supabase errors propagate; the mock store is only used without Supabase.
+        """
+        if not users:
+            return []
+        StatsRepository.invalidate()
+        WriterDirectory.invalidate()
+        _geo_indexes.clear()
+        if supabase:
+            # No mock fallback: a failed write must not land in the local fixture
+            return _bulk.create(users, batch_size)
+        return [_mock_store.put(u.get('id'), u) for u in users]
+
+    @staticmethod
+    def bulk_update(updates: dict, batch_size: int = None) -> int:
+        """
+        Apply many partial updates, `batch_size` per round trip.
+        `updates` maps user id -> dict of fields. Returns the number of rows updated.
+        Supabase errors propagate; the mock store is only used without Supabase.
+        """
+        if not updates:
+            return 0
+        if any('role' in fields for fields in updates.values()):
+            StatsRepository.invalidate()
+        if any(f in fields for fields in updates.values() for f in _GEO_FIELDS):
+            _geo_indexes.clear()
+        try:
+            if supabase:
+                # No mock fallback: a failed write must not land in the local fixture
+                return _bulk.update(updates, batch_size)
+            return sum(1 for user_id, fields in updates.items()
+                       if _mock_store.update(user_id, fields) is not None)
+        finally:
+            _forget_cached(updates)
+            WriterDirectory.invalidate(list(updates), {f for fields in updates.values() for f in fields})
 
     @staticmethod
-    def list_all(role: str = None) -> list[dict]:
-        """List users, optionally filtered by role (case-insensitive match for both forms)."""
+    def list_all(role: str = None, fields: list = None, mock_fallback: bool = True) -> list[dict]:
+        """
+        List users, optionally filtered by role (case-insensitive match for both forms).
+        `fields` limits the columns fetched and the keys returned (default: all).
+        With `mock_fallback=False`, a failing Supabase query raises instead of
+        serving the local mock store.
+        """
         if supabase:
             try:
-                query = supabase.table('users').select('*')
+                query = supabase.table('users').select(_select_clause(fields))
                 if role:
                     role_lower = role.lower()
                     role_upper = role.upper()
@@ -168,105 +266,172 @@ class UserRepository:
                     else:
                         query = query.or_(f"role.eq.{role_lower},role.eq.{role_upper}")
                 result = query.execute()
-                return [_format_user(row) for row in (result.data or [])]
+                return [_format_user(row, fields) for row in (result.data or [])]
             except Exception as e:
                 print(f"[UserRepository] Supabase list_all failed: {e}")
-        users = _load_mock_users()
-        res = list(users.values())
+                if not mock_fallback:
+                    raise
+        res = _mock_store.values()
         if role:
             role_upper = role.upper()
             res = [u for u in res if u.get('role', '').upper() == role_upper or (role_upper == 'WRITER' and u.get('role', '').upper() in ['PROVIDER', 'WRITER'])]
-        return res
+        return [_project(u, fields) for u in res] if fields else res
 
     @staticmethod
-    def append_to_array(user_id: str, field: str, value) -> dict | None:
-        """Append a value to a PostgreSQL array column (e.g. handwriting_samples)."""
+    def list_changed_since(since: str, fields: list = None) -> list[dict] | None:
+        """
+        Users of any role whose `updated_at` is at or after `since` (ISO timestamp).
+        Returns None when this cannot be answered (no Supabase, or the query
+        failed), so callers fall back to a full list_all.
+        """
+        if not supabase:
+            return None
+        try:
+            result = supabase.table('users').select(_select_clause(fields)) \
+                .gte('updated_at', since).order('updated_at').execute()
+            return [_format_user(row, fields) for row in (result.data or [])]
+        except Exception as e:
+            print(f"[UserRepository] Supabase list_changed_since failed: {e}")
+            return None
+
+    @staticmethod
+    def nearby(lat: float, lon: float, role: str = None, limit: int = None,
+               radius_km: float = None) -> list[tuple]:
+        """
+        Users closest to (lat, lon), nearest first, from an in-process spatial
+        index. `limit` caps the result (k-nearest), `radius_km` bounds it.
+        Users without coordinates are never returned.
+        Returns [(user_id, distance_km)].
+        """
+        index = _geo_index(role)
+        if radius_km is not None and limit is None:
+            return index.radius(lat, lon, radius_km)
+        return index.nearest(lat, lon, limit or len(index), max_km=radius_km)
+
+    @staticmethod
+    @_invalidates_user_cache
+    def append_to_array(user_id: str, field: str, value, max_length: int = None) -> list | None:
+        """
+        Atomically append a value to a PostgreSQL array column (e.g. handwriting_samples).
+        Duplicates are skipped, and nothing is appended once the array holds
+        `max_length` items. Returns the resulting array, or None if the user
+        does not exist. Raises if the database/user_arrays.sql function is
+        missing or the call fails.
+        """
         if supabase:
             try:
-                current = supabase.table('users').select(field).eq('id', user_id).execute()
-                if current.data:
-                    current_array = current.data[0].get(field) or []
-                    if value not in current_array:
-                        current_array.append(value)
-                    result = supabase.table('users').update({field: current_array}).eq('id', user_id).execute()
-                    if result.data:
-                        return _format_user(result.data[0])
+                return supabase.rpc('users_array_append', {
+                    'p_user_id': user_id,
+                    'p_field': field,
+                    'p_value': value,
+                    'p_max_length': max_length,
+                }).execute().data
             except Exception as e:
-                print(f"[UserRepository] Supabase append_to_array failed: {e}")
-        users = _load_mock_users()
-        if user_id in users:
-            arr = users[user_id].get(field) or []
-            if value not in arr:
-                arr.append(value)
-            users[user_id][field] = arr
-            _save_mock_users(users)
-            return users[user_id]
-        return None
+                # No read-modify-write fallback: it would lose concurrent appends
+                print(f"[UserRepository] users_array_append RPC failed: {e}")
+                raise
+        return _mock_store.append_to_array(user_id, field, value, max_length)
 
     @staticmethod
-    def remove_from_array(user_id: str, field: str, value) -> dict | None:
-        """Remove a value from a PostgreSQL array column."""
+    @_invalidates_user_cache
+    def remove_from_array(user_id: str, field: str, value) -> list | None:
+        """
+        Atomically remove a value from a PostgreSQL array column. Returns the
+        resulting array. Raises if the call fails, as append_to_array does.
+        """
         if supabase:
             try:
-                current = supabase.table('users').select(field).eq('id', user_id).execute()
-                if current.data:
-                    current_array = current.data[0].get(field) or []
-                    if value in current_array:
-                        current_array.remove(value)
-                    result = supabase.table('users').update({field: current_array}).eq('id', user_id).execute()
-                    if result.data:
-                        return _format_user(result.data[0])
+                return supabase.rpc('users_array_remove', {
+                    'p_user_id': user_id,
+                    'p_field': field,
+                    'p_value': value,
+                }).execute().data
             except Exception as e:
-                print(f"[UserRepository] Supabase remove_from_array failed: {e}")
-        users = _load_mock_users()
-        if user_id in users:
-            arr = users[user_id].get(field) or []
-            if value in arr:
-                arr.remove(value)
-            users[user_id][field] = arr
-            _save_mock_users(users)
-            return users[user_id]
-        return None
+                print(f"[UserRepository] users_array_remove RPC failed: {e}")
+                raise
+        return _mock_store.remove_from_array(user_id, field, value)
 
 
 # ─── Internal Helpers ─────────────────────────────────────────────────
 
+def _forget_cached(user_ids) -> None:
+    global _user_cache_generation
+    with _user_cache_lock:
+        _user_cache_generation += 1
+        for user_id in user_ids:
+            _user_cache.pop(user_id)
+
+
+# App-level keys -> snake_case DB columns
+_COLUMN_MAP = {
+    'id': 'id',
+    'email': 'email',
+    'username': 'username',
+    'password': 'password',
+    'name': 'name',
+    'role': 'role',
+    'avatar': 'avatar',
+    'address': 'address',
+    'is_verified': 'is_verified',
+    'availability_status': 'availability_status',
+    'coordinates': 'coordinates',
+    'handwriting_style': 'handwriting_style',
+    'handwriting_confidence': 'handwriting_confidence',
+    'handwriting_sample_url': 'handwriting_sample_url',
+    'handwriting_samples': 'handwriting_samples',
+    'qr_code_url': 'qr_code_url',
+    'price_per_page': 'price_per_page',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
 def _to_row(data: dict) -> dict:
     """Convert camelCase/app-level keys to snake_case DB columns."""
-    mapping = {
-        'id': 'id',
-        'email': 'email',
-        'username': 'username',
-        'password': 'password',
-        'name': 'name',
-        'role': 'role',
-        'avatar': 'avatar',
-        'address': 'address',
-        'is_verified': 'is_verified',
-        'availability_status': 'availability_status',
-        'coordinates': 'coordinates',
-        'handwriting_style': 'handwriting_style',
-        'handwriting_confidence': 'handwriting_confidence',
-        'handwriting_sample_url': 'handwriting_sample_url',
-        'handwriting_samples': 'handwriting_samples',
-        'qr_code_url': 'qr_code_url',
-        'price_per_page': 'price_per_page',
-        'created_at': 'created_at',
-    }
     row = {}
     for key, value in data.items():
-        col = mapping.get(key)
+        col = _COLUMN_MAP.get(key)
         # Drop columns that are not in the schema
         if col and col not in ['auth_provider', 'is_custom_profile_picture']:
             row[col] = value
     return row
 
 
-def _format_user(row: dict) -> dict:
-    """Convert a DB row back to the app-level dict shape."""
+def _geo_index(role: str = None) -> GeoIndex:
+    key = (role or '').upper()
+    index = _geo_indexes.get(key)
+    if index is None:
+        points = []
+        for user in UserRepository.list_all(role=role, fields=['id', 'coordinates']):
+            coords = parse_coordinates(user.get('coordinates'))
+            if coords:
+                points.append((user['id'], coords[0], coords[1]))
+        index = GeoIndex(points)
+        _geo_indexes.set(key, index)
+    return index
+
+
+def _select_clause(fields: list = None) -> str:
+    """PostgREST select list for the requested app-level fields ('*' for all)."""
+    if not fields:
+        return '*'
+    # Fields without a column (auth_provider, ...) just come back as defaults
+    columns = {'id'} | {_COLUMN_MAP[f] for f in fields if f in _COLUMN_MAP}
+    return ','.join(sorted(columns))
+
+
+def _project(user: dict, fields: list = None) -> dict:
+    """Restrict a mock-store user to the requested fields."""
+    if user is None or not fields:
+        return user
+    return {f: user[f] for f in fields if f in user}
+
+
+def _format_user(row: dict, fields: list = None) -> dict:
+    """Convert a DB row back to the app-level dict shape (only `fields`, if given)."""
     if not row:
         return None
-    return {
+    user = {
         'id': row.get('id'),
         'email': row.get('email'),
         'username': row.get('username'),
@@ -285,6 +450,13 @@ def _format_user(row: dict) -> dict:
         'qr_code_url': row.get('qr_code_url'),
         'price_per_page': row.get('price_per_page'),
         'created_at': row.get('created_at'),
+        'updated_at': row.get('updated_at'),
         'auth_provider': row.get('auth_provider'),
         'is_custom_profile_picture': row.get('is_custom_profile_picture', False),
     }
+    if fields:
+        return {f: user[f] for f in fields if f in user}
+    return user
+
+
+_bulk = BulkTable('users', _to_row, _format_user, _select_clause)
@@ -0,0 +1,362 @@
+"""
+Writer Directory
+----------------
+Process-wide, in-memory directory of writers for listing and search.
+
+Writers are held as compact `__slots__` records with secondary indexes by
+handwriting style and availability, so filters like `style=Cursive` are
+answered from memory without touching the database.
+
+The directory refreshes incrementally: it only fetches users whose
+`updated_at` is at or after the newest one it has seen (see
+database/users_updated_at.sql), compared as instants rather than strings
+since offsets and fractional digits vary. Deletes are not visible that way, so a
+full resync runs every WRITER_DIRECTORY_RESYNC seconds; writes through
+UserRepository in this process apply on the next read, and only writes
+to fields the directory keeps count. Until the `updated_at` column
+exists, every refresh is a full resync without it.
+
+With Supabase configured the directory never falls back to the mock
+store: a failing refresh keeps serving the previous snapshot. In mock
+mode, writes made in this process re-read just the users they touched.
+"""
+
+import datetime
+import os
+import threading
+import time
+import numpy as np
+from database.connection import supabase
+from utils.geo import GeoIndex, haversine_km, parse_coordinates
+
+REFRESH_INTERVAL_SECONDS = float(os.environ.get('WRITER_DIRECTORY_REFRESH', '5'))
+FULL_RESYNC_SECONDS = float(os.environ.get('WRITER_DIRECTORY_RESYNC', '600'))
+
+# User fields a WriterRecord is built from
+DIRECTORY_FIELDS = [
+    'id', 'email', 'name', 'username', 'role', 'avatar', 'address', 'is_verified',
+    'handwriting_style', 'handwriting_confidence', 'availability_status',
+    'handwriting_samples', 'qr_code_url', 'price_per_page', 'auth_provider',
+    'is_custom_profile_picture', 'coordinates', 'updated_at',
+]
+# Without database/users_updated_at.sql applied
+_BASE_FIELDS = [f for f in DIRECTORY_FIELDS if f != 'updated_at']
+_DIRECTORY_KEYS = frozenset(DIRECTORY_FIELDS)
+
+
+class WriterRecord:
+    """One writer. `card` is free for callers to memoize a rendering of the record."""
+
+    __slots__ = (
+        'id', 'email', 'name', 'username', 'role', 'avatar', 'address', 'is_verified',
+        'style', 'confidence', 'availability', 'samples', 'qr_code_url', 'price_per_page',
+        'auth_provider', 'is_custom_profile_picture', 'lat', 'lon', 'updated_at', 'card',
+    )
+
+    # App-level user keys that live under a different slot name
+    _ALIASES = {
+        'handwriting_style': 'style',
+        'handwriting_confidence': 'confidence',
+        'availability_status': 'availability',
+    }
+
+    def __init__(self, user: dict):
+        self.id = user.get('id')
+        self.email = user.get('email')
+        self.name = user.get('name')
+        self.username = user.get('username')
+        self.role = user.get('role')
+        self.avatar = user.get('avatar')
+        self.address = user.get('address')
+        self.is_verified = user.get('is_verified', False)
+        self.style = user.get('handwriting_style')
+        self.confidence = user.get('handwriting_confidence')
+        self.availability = user.get('availability_status', 'ONLINE')
+        self.samples = tuple(user.get('handwriting_samples') or ())
+        self.qr_code_url = user.get('qr_code_url')
+        self.price_per_page = user.get('price_per_page')
+        self.auth_provider = user.get('auth_provider')
+        self.is_custom_profile_picture = user.get('is_custom_profile_picture', False)
+        coords = parse_coordinates(user.get('coordinates'))
+        self.lat, self.lon = coords if coords else (None, None)
+        self.updated_at = user.get('updated_at')
+        self.card = None
+
+    def get(self, key: str, default=None):
+        """Read a field by its app-level user key, like a user dict."""
+        if key == 'coordinates':
+            return {'lat': self.lat, 'lon': self.lon} if self.lat is not None else default
+        if key == 'handwriting_samples':
+            return list(self.samples)
+        value = getattr(self, self._ALIASES.get(key, key), None)
+        return default if value is None else value
+
+
+_records = {}
+_by_style = {}
+_by_availability = {}
+_geo = None
+_synced_to = None               # newest updated_at seen, as an aware UTC datetime
+_loaded = False
+_dirty = False
+_pending_ids = set()            # written in this process, mock mode: re-read just these
+_has_updated_at = True          # False once a query shows the column is missing
+_probed_at = 0.0
+_checked_at = 0.0
+_full_sync_at = 0.0
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+class WriterDirectory:
+
+    @staticmethod
+    def query(style: str = None, availability: str = None) -> list[WriterRecord]:
+        """Writers matching the given style / availability (case-insensitive)."""
+        _ensure_fresh()
+        with _lock:
+            if style is None and availability is None:
+                return list(_records.values())
+            buckets = []
+            if style is not None:
+                buckets.append(_by_style.get(_key(style), {}))
+            if availability is not None:
+                buckets.append(_by_availability.get(_key(availability), {}))
+            smallest = min(buckets, key=len)
+            return [r for rid, r in smallest.items() if all(rid in b for b in buckets)]
+
+    @staticmethod
+    def get(writer_id: str) -> WriterRecord | None:
+        _ensure_fresh()
+        with _lock:
+            return _records.get(writer_id)
+
+    @staticmethod
+    def nearby(lat: float, lon: float, limit: int = None, radius_km: float = None,
+               style: str = None, availability: str = None) -> list[tuple]:
+        """Writers nearest to (lat, lon), nearest first. Returns [(WriterRecord, distance_km)]."""
+        if style is None and availability is None:
+            _ensure_fresh()
+            with _lock:
+                index, records = _geo_index(), _records
+            if radius_km is not None and limit is None:
+                matches = index.radius(lat, lon, radius_km)
+            else:
+                matches = index.nearest(lat, lon, limit or len(index), max_km=radius_km)
+            return [(records[rid], km) for rid, km in matches if rid in records]
+
+        # Filtered subsets are small: rank them directly
+        located = [r for r in WriterDirectory.query(style, availability) if r.lat is not None]
+        if not located:
+            return []
+        km = haversine_km(lat, lon, [r.lat for r in located], [r.lon for r in located])
+        order = np.argsort(km, kind='stable')
+        if radius_km is not None:
+            order = order[km[order] <= radius_km]
+        if limit is not None:
+            order = order[:limit]
+        return [(located[i], float(km[i])) for i in order]
+
+    @staticmethod
+    def invalidate(user_ids: list = None, fields=None) -> None:
+        """
+        Refresh on the next read (called after user writes in this process).
+        `fields` are the fields written, if known; writes to none of the
+        directory's fields are ignored.
+        """
+        global _dirty
+        if fields is not None and _DIRECTORY_KEYS.isdisjoint(fields):
+            return
+        if user_ids and not supabase:
+            with _lock:
+                _pending_ids.update(user_ids)
+        else:
+            _dirty = True
+
+    @staticmethod
+    def forget(writer_id: str) -> None:
+        """Drop a deleted user immediately; incremental refreshes cannot see deletes."""
+        with _lock:
+            _remove(writer_id)
+
+
+# ─── Internal Helpers ─────────────────────────────────────────────────
+
+def _key(value) -> str:
+    return (value or '').strip().lower()
+
+
+def _is_writer(user: dict) -> bool:
+    return (user.get('role') or '').upper() in ('WRITER', 'PROVIDER')
+
+
+def _is_stale(now: float) -> bool:
+    return not _loaded or _dirty or bool(_pending_ids) or now - _checked_at >= REFRESH_INTERVAL_SECONDS
+
+
+def _ensure_fresh() -> None:
+    if not _is_stale(time.monotonic()):
+        return
+    # Only the first load makes readers wait; later refreshes serve the old snapshot meanwhile
+    if not _refresh_lock.acquire(blocking=not _loaded):
+        return
+    try:
+        if _is_stale(time.monotonic()):
+            _refresh()
+    except Exception as e:
+        print(f"[WriterDirectory] Refresh failed: {e}")
+    finally:
+        _refresh_lock.release()
+
+
+def _refresh() -> None:
+    global _dirty, _checked_at
+    from database.repositories.users import UserRepository
+
+    dirty, _dirty = _dirty, False
+    with _lock:
+        pending = list(_pending_ids)
+        _pending_ids.clear()
+    started = time.monotonic()
+    due = started - _checked_at >= REFRESH_INTERVAL_SECONDS
+
+    if not _loaded or started - _full_sync_at >= FULL_RESYNC_SECONDS:
+        _full_sync(started)
+    elif not supabase:
+        if not dirty and not due:
+            # Only writes from this process: re-read just those users
+            _reload(pending)
+            return
+        # The periodic reload picks up other workers' edits to the mock file
+        _full_sync(started)
+    elif not _has_updated_at or _synced_to is None:
+        _full_sync(started)
+    else:
+        changed = UserRepository.list_changed_since(_synced_to.isoformat(), fields=DIRECTORY_FIELDS)
+        if changed is None:
+            _full_sync(started)
+        else:
+            _apply_changes(changed)
+    _checked_at = started
+
+
+def _full_sync(started: float) -> None:
+    global _has_updated_at, _probed_at
+    from database.repositories.users import UserRepository
+
+    if not supabase:
+        _replace_all(UserRepository.list_all(role='WRITER', fields=_BASE_FIELDS), started)
+        return
+    # Errors propagate: a Supabase deployment must not be served mock users
+    if _has_updated_at or started - _probed_at >= FULL_RESYNC_SECONDS:
+        try:
+            users = UserRepository.list_all(role='WRITER', fields=DIRECTORY_FIELDS, mock_fallback=False)
+            if not _has_updated_at:
+                print("[WriterDirectory] users.updated_at found, switching to incremental refreshes")
+            _has_updated_at = True
+            _replace_all(users, started)
+            return
+        except Exception as e:
+            if _has_updated_at:
+                print(f"[WriterDirectory] Listing with updated_at failed, using full resyncs "
+                      f"(apply database/users_updated_at.sql): {e}")
+            _has_updated_at = False
+            _probed_at = started
+    users = UserRepository.list_all(role='WRITER', fields=_BASE_FIELDS, mock_fallback=False)
+    _replace_all(users, started)
+
+
+def _reload(user_ids: list) -> None:
+    """Re-read the given users (mock mode) and update their records in place."""
+    from database.repositories.users import UserRepository
+
+    users = UserRepository.get_many(user_ids, fields=_BASE_FIELDS)
+    with _lock:
+        for user_id in user_ids:
+            user = users.get(user_id)
+            if user is not None and _is_writer(user):
+                _put(WriterRecord(user))
+            else:
+                _remove(user_id)
+
+
+def _replace_all(users: list, started: float) -> None:
+    global _records, _by_style, _by_availability, _geo, _synced_to, _loaded, _full_sync_at
+    records, by_style, by_availability = {}, {}, {}
+    for user in users:
+        if not _is_writer(user):
+            continue
+        record = WriterRecord(user)
+        records[record.id] = record
+        by_style.setdefault(_key(record.style), {})[record.id] = record
+        by_availability.setdefault(_key(record.availability), {})[record.id] = record
+    with _lock:
+        _records, _by_style, _by_availability = records, by_style, by_availability
+        _geo = None
+        _synced_to = _max_updated_at(users, None)
+        _loaded = True
+        _full_sync_at = started
+
+
+def _apply_changes(users: list) -> None:
+    global _synced_to
+    with _lock:
+        for user in users:
+            if _is_writer(user):
+                _put(WriterRecord(user))
+            else:
+                # Role changed away from writer
+                _remove(user.get('id'))
+        _synced_to = _max_updated_at(users, _synced_to)
+
+
+def _put(record: WriterRecord) -> None:
+    global _geo
+    old = _records.get(record.id)
+    if old is not None:
+        _by_style.get(_key(old.style), {}).pop(old.id, None)
+        _by_availability.get(_key(old.availability), {}).pop(old.id, None)
+    _records[record.id] = record
+    _by_style.setdefault(_key(record.style), {})[record.id] = record
+    _by_availability.setdefault(_key(record.availability), {})[record.id] = record
+    if old is None or (old.lat, old.lon) != (record.lat, record.lon):
+        _geo = None
+
+
+def _remove(writer_id: str) -> None:
+    global _geo
+    old = _records.pop(writer_id, None)
+    if old is not None:
+        _by_style.get(_key(old.style), {}).pop(old.id, None)
+        _by_availability.get(_key(old.availability), {}).pop(old.id, None)
+        _geo = None
+
+
+def _geo_index() -> GeoIndex:
+    """Spatial index over the current records; rebuilt lazily after location changes."""
+    global _geo
+    if _geo is None:
+        _geo = GeoIndex((r.id, r.lat, r.lon) for r in _records.values() if r.lat is not None)
+    return _geo
+
+
+def _max_updated_at(users: list, current):
+    stamps = [_parse_timestamp(u.get('updated_at')) for u in users]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    if current:
+        stamps.append(current)
+    return max(stamps) if stamps else current
+
+
+def _parse_timestamp(value) -> datetime.datetime | None:
+    """An `updated_at` value as an aware UTC datetime (naive ones are taken as UTC)."""
+    if not value:
+        return None
+    if not isinstance(value, datetime.datetime):
+        try:
+            value = datetime.datetime.fromisoformat(str(value).strip().replace(' ', 'T'))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
@@ -0,0 +1,417 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase
+from database.mock_store import MockUserStore
+from database.repositories import assignments, writers
+from database.repositories.assignments import AssignmentRepository
+from database.repositories.users import UserRepository
+from database.repositories.writers import WriterDirectory
+
+
+class MockUserStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'mock_db.json')
+        self._write({
+            'u1': {'id': 'u1', 'email': 'ada@example.com', 'username': 'ada', 'role': 'WRITER'},
+            'u2': {'id': 'u2', 'email': 'alan@example.com', 'username': 'alan', 'role': 'STUDENT'},
+        })
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def _write(self, users: dict, **extra) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'users': users, **extra}, f)
+        # A later rewrite must never share the mtime of the previous one
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 10**9))
+
+    def _read(self) -> dict:
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)['users']
+
+    def _store(self) -> MockUserStore:
+        # A long delay keeps the write-behind timer out of the way; tests flush explicitly
+        store = MockUserStore(self.path, flush_delay=60)
+        self.addCleanup(store.flush)
+        return store
+
+    def test_concurrent_puts_and_updates_from_threads(self):
+        store = self._store()
+
+        def worker(n):
+            for i in range(50):
+                store.put(f't{n}-{i}', {'id': f't{n}-{i}', 'email': f't{n}-{i}@example.com'})
+                store.update('u1', {f'field_{n}': i})
+                store.append_to_array('u2', 'handwriting_samples', f'/media/{n}-{i}.png')
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        store.flush()
+
+        users = self._read()
+        self.assertEqual(len(users), 2 + 8 * 50)
+        self.assertEqual({users['u1'][f'field_{n}'] for n in range(8)}, {49})
+        self.assertEqual(len(users['u2']['handwriting_samples']), 8 * 50)
+        self.assertEqual(store.find_by_email('t3-7@example.com')['id'], 't3-7')
+
+    def test_flush_then_reload_round_trips(self):
+        store = self._store()
+        store.put('u3', {'id': 'u3', 'email': 'Grace@Example.com', 'username': 'grace'})
+        store.update('u1', {'username': 'lovelace'})
+        store.delete('u2')
+        store.flush()
+
+        reloaded = self._store()
+        self.assertEqual(reloaded.values(), store.values())
+        self.assertEqual(reloaded.find_by_email('grace@example.com')['id'], 'u3')
+        self.assertEqual(reloaded.find_by_username('lovelace')['id'], 'u1')
+        self.assertIsNone(reloaded.find_by_username('ada'))
+        self.assertIsNone(reloaded.get('u2'))
+
+    def test_flush_keeps_edits_flushed_by_another_process(self):
+        ours, theirs = self._store(), self._store()
+        ours.update('u1', {'name': 'Ada'})
+        theirs.update('u2', {'name': 'Alan'})
+        theirs.flush()
+        ours.flush()
+
+        users = self._read()
+        self.assertEqual(users['u1']['name'], 'Ada')
+        self.assertEqual(users['u2']['name'], 'Alan')
+
+    def test_pending_journal_is_replayed_over_an_external_edit(self):
+        store = self._store()
+        store.update('u1', {'name': 'Ada'})
+        # The file is replaced underneath the unflushed journal
+        self._write({
+            'u2': {'id': 'u2', 'email': 'alan@example.com', 'username': 'alan'},
+            'u9': {'id': 'u9', 'email': 'new@example.com'},
+        })
+
+        self.assertEqual(store.get('u1')['name'], 'Ada')
+        self.assertIsNotNone(store.get('u9'))
+        store.flush()
+        self.assertEqual(set(self._read()), {'u1', 'u2', 'u9'})
+
+    def test_recovers_after_a_crash_mid_flush(self):
+        store = self._store()
+        store.update('u1', {'name': 'Ada'})
+        # A process killed while flushing leaves its tmp file and lock file behind
+        with open(f"{self.path}.4242.tmp", 'w', encoding='utf-8') as f:
+            f.write('{"users": {"u1": ')
+        open(f"{self.path}.lock", 'w').close()
+
+        restarted = self._store()
+        self.assertEqual(restarted.get('u2')['username'], 'alan')
+        store.flush()
+        self.assertEqual(self._read()['u1']['name'], 'Ada')
+
+    def test_unreadable_file_keeps_serving_memory_and_journal(self):
+        store = self._store()
+        store.update('u1', {'name': 'Ada'})
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{"users": {')
+
+        self.assertEqual(store.get('u1')['name'], 'Ada')
+        self.assertEqual(store.get('u2')['username'], 'alan')
+        # The next flush writes a readable file again
+        store.flush()
+        self.assertEqual(self._read()['u1']['name'], 'Ada')
+
+
+# ─── Fake PostgREST table ─────────────────────────────────────────────────
+
+def _split_top_level(text: str) -> list:
+    """Split a PostgREST logic-tree argument list on commas outside (), {} and quotes."""
+    parts, depth, quoted, start, i = [], 0, False, 0, 0
+    while i < len(text):
+        ch = text[i]
+        if quoted:
+            if ch == '\\':
+                i += 1
+            elif ch == '"':
+                quoted = False
+        elif ch == '"':
+            quoted = True
+        elif ch in '({':
+            depth += 1
+        elif ch in ')}':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _unquote(value: str) -> str:
+    if value.startswith('"') and value.endswith('"'):
+        return value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return value
+
+
+def _matches(expr: str, row: dict) -> bool:
+    """Evaluate the subset of PostgREST's or/and syntax the repositories build."""
+    for op, combine in (('and(', all), ('or(', any)):
+        if expr.startswith(op):
+            return combine(_matches(part, row) for part in _split_top_level(expr[len(op):-1]))
+    column, operator, value = expr.split('.', 2)
+    actual = row.get(column)
+    if operator == 'is':
+        return actual is None
+    if operator == 'cs':
+        wanted = [_unquote(v) for v in _split_top_level(value[1:-1])]
+        return actual is not None and all(v in actual for v in wanted)
+    if actual is None:
+        # SQL comparisons with NULL are never true
+        return False
+    value = _unquote(value)
+    return {'eq': actual == value, 'neq': actual != value, 'lt': actual < value}[operator]
+
+
+class _FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.orders = []
+        self.max_rows = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def or_(self, expr):
+        self.filters.append(lambda row: _matches(f"or({expr})", row))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def execute(self):
+        rows = [dict(r) for r in self.rows if all(f(r) for f in self.filters)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda r: r[column], reverse=desc)
+        return SimpleNamespace(data=rows[:self.max_rows] if self.max_rows else rows)
+
+
+class _FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        return _FakeQuery(self.rows)
+
+
+def _assignment(row_id, created_at, **columns):
+    return {'id': row_id, 'created_at': created_at, 'assignment_type': None,
+            'visibility': None, 'preferred_handwriting_styles': None,
+            'student_id': None, 'assigned_writer_id': None, **columns}
+
+
+class ListVisibleTests(SimpleTestCase):
+
+    def _use_rows(self, rows):
+        patcher = mock.patch.object(assignments, 'supabase', _FakeSupabase(rows))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _all_pages(self, limit, **kwargs):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = AssignmentRepository.list_visible(limit=limit, cursor=cursor, **kwargs)
+            self.assertLessEqual(len(rows), limit)
+            ids.extend(row['id'] for row in rows)
+            if cursor is None:
+                return ids
+
+    def test_cursor_pages_cover_every_row_once_in_order(self):
+        self._use_rows([_assignment(f'a{i}', f'2024-01-{i + 10:02d}T00:00:00+00:00') for i in range(7)])
+        unpaged, cursor = AssignmentRepository.list_visible()
+        self.assertIsNone(cursor)
+        self.assertEqual([row['id'] for row in unpaged], [f'a{i}' for i in reversed(range(7))])
+        for limit in (1, 2, 3, 7, 50):
+            with self.subTest(limit=limit):
+                self.assertEqual(self._all_pages(limit), [row['id'] for row in unpaged])
+
+    def test_equal_created_at_is_ordered_and_split_by_id(self):
+        same = '2024-02-01T12:00:00+00:00'
+        self._use_rows(
+            [_assignment(f'b{i}', same) for i in range(5)]
+            + [_assignment('newer', '2024-03-01T00:00:00+00:00'),
+               _assignment('older', '2024-01-01T00:00:00+00:00')]
+        )
+        expected = ['newer', 'b4', 'b3', 'b2', 'b1', 'b0', 'older']
+        for limit in (1, 2, 3, 4):
+            with self.subTest(limit=limit):
+                self.assertEqual(self._all_pages(limit), expected)
+
+    def test_cursor_encodes_the_last_row_keyset(self):
+        row = _assignment('x"1', '2024-02-01T12:00:00+00:00')
+        self._use_rows([row, _assignment('a', '2024-01-01T00:00:00+00:00')])
+        rows, cursor = AssignmentRepository.list_visible(limit=1)
+        self.assertEqual(cursor, assignments._encode_cursor(row))
+        rows, cursor = AssignmentRepository.list_visible(limit=1, cursor=cursor)
+        self.assertEqual([r['id'] for r in rows], ['a'])
+        self.assertIsNone(cursor)
+
+    def test_invalid_cursor_raises_value_error(self):
+        self._use_rows([])
+        with self.assertRaises(ValueError):
+            AssignmentRepository.list_visible(limit=10, cursor='not-a-cursor')
+
+    def test_visibility_per_role(self):
+        ts = '2024-01-01T00:00:00+00:00'
+        self._use_rows([
+            _assignment('open', ts),
+            _assignment('all_writers', ts, visibility='ALL_WRITERS'),
+            _assignment('neat_only', ts, visibility='SELECTED_STYLES', preferred_handwriting_styles=['Neat']),
+            _assignment('bold_only', ts, visibility='SELECTED_STYLES', preferred_handwriting_styles=['Bold']),
+            _assignment('direct_w1', ts, assignment_type='DIRECT', assigned_writer_id='w1', student_id='s1'),
+            _assignment('direct_w2', ts, assignment_type='DIRECT', assigned_writer_id='w2', student_id='s2'),
+        ])
+
+        def visible(**kwargs):
+            rows, _ = AssignmentRepository.list_visible(**kwargs)
+            return {row['id'] for row in rows}
+
+        marketplace = {'open', 'all_writers', 'neat_only', 'bold_only'}
+        self.assertEqual(visible(), marketplace)
+        self.assertEqual(visible(user_id='s1', role='STUDENT'), marketplace | {'direct_w1'})
+        self.assertEqual(visible(user_id='w1', role='WRITER', writer_style='Neat'),
+                         {'open', 'all_writers', 'neat_only', 'direct_w1'})
+        self.assertEqual(visible(user_id='w2', role='WRITER', writer_style=None),
+                         {'open', 'all_writers', 'direct_w2'})
+        self.assertEqual(visible(user_id='a1', role='ADMIN'), marketplace)
+
+
+def _writer(user_id, style='Neat', availability='ONLINE', updated_at=None, role='WRITER', **fields):
+    return {'id': user_id, 'role': role, 'handwriting_style': style,
+            'availability_status': availability, 'updated_at': updated_at, **fields}
+
+
+class WriterDirectoryTests(SimpleTestCase):
+    """The directory against an in-test users table, in Supabase (incremental) mode."""
+
+    def setUp(self):
+        self.users = {}
+        self.since = []
+        # A fresh, empty directory for every test
+        patcher = mock.patch.multiple(
+            writers, supabase=object(), _records={}, _by_style={}, _by_availability={},
+            _geo=None, _synced_to=None, _loaded=False, _dirty=False, _pending_ids=set(),
+            _has_updated_at=True, _probed_at=0.0, _checked_at=0.0, _full_sync_at=0.0,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, fake in (('list_all', self._list_all), ('list_changed_since', self._changed_since)):
+            patcher = mock.patch.object(UserRepository, name, side_effect=fake)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def _list_all(self, role=None, fields=None, mock_fallback=True):
+        return [dict(u) for u in self.users.values()]
+
+    def _changed_since(self, since, fields=None):
+        self.since.append(since)
+        cutoff = writers._parse_timestamp(since)
+        return [dict(u) for u in self.users.values()
+                if writers._parse_timestamp(u.get('updated_at')) >= cutoff]
+
+    def _ids(self, **filters):
+        return sorted(r.id for r in WriterDirectory.query(**filters))
+
+    def test_style_and_availability_indexes(self):
+        self.users = {
+            'w1': _writer('w1', 'Neat', 'ONLINE'),
+            'w2': _writer('w2', 'cursive', 'OFFLINE'),
+            'w3': _writer('w3', 'Cursive ', 'ONLINE'),
+            's1': _writer('s1', 'Neat', role='STUDENT'),
+            'p1': _writer('p1', 'Bold', role='provider'),
+        }
+        self.assertEqual(self._ids(), ['p1', 'w1', 'w2', 'w3'])
+        self.assertEqual(self._ids(style='CURSIVE'), ['w2', 'w3'])
+        self.assertEqual(self._ids(availability='online'), ['p1', 'w1', 'w3'])
+        self.assertEqual(self._ids(style='cursive', availability='ONLINE'), ['w3'])
+        self.assertEqual(self._ids(style='Mixed'), [])
+
+    def test_incremental_refresh_moves_records_between_indexes(self):
+        self.users = {
+            'w1': _writer('w1', 'Neat', updated_at='2024-05-01T10:00:00+00:00'),
+            'w2': _writer('w2', 'Neat', updated_at='2024-05-01T10:00:01+00:00'),
+        }
+        self.assertEqual(self._ids(style='neat'), ['w1', 'w2'])
+
+        self.users['w1'] = _writer('w1', 'Bold', 'BUSY', updated_at='2024-05-01T10:05:00+00:00')
+        self.users['w2'] = _writer('w2', role='STUDENT', updated_at='2024-05-01T10:05:00+00:00')
+        WriterDirectory.invalidate(['w1', 'w2'], ['handwriting_style', 'role'])
+
+        self.assertEqual(self._ids(style='neat'), [])
+        self.assertEqual(self._ids(style='bold'), ['w1'])
+        self.assertEqual(self._ids(availability='busy'), ['w1'])
+        self.assertEqual(self._ids(), ['w1'])
+        self.assertEqual(self.list_all.call_count, 1)
+        self.assertEqual(self.since, ['2024-05-01T10:00:01+00:00'])
+
+    def test_refresh_compares_timestamps_as_instants(self):
+        self.users = {
+            # 10:30 UTC, written with a +05:30 offset: sorts after 10:45Z as a string
+            'w1': _writer('w1', updated_at='2024-05-01T16:00:00+05:30'),
+            'w2': _writer('w2', updated_at='2024-05-01T10:45:00.5Z'),
+            'w3': _writer('w3', updated_at='2024-05-01 10:40:00.123456+00'),
+        }
+        self.assertEqual(self._ids(), ['w1', 'w2', 'w3'])
+
+        self.users['w4'] = _writer('w4', 'Bold', updated_at='2024-05-01T10:50:00Z')
+        WriterDirectory.invalidate()
+        self.assertEqual(self._ids(style='bold'), ['w4'])
+        # The cursor is the newest instant (w2), normalised to UTC
+        self.assertEqual(self.since, ['2024-05-01T10:45:00.500000+00:00'])
+
+    def test_invalidate_ignores_fields_the_directory_does_not_keep(self):
+        self.users = {'w1': _writer('w1', updated_at='2024-05-01T10:00:00+00:00')}
+        self._ids()
+        WriterDirectory.invalidate(['w1'], ['password'])
+        self.assertFalse(writers._dirty)
+        WriterDirectory.invalidate(['w1'], {'availability_status': 'OFFLINE'})
+        self.assertTrue(writers._dirty)
+
+    def test_forget_drops_a_deleted_writer_from_every_index(self):
+        self.users = {'w1': _writer('w1', 'Neat', 'ONLINE', coordinates={'lat': 1.0, 'lon': 2.0})}
+        self.assertEqual(len(WriterDirectory.nearby(1.0, 2.0)), 1)
+        WriterDirectory.forget('w1')
+        self.assertEqual(self._ids(style='neat'), [])
+        self.assertEqual(self._ids(availability='online'), [])
+        self.assertEqual(WriterDirectory.nearby(1.0, 2.0), [])
+
+    def test_missing_updated_at_column_falls_back_to_full_resyncs(self):
+        self.users = {'w1': _writer('w1')}
+
+        def list_all(role=None, fields=None, mock_fallback=True):
+            if 'updated_at' in (fields or []):
+                raise RuntimeError('column users.updated_at does not exist')
+            return [dict(u) for u in self.users.values()]
+
+        self.list_all.side_effect = list_all
+        self.assertEqual(self._ids(), ['w1'])
+        self.users['w2'] = _writer('w2')
+        WriterDirectory.invalidate()
+        self.assertEqual(self._ids(), ['w1', 'w2'])
+        self.assertEqual(self.since, [])
+        self.assertFalse(writers._has_updated_at)
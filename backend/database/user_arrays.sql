@@ -0,0 +1,72 @@
+-- ==============================================================================
+-- ATOMIC ARRAY UPDATES ON `users`
+-- ==============================================================================
+-- Description:
+-- Appends to / removes from an array column (e.g. handwriting_samples) in a
+-- single UPDATE, so concurrent uploads cannot overwrite each other's changes
+-- and the backend needs one round trip instead of a read plus a write.
+--
+-- Called from UserRepository.append_to_array / remove_from_array via
+-- `supabase.rpc(...)`. Both functions return the resulting array, or NULL
+-- when the user does not exist.
+-- ==============================================================================
+
+CREATE OR REPLACE FUNCTION public.users_array_append(
+  p_user_id public.users.id%TYPE,
+  p_field text,
+  p_value text,
+  p_max_length integer DEFAULT NULL
+)
+RETURNS text[]
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  result text[];
+BEGIN
+  IF p_field NOT IN ('handwriting_samples') THEN
+    RAISE EXCEPTION 'Unsupported array column: %', p_field;
+  END IF;
+
+  -- Skip duplicates, and leave the array untouched once it holds p_max_length items
+  EXECUTE format(
+    'UPDATE public.users
+        SET %1$I = CASE
+              WHEN $1 = ANY(coalesce(%1$I, ''{}'')) THEN %1$I
+              WHEN $2 IS NOT NULL AND coalesce(cardinality(%1$I), 0) >= $2 THEN %1$I
+              ELSE array_append(coalesce(%1$I, ''{}''), $1)
+            END
+      WHERE id = $3
+      RETURNING coalesce(%1$I, ''{}'')', p_field)
+    INTO result
+    USING p_value, p_max_length, p_user_id;
+
+  RETURN result;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.users_array_remove(
+  p_user_id public.users.id%TYPE,
+  p_field text,
+  p_value text
+)
+RETURNS text[]
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  result text[];
+BEGIN
+  IF p_field NOT IN ('handwriting_samples') THEN
+    RAISE EXCEPTION 'Unsupported array column: %', p_field;
+  END IF;
+
+  EXECUTE format(
+    'UPDATE public.users
+        SET %1$I = array_remove(coalesce(%1$I, ''{}''), $1)
+      WHERE id = $2
+      RETURNING %1$I', p_field)
+    INTO result
+    USING p_value, p_user_id;
+
+  RETURN result;
+END;
+$$;
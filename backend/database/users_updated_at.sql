@@ -0,0 +1,32 @@
+-- ==============================================================================
+-- USERS.UPDATED_AT
+-- ==============================================================================
+-- Description:
+-- Adds an `updated_at` timestamp to `users`, kept current by a trigger on
+-- every UPDATE (including the array and bulk_update functions).
+--
+-- The in-memory writer directory (database/repositories/writers.py) polls
+-- for rows with `updated_at` at or after the newest one it has seen, so it
+-- refreshes without re-reading every writer. Deletes are not visible this
+-- way; the directory catches those with a periodic full resync.
+-- ==============================================================================
+
+ALTER TABLE public.users
+  ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION public.set_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS users_set_updated_at ON public.users;
+CREATE TRIGGER users_set_updated_at
+  BEFORE UPDATE ON public.users
+  FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+
+CREATE INDEX IF NOT EXISTS users_updated_at_idx ON public.users (updated_at);
@@ -103,11 +103,29 @@ TEMPLATES = [
 WSGI_APPLICATION = 'paperly_project.wsgi.application'
 ASGI_APPLICATION = 'paperly_project.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+# Channel layer: with CHANNEL_REDIS_URL set (Redis or any Redis-compatible
+# server, e.g. a local Valkey), groups are shared by every ASGI worker.
+# Several comma-separated URLs shard the channels and groups across servers.
+# Without it, the in-memory layer only reaches sockets in this process.
+CHANNEL_REDIS_URLS = [u.strip() for u in os.environ.get('CHANNEL_REDIS_URL', '').split(',') if u.strip()]
+
+if CHANNEL_REDIS_URLS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": CHANNEL_REDIS_URLS,
+                "capacity": int(os.environ.get('CHANNEL_CAPACITY', '1500')),
+                "expiry": 10,
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
     }
-}
 
 # Database Configuration
 # ----------------------
@@ -1,11 +1,5 @@
-import os
-import django
 import random
-
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'paperly_project.settings')
-django.setup()
-
-from utils.mongo import db
+from database.repositories.users import UserRepository
 
 # Writer Locations (Mock)
 LOCATIONS = {
@@ -14,12 +8,12 @@ LOCATIONS = {
     'Grace': {'lat': 38.8799, 'lon': -77.1067}, # Arlington
 }
 
-writers = db.users.find({'$or': [{'role': 'provider'}, {'role': 'WRITER'}]})
-count = 0
+writers = UserRepository.list_all(role='WRITER')
+updates = {}
 
 for writer in writers:
-    name_key = writer.get('first_name', '')
-    
+    name_key = (writer.get('name') or '').split(' ')[0]
+
     if name_key in LOCATIONS:
         coords = LOCATIONS[name_key]
     else:
@@ -29,11 +23,9 @@ for writer in writers:
             'lon': -74.0060 + random.uniform(-0.5, 0.5)
         }
 
-    db.users.update_one(
-        {'_id': writer['_id']},
-        {'$set': {'coordinates': {'lat': coords['lat'], 'lon': coords['lon']}}}
-    )
-    print(f"Updated {writer.get('email')} with location {coords}")
-    count += 1
+    updates[writer['id']] = {'coordinates': {'lat': coords['lat'], 'lon': coords['lon']}}
+    print(f"Updating {writer.get('email')} with location {coords}")
 
+# One round trip per batch instead of one per writer
+count = UserRepository.bulk_update(updates)
 print(f"Updated {count} writers with coordinates.")
@@ -1,28 +1,19 @@
-from utils.mongo import db
-import sys
-
-if db is None:
-    print("Error: Could not connect to database")
-    sys.exit(1)
-
-print(f"Connected to DB: {db.name}")
+from database.repositories.users import UserRepository
 
 sample_urls = [
     "https://upload.wikimedia.org/wikipedia/commons/thumb/6/6e/Einstein_signature_1934.svg/1200px-Einstein_signature_1934.svg.png",
     "https://upload.wikimedia.org/wikipedia/commons/thumb/0/03/Marie_Curie_signature.svg/1200px-Marie_Curie_signature.svg.png"
 ]
 
-writers = db.users.find({'$or': [{'role': 'provider'}, {'role': 'WRITER'}]})
-count = 0
+writers = UserRepository.list_all(role='WRITER')
+updates = {w['id']: {'handwriting_samples': sample_urls} for w in writers}
 for w in writers:
-    try:
-        db.users.update_one(
-            {'_id': w['_id']},
-            {'$set': {'handwriting_samples': sample_urls}}
-        )
-        print(f"Updated writer: {w.get('email')}")
-        count += 1
-    except Exception as e:
-        print(f"Failed to update {w.get('email')}: {e}")
+    print(f"Updating writer: {w.get('email')}")
+
+try:
+    count = UserRepository.bulk_update(updates)
+except Exception as e:
+    print(f"Failed to update writers: {e}")
+    count = 0
 
 print(f"Updated {count} writers with samples.")
@@ -0,0 +1,131 @@
+"""
+Geospatial helpers: vectorized haversine and an in-process grid index.
+
+`GeoIndex` buckets points into fixed lat/lon cells. A radius query only
+looks at the cells overlapping the search circle's bounding box, and a
+k-nearest query grows the radius until it holds k points, so lookups
+touch a small fraction of the points instead of all of them.
+"""
+
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# Half the Earth's circumference: no two points are further apart
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+
+def haversine_km(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Great-circle distance in km from (lat, lon) to each of (lats, lons)."""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    d_lat = lat2 - lat1
+    d_lon = np.radians(np.asarray(lons, dtype=np.float64)) - math.radians(lon)
+    a = np.sin(d_lat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def parse_coordinates(coordinates) -> tuple | None:
+    """(lat, lon) floats from a {'lat': .., 'lon': ..} dict, or None if missing/invalid."""
+    try:
+        lat, lon = float(coordinates['lat']), float(coordinates['lon'])
+    except (TypeError, KeyError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0) or math.isnan(lon):
+        return None
+    return lat, lon
+
+
+class GeoIndex:
+    """Immutable grid index over (key, lat, lon) points."""
+
+    def __init__(self, points, cell_degrees: float = 1.0):
+        points = list(points)
+        self.cell = cell_degrees
+        self.n_cols = int(math.ceil(360.0 / cell_degrees))
+        self.n_rows = int(math.ceil(180.0 / cell_degrees))
+        self.keys = [key for key, _, _ in points]
+        self.lats = np.array([lat for _, lat, _ in points], dtype=np.float64)
+        self.lons = np.array([lon for _, _, lon in points], dtype=np.float64)
+
+        rows = self._rows(self.lats)
+        cols = self._cols(self.lons)
+        cells = {}
+        for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            cells.setdefault(cell, []).append(i)
+        self.cells = {cell: np.array(idx, dtype=np.int64) for cell, idx in cells.items()}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def radius(self, lat: float, lon: float, radius_km: float, limit: int = None) -> list:
+        """Points within `radius_km`, nearest first. Returns [(key, distance_km)]."""
+        candidates = self._candidates(lat, lon, radius_km)
+        if candidates.size == 0:
+            return []
+        distances = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        return self._ranked(candidates, distances, limit)
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: float = None) -> list:
+        """The `k` nearest points (optionally within `max_km`). Returns [(key, distance_km)]."""
+        if k <= 0 or not self.keys:
+            return []
+        limit_km = min(max_km, MAX_DISTANCE_KM) if max_km is not None else MAX_DISTANCE_KM
+        # Start around one cell and double until the circle holds k points;
+        # every point within the circle is found, so its k closest are exact
+        search_km = min(self.cell * 111.0, limit_km)
+        while True:
+            found = self.radius(lat, lon, search_km)
+            if len(found) >= k or search_km >= limit_km:
+                return found[:k]
+            search_km = min(search_km * 2, limit_km)
+
+    # ─── Internal Helpers ─────────────────────────────────────────────
+
+    def _rows(self, lats):
+        return np.clip(((np.asarray(lats) + 90.0) // self.cell).astype(np.int64), 0, self.n_rows - 1)
+
+    def _cols(self, lons):
+        return (((np.asarray(lons) + 180.0) % 360.0) // self.cell).astype(np.int64) % self.n_cols
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Indices of points in cells overlapping the circle's bounding box."""
+        angular = radius_km / EARTH_RADIUS_KM
+        lat_min = lat - math.degrees(angular)
+        lat_max = lat + math.degrees(angular)
+
+        if angular >= math.pi / 2 or lat_min <= -90.0 or lat_max >= 90.0:
+            # Circle reaches a pole (or is huge): every longitude is in range
+            cols = None
+        else:
+            d_lon = math.degrees(math.asin(min(1.0, math.sin(angular) / math.cos(math.radians(lat)))))
+            first = int(((lon - d_lon + 180.0) % 360.0) // self.cell)
+            span = int(math.ceil(2 * d_lon / self.cell)) + 1
+            cols = None if span >= self.n_cols else {(first + c) % self.n_cols for c in range(span + 1)}
+
+        row_lo = int(self._rows(max(lat_min, -90.0)))
+        row_hi = int(self._rows(min(lat_max, 90.0)))
+        n_box = (row_hi - row_lo + 1) * (len(cols) if cols is not None else self.n_cols)
+
+        if n_box >= len(self.cells):
+            # Cheaper to walk the occupied cells than the box
+            picked = [idx for (r, c), idx in self.cells.items()
+                      if row_lo <= r <= row_hi and (cols is None or c in cols)]
+        else:
+            col_range = cols if cols is not None else range(self.n_cols)
+            picked = [self.cells[(r, c)] for r in range(row_lo, row_hi + 1)
+                      for c in col_range if (r, c) in self.cells]
+        if not picked:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(picked)
+
+    def _ranked(self, candidates, distances, limit):
+        if limit is not None and limit < len(distances):
+            # Partial sort: only the first `limit` need ordering
+            top = np.argpartition(distances, limit)[:limit]
+            order = top[np.argsort(distances[top], kind='stable')]
+        else:
+            order = np.argsort(distances, kind='stable')
+        return [(self.keys[candidates[i]], float(distances[i])) for i in order]
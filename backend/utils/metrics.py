@@ -0,0 +1,46 @@
+"""
+Lightweight in-process metrics.
+"""
+
+import bisect
+import threading
+
+# Upper bounds in seconds; the last bucket catches everything slower
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram (Prometheus-style), safe across threads."""
+
+    def __init__(self, name: str, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._outcomes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, outcome: str = 'ok') -> None:
+        idx = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += seconds
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+            outcomes = dict(self._outcomes)
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            cumulative.append({'le': 'inf' if bound == float('inf') else bound, 'count': running})
+        return {
+            'name': self.name,
+            'count': running,
+            'sum_seconds': round(total_sum, 6),
+            'buckets': cumulative,
+            'outcomes': outcomes,
+        }
@@ -367,6 +367,16 @@ const AppContent: React.FC = () => {
     });
   }, []);
 
+  // Pushed over the assignments socket; already saved by the backend
+  const handleLiveNotification = useCallback((notif: Notification) => {
+    setNotifications(prev => prev.some(n => n.id === notif.id) ? prev : [notif, ...prev]);
+  }, []);
+
+  // Socket reconnected after missing more events than the server keeps: reload
+  const handleResyncAssignments = useCallback(() => {
+    api.getAssignments().then(setAssignments).catch(err => console.error('Assignment resync failed', err));
+  }, []);
+
   const handleUploadSubmission = useCallback(async (id: string, text: string) => {
     setIsSyncing(true);
     try {
@@ -526,7 +536,7 @@ const AppContent: React.FC = () => {
       case 'DASHBOARD':
         if (!user) return <Landing onNavigate={handleNavigate} />;
         if (user.role === 'STUDENT') return <StudentDashboard user={user} users={allUsers} assignments={assignments.filter(a => a.studentId === user.id)} messages={messages} onCreateAssignment={handleCreateAssignment} onRespondToQuote={handleRespondToQuote} onOpenChat={handleOpenChat} onDeleteAssignment={handleDeleteAssignment} onNavigate={handleNavigate} preSelectedWriterId={selectedWriterId} onUpdateStatus={handleUpdateStatus} />;
-        if (user.role === 'WRITER') return <WriterDashboard user={user} users={allUsers} assignments={assignments} messages={messages} onSubmitQuote={handleSubmitQuote} onUpdateAssignment={handleUpdateAssignment} onUploadSubmission={handleUploadSubmission} onOpenChat={handleOpenChat} onUpdateProfile={handleUpdateProfile} onRejectAssignment={handleRejectAssignment} onAddAssignment={handleAddAssignment} onWithdrawQuote={handleWithdrawQuote} addNotification={addNotification} />;
+        if (user.role === 'WRITER') return <WriterDashboard user={user} users={allUsers} assignments={assignments} messages={messages} onSubmitQuote={handleSubmitQuote} onUpdateAssignment={handleUpdateAssignment} onUploadSubmission={handleUploadSubmission} onOpenChat={handleOpenChat} onUpdateProfile={handleUpdateProfile} onRejectAssignment={handleRejectAssignment} onAddAssignment={handleAddAssignment} onWithdrawQuote={handleWithdrawQuote} addNotification={addNotification} onResyncAssignments={handleResyncAssignments} onNotification={handleLiveNotification} />;
         if (user.role === 'ADMIN') return <AdminDashboard user={user} assignments={assignments} users={allUsers} />;
         return null;
       default:
@@ -1,6 +1,6 @@
-import React, { useState, useMemo, useEffect } from 'react';
+import React, { useState, useMemo, useEffect, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
-import { User, Assignment, AssignmentStatus, ChatMessage } from '../types';
+import { User, Assignment, AssignmentStatus, ChatMessage, Notification } from '../types';
 import StatusBadge from '../components/StatusBadge';
 import { checkAssignmentQuality } from '../services/gemini';
 import { api } from '../services/api';
@@ -26,9 +26,11 @@ interface WriterDashboardProps {
   onAddAssignment: (assignment: Assignment) => void;
   onWithdrawQuote: (id: string, writerId: string) => void;
   addNotification?: (message: string) => Promise<void>;
+  onResyncAssignments?: () => void;
+  onNotification?: (notification: Notification) => void;
 }
 
-const WriterDashboard: React.FC<WriterDashboardProps> = ({ user, users = [], assignments, messages = [], onUpdateAssignment, onSubmitQuote, onUploadSubmission, onOpenChat, onUpdateProfile, onRejectAssignment, onAddAssignment, onWithdrawQuote, addNotification }) => {
+const WriterDashboard: React.FC<WriterDashboardProps> = ({ user, users = [], assignments, messages = [], onUpdateAssignment, onSubmitQuote, onUploadSubmission, onOpenChat, onUpdateProfile, onRejectAssignment, onAddAssignment, onWithdrawQuote, addNotification, onResyncAssignments, onNotification }) => {
   const [selectedAsgn, setSelectedAsgn] = useState<Assignment | null>(null);
   const [quoteData, setQuoteData] = useState<{ id: string, amount: string, comment: string } | null>(null);
   const [submissionText, setSubmissionText] = useState('');
@@ -45,67 +47,95 @@ const WriterDashboard: React.FC<WriterDashboardProps> = ({ user, users = [], ass
     sessionStorage.setItem('writer_active_tab', activeTab);
   }, [activeTab]);
 
+  // Newest event sequence number seen; a reconnect only replays what came after it
+  const lastSeqRef = useRef<number | null>(null);
+
   // WebSocket for Real-Time Assignment Locking
   useEffect(() => {
     const apiBase = import.meta.env.VITE_API_BASE_URL || `http://${window.location.hostname}:8000`;
     const wsBase = apiBase.replace(/^http/, 'ws');
-    const ws = new WebSocket(`${wsBase}/ws/assignments/`);
+    let ws: WebSocket;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let retryDelay = 1000;
+    let stopped = false;
+
+    const connect = () => {
+      const token = sessionStorage.getItem('auth_token') || '';
+      const lastSeq = lastSeqRef.current !== null ? `&last_seq=${lastSeqRef.current}` : '';
+      ws = new WebSocket(`${wsBase}/ws/assignments/?token=${encodeURIComponent(token)}${lastSeq}`);
+
+      ws.onopen = () => { retryDelay = 1000; };
+      ws.onclose = () => {
+        // Reconnect with backoff; the server replays anything missed meanwhile
+        if (stopped) return;
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
     
-    ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      if (data.type === 'assignment_accepted') {
-        const { assignment_id, writer_id } = data;
-        
-        // Remove it from other writers' view by updating status/writerId
-        if (writer_id !== user.id) {
-          onUpdateAssignment(assignment_id, { 
-            status: AssignmentStatus.ASSIGNED, 
-            writerId: writer_id 
-          });
-        }
-      } else if (data.type === 'assignment_cancelled') {
-        const { assignment_id, writer_id } = data;
-        if (writer_id === user.id) {
-          onUpdateAssignment(assignment_id, { status: AssignmentStatus.CANCELLED });
-          import('react-hot-toast').then(m => m.default.error('A student has cancelled an assignment you were working on.'));
-          if (addNotification) {
-            addNotification('Assignment Cancelled: A student has cancelled an assignment you were assigned to.');
-          }
+      ws.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (typeof data.seq === 'number') {
+          lastSeqRef.current = Math.max(lastSeqRef.current ?? 0, data.seq);
         }
-      } else if (data.type === 'assignment_created') {
-        const { assignment_id, visibility, preferredHandwritingStyles } = data;
+        if (data.type === 'resync') {
+          // Too much was missed to replay: reload the assignment list once
+          if (onResyncAssignments) onResyncAssignments();
+        } else if (data.type === 'notification') {
+          // Already stored server-side; just show it
+          if (onNotification) onNotification(data.notification);
+        } else if (data.type === 'assignment_accepted') {
+          const { assignment_id, writer_id } = data;
         
-        // Filter out if not matching
-        if (visibility === 'SELECTED_STYLES' && preferredHandwritingStyles) {
-          if (!user.handwriting_style || !preferredHandwritingStyles.includes(user.handwriting_style)) {
-            return; // Ignore this assignment
+          // Remove it from other writers' view by updating status/writerId
+          if (writer_id !== user.id) {
+            onUpdateAssignment(assignment_id, { 
+              status: AssignmentStatus.ASSIGNED, 
+              writerId: writer_id 
+            });
           }
-        }
-        
-        // Fetch and add the new assignment to state
-        api.getAssignment(assignment_id).then(newAsgn => {
-          if (newAsgn) {
-            onAddAssignment(newAsgn);
-            import('react-hot-toast').then(m => m.default.success('New matching assignment published!'));
+        } else if (data.type === 'assignment_cancelled') {
+          const { assignment_id, writer_id } = data;
+          if (writer_id === user.id) {
+            onUpdateAssignment(assignment_id, { status: AssignmentStatus.CANCELLED });
+            import('react-hot-toast').then(m => m.default.error('A student has cancelled an assignment you were working on.'));
+            if (addNotification) {
+              addNotification('Assignment Cancelled: A student has cancelled an assignment you were assigned to.');
+            }
           }
-        }).catch(err => console.error(err));
-
-      } else if (data.type === 'direct_assignment_created') {
-        const { assignment_id, writer_id } = data;
-        if (writer_id === user.id) {
+        } else if (data.type === 'assignment_created') {
+          // The server only sends assignments matching this writer's style
+          const { assignment_id } = data;
+        
+          // Fetch and add the new assignment to state
           api.getAssignment(assignment_id).then(newAsgn => {
             if (newAsgn) {
               onAddAssignment(newAsgn);
-              import('react-hot-toast').then(m => m.default.success('You received a new Direct Hire Request!'));
-              if (addNotification) addNotification('You received a new Direct Hire Request!');
+              import('react-hot-toast').then(m => m.default.success('New matching assignment published!'));
             }
           }).catch(err => console.error(err));
+
+        } else if (data.type === 'direct_assignment_created') {
+          const { assignment_id, writer_id } = data;
+          if (writer_id === user.id) {
+            api.getAssignment(assignment_id).then(newAsgn => {
+              if (newAsgn) {
+                onAddAssignment(newAsgn);
+                import('react-hot-toast').then(m => m.default.success('You received a new Direct Hire Request!'));
+                if (addNotification) addNotification('You received a new Direct Hire Request!');
+              }
+            }).catch(err => console.error(err));
+          }
         }
-      }
+      };
     };
-    
-    return () => ws.close();
-  }, [user.id, user.handwriting_style, onUpdateAssignment, onAddAssignment]);
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      ws.close();
+    };
+  }, [user.id, user.handwriting_style, onUpdateAssignment, onAddAssignment, onResyncAssignments, onNotification]);
 
   const [hasVerifiedPayment, setHasVerifiedPayment] = useState(false);
 
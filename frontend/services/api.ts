@@ -1468,10 +1468,14 @@ export const api = {
   },
 
   async createAnnouncement(data: any): Promise<any> {
+    const token = sessionStorage.getItem('auth_token') || localStorage.getItem('auth_token');
     try {
       const response = await fetch(`${BASE_URL}/api/communication/announcements/`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' }, // Needs auth in real app
+        headers: {
+          'Content-Type': 'application/json',
+          ...(token ? { 'Authorization': `Token ${token}` } : {}),
+        },
         body: JSON.stringify(data)
       });
       if (response.ok) return await response.json();